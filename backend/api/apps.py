@@ -1,6 +1,61 @@
+import os
+import sys
+
 from django.apps import AppConfig
+from django.conf import settings
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        # Enregistre les fournisseurs d'offres dans le registre
+        from . import offer_providers  # noqa: F401
+
+        # Index en mémoire et version du catalogue : mises à jour faites via l'ORM
+        from django.db.models.signals import post_delete, post_save
+        from . import catalog, geo, prices, recommender
+        from .models import Attraction, City, Destination, RoomOffer
+        post_save.connect(geo.on_city_saved, sender=City, dispatch_uid="geo.city_saved")
+        post_delete.connect(geo.on_city_deleted, sender=City, dispatch_uid="geo.city_deleted")
+        post_save.connect(prices.on_offer_saved, sender=RoomOffer, dispatch_uid="prices.offer_saved")
+        post_delete.connect(prices.on_offer_deleted, sender=RoomOffer, dispatch_uid="prices.offer_deleted")
+        for model in (City, Destination):
+            post_save.connect(catalog.on_catalog_changed, sender=model, dispatch_uid=f"catalog.{model.__name__}.saved")
+            post_delete.connect(catalog.on_catalog_changed, sender=model, dispatch_uid=f"catalog.{model.__name__}.deleted")
+        for model in (Attraction, Destination):
+            post_save.connect(recommender.on_source_changed, sender=model, dispatch_uid=f"reco.{model.__name__}.saved")
+            post_delete.connect(recommender.on_source_changed, sender=model, dispatch_uid=f"reco.{model.__name__}.deleted")
+
+        # Sonde Llama et index en mémoire en arrière-plan, uniquement dans
+        # les processus qui servent des requêtes
+        if not serving_process():
+            return
+        from . import intent_rules, llama_backend
+        llama_backend.start_prober()
+        intent_rules.start_refresher()
+        geo.start_refresher()
+        prices.start_refresher()
+        recommender.start_refresher()
+
+
+def serving_process():
+    """
+    settings.BACKGROUND_TASKS ("1"/"0"), ou en "auto" : vrai sous un serveur
+    WSGI/ASGI et sous runserver (dans le processus servi, pas dans le
+    superviseur de l'autoreload), faux pour les autres commandes manage.py.
+    """
+    mode = str(getattr(settings, "BACKGROUND_TASKS", "auto")).lower()
+    if mode != "auto":
+        return mode in ("1", "true", "yes", "on")
+    program = sys.argv[0] if sys.argv else ""
+    django_command = (
+        os.path.basename(program) in ("manage.py", "django-admin")
+        or program.endswith(os.path.join("django", "__main__.py"))
+    )
+    if not django_command:
+        return True
+    if sys.argv[1:2] != ["runserver"]:
+        return False
+    return "--noreload" in sys.argv or os.environ.get("RUN_MAIN") == "true"
@@ -0,0 +1,308 @@
+"""
+Vues asynchrones (servies par backend/asgi.py).
+
+Un seul processus ASGI peut garder des centaines de chats en vol : l'attente
+de Llama ne bloque plus un thread. Le streaming SSE nécessite lui aussi un
+serveur ASGI (uvicorn/daphne) : sous WSGI, Django consommerait le générateur
+asynchrone en entier avant de répondre.
+"""
+import asyncio
+import json
+import time
+import weakref
+from datetime import datetime
+
+import httpx
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.http import JsonResponse, StreamingHttpResponse
+from django.views.decorators.csrf import csrf_exempt
+from django.views.decorators.http import require_POST
+
+from . import background, geo, intent_cache, intent_rules, llama_backend, metrics, summaries, views
+from .models import Destination
+from .singleflight import AsyncSingleFlight
+
+# Mêmes métriques que views.llama_flight (coalesce rate global)
+llama_flight = AsyncSingleFlight("llama.coalesce")
+
+# Un client httpx (pool keep-alive) par boucle d'évènements
+_clients = weakref.WeakKeyDictionary()
+
+
+def get_async_client():
+    loop = asyncio.get_running_loop()
+    client = _clients.get(loop)
+    if client is None:
+        client = httpx.AsyncClient(
+            timeout=httpx.Timeout(
+                getattr(settings, "HTTP_READ_TIMEOUT", 30),
+                connect=getattr(settings, "HTTP_CONNECT_TIMEOUT", 3.05),
+            ),
+            limits=httpx.Limits(
+                max_connections=getattr(settings, "HTTP_POOL_MAXSIZE", 20),
+                max_keepalive_connections=getattr(settings, "HTTP_POOL_MAXSIZE", 20),
+            ),
+        )
+        _clients[loop] = client
+    return client
+
+
+def sse_event(event, data):
+    """Formate un évènement Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+
+# -----------------------------
+# APPELS LLAMA ASYNCHRONES
+# -----------------------------
+async def call_llama_api_async(prompt, max_tokens=150, cache_prefix=None, temperature=0.7):
+    """
+    Équivalent asynchrone de views.call_llama_api (/v1/complete, même fallback simulation).
+    """
+    simulation = f"[Simulation] Réponse pour: {prompt[:50]}..."
+    if not llama_backend.chat_url():
+        return simulation
+
+    # Prompts identiques en vol simultanément : une seule requête à Llama
+    key = views.llama_request_key("complete", prompt, max_tokens, cache_prefix, temperature)
+    payload = views.build_llama_payload(prompt, max_tokens, cache_prefix, temperature)
+    data = await llama_flight.do(key, lambda: post_to_llama_async("complete_url", payload))
+    return views.parse_llama_response(data) if data is not None else simulation
+
+
+async def call_llama_intent_async(user_message):
+    """Équivalent asynchrone de views.extract_intent_with_llama"""
+    if not llama_backend.chat_url():
+        return None
+    key = views.llama_request_key("intent", user_message)
+    data = await llama_flight.do(key, lambda: post_to_llama_async("intent_url", {"message": user_message}))
+    return data.get("intent") if data is not None else None
+
+
+async def post_to_llama_async(endpoint, payload, user_id=None):
+    """Équivalent asynchrone de views.post_to_llama (JSON de la réponse ou None)"""
+    with llama_backend.lease(user_id) as replica:
+        if replica is None:
+            return None
+        try:
+            response = await get_async_client().post(getattr(replica, endpoint), json=payload, timeout=60)
+            if response.status_code == 200:
+                return response.json()
+            print(f"❌ Erreur API Llama: {response.status_code} -> fallback")
+            llama_backend.report_failure(f"HTTP {response.status_code}", replica)
+        except Exception as e:
+            print(f"❌ Erreur connexion Llama: {e} -> fallback")
+            llama_backend.report_failure(type(e).__name__, replica)
+    return None
+
+
+async def analyze_travel_intent_async(user_message):
+    """
+    Équivalent asynchrone de views.analyze_travel_intent_with_llama.
+    """
+    cached = await intent_cache.alookup(user_message)
+    if cached is not None:
+        return cached
+
+    # Hors de la boucle ; connexion éventuelle rendue au pool à la fin
+    rule_intent, confidence = await sync_to_async(
+        background.releasing_connections(intent_rules.score_intent), thread_sensitive=False
+    )(user_message)
+    if confidence >= intent_rules.threshold():
+        metrics.incr("intent.path.rules")
+        intent_rules.maybe_shadow(user_message, rule_intent, views.extract_intent_with_llama)
+        return rule_intent
+
+    metrics.incr("intent.path.llm")
+    started = time.monotonic()
+    obj = await call_llama_intent_async(user_message)
+    metrics.observe("intent.llm", time.monotonic() - started)
+    if obj is not None:
+        await intent_cache.astore(user_message, obj)
+        return obj
+    return rule_intent
+
+
+async def stream_llama_tokens(prompt):
+    """
+    Relaie les tokens émis par le serveur Llama (/v1/complete en streaming).
+    Lève une exception si le serveur est injoignable.
+    """
+    with llama_backend.lease() as replica:
+        if replica is None:
+            raise RuntimeError("Serveur Llama indisponible")
+        payload = views.build_llama_payload(prompt, stream=True)
+
+        try:
+            async with get_async_client().stream("POST", replica.complete_url, json=payload, timeout=60) as response:
+                response.raise_for_status()
+                event = None
+                async for line in response.aiter_lines():
+                    if line.startswith("event:"):
+                        event = line[len("event:"):].strip()
+                    elif line.startswith("data:") and event == "token":
+                        data = json.loads(line[len("data:"):].strip())
+                        yield data.get("text", "")
+                    elif line.startswith("data:") and event == "error":
+                        raise RuntimeError(line[len("data:"):].strip())
+        except httpx.HTTPError as e:
+            llama_backend.report_failure(type(e).__name__, replica)
+            raise
+
+
+async def find_destinations_db(destination, limit=5):
+    """Destinations en base pour la ville demandée"""
+    if not destination:
+        return []
+    try:
+        qs = Destination.objects.select_related("city").filter(city__name__iexact=destination)
+        qs = qs.order_by("-popularity_score")[:limit]
+        return [{"id": d.id, "title": d.title, "city": d.city.name} async for d in qs]
+    except Exception as e:
+        print(f"⚠️ Erreur destinations en base: {e}")
+        return []
+
+
+# Offres (cache, fournisseurs, index de prix) via asyncio.to_thread : la
+# connexion éventuellement ouverte dans le thread est rendue au pool
+scrape_offers_in_thread = background.releasing_connections(views.scrape_real_travel_offers)
+
+
+def parse_body(request):
+    """Corps JSON de la requête (None si invalide) et message nettoyé"""
+    try:
+        data = json.loads(request.body or b"{}")
+    except ValueError:
+        return None, None
+    return data, (data.get("message") or "").strip()
+
+
+# -----------------------------
+# ENDPOINT PRINCIPAL (ASYNC)
+# -----------------------------
+@csrf_exempt
+@require_POST
+async def intelligent_travel_chat_async(request):
+    """
+    Version asynchrone de intelligent_travel_chat : après l'intention, la collecte
+    des offres, la recherche en base et le résumé Llama tournent en parallèle.
+    """
+    data, user_message = parse_body(request)
+    if data is None:
+        return JsonResponse({"error": "JSON invalide"}, status=400)
+    if not user_message:
+        return JsonResponse({"error": "Message vide"}, status=400)
+
+    try:
+        print(f"📨 Message (async): {user_message}")
+        travel_intent = await analyze_travel_intent_async(user_message)
+        destination, budget, duree, personnes = views.normalize_travel_intent(travel_intent)
+
+        mode = views.llm_summary_mode(data.get("llm_summary"))
+        use_llama = mode != "off" and not views.FREE_MODE and llama_backend.chat_url()
+        summary = None
+        summary_id = None
+        if use_llama:
+            prompt = views.build_summary_prompt(user_message, destination, budget, duree, personnes)
+            if mode == "sync":
+                summary = call_llama_api_async(prompt)
+            else:
+                summary_id = summaries.start(lambda: views.generate_llm_summary(prompt))
+
+        annonces, destinations_db, ai_response = await asyncio.gather(
+            asyncio.to_thread(scrape_offers_in_thread, destination, budget, personnes=personnes, duree=duree),
+            find_destinations_db(destination),
+            summary if summary is not None else asyncio.sleep(0, result=None),
+        )
+
+        if not isinstance(ai_response, str) or ai_response.startswith("[Simulation]"):
+            ai_response = views.build_template_response(
+                destination, budget, duree, personnes, len(annonces), seed=user_message
+            )
+
+        return JsonResponse({
+            "ai_response": ai_response,
+            "summary_id": summary_id,
+            "annonces": annonces,
+            "destinations_db": destinations_db,
+            "detected_preferences": views.build_detected_preferences(travel_intent, destination, budget, duree, personnes),
+            "travel_intent": travel_intent,
+            "nearby_alternatives": geo.nearby_alternatives(destination),
+            "search_metadata": {
+                "destination": destination,
+                "budget": budget,
+                "results_count": len(annonces),
+                "llama_used": llama_backend.chat_url() is not None,
+                "timestamp": datetime.now().isoformat()
+            }
+        })
+    except Exception as e:
+        print(f"❌ Erreur endpoint async: {e}")
+        return JsonResponse({
+            "ai_response": f"Désolé, une erreur s'est produite lors du traitement de votre demande. {str(e)}",
+            "annonces": views.generate_fallback_offers("Tunis", 100),
+            "error": str(e),
+            "detected_preferences": {},
+            "travel_intent": {},
+        }, status=500)
+
+
+# -----------------------------
+# CHAT EN STREAMING (SSE)
+# -----------------------------
+@csrf_exempt
+@require_POST
+async def intelligent_travel_chat_stream(request):
+    """
+    Variante streaming de intelligent_travel_chat.
+    1er évènement "meta" : annonces, préférences détectées et réponse gabarit,
+    puis les tokens de la réponse ("token"), puis "done". Les tokens sont ceux
+    du résumé Llama si llm_summary le demande (ou settings.LLM_SUMMARY_MODE),
+    sinon le gabarit en un seul évènement.
+    """
+    data, user_message = parse_body(request)
+    if data is None:
+        return JsonResponse({"error": "JSON invalide"}, status=400)
+    if not user_message:
+        return JsonResponse({"error": "Message vide"}, status=400)
+
+    print(f"📨 Message (stream): {user_message}")
+    travel_intent = await analyze_travel_intent_async(user_message)
+    destination, budget, duree, personnes = views.normalize_travel_intent(travel_intent)
+    annonces = await asyncio.to_thread(scrape_offers_in_thread, destination, budget, personnes=personnes, duree=duree)
+
+    fallback = views.build_template_response(destination, budget, duree, personnes, len(annonces), seed=user_message)
+    mode = views.llm_summary_mode(data.get("llm_summary"))
+
+    async def events():
+        yield sse_event("meta", {
+            "annonces": annonces,
+            "detected_preferences": views.build_detected_preferences(travel_intent, destination, budget, duree, personnes),
+            "travel_intent": travel_intent,
+            "nearby_alternatives": geo.nearby_alternatives(destination),
+            "ai_response": fallback,
+        })
+
+        if mode == "off" or views.FREE_MODE or not llama_backend.chat_url():
+            yield sse_event("token", {"text": fallback})
+            yield sse_event("done", {"ai_response": fallback})
+            return
+
+        prompt = views.build_summary_prompt(user_message, destination, budget, duree, personnes, len(annonces))
+        parts = []
+        try:
+            async for token in stream_llama_tokens(prompt):
+                parts.append(token)
+                yield sse_event("token", {"text": token})
+        except Exception as e:
+            print(f"❌ Erreur stream Llama: {e} -> fallback template")
+            if not parts:
+                parts.append(fallback)
+                yield sse_event("token", {"text": fallback})
+        yield sse_event("done", {"ai_response": "".join(parts).strip()})
+
+    response = StreamingHttpResponse(events(), content_type="text/event-stream")
+    response["Cache-Control"] = "no-cache"
+    response["X-Accel-Buffering"] = "no"
+    return response
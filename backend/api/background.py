@@ -0,0 +1,61 @@
+"""
+Tâches périodiques en arrière-plan pour les index en mémoire.
+
+Chaque index construit depuis une table (géographie, recommandations...)
+enregistre sa fonction de rafraîchissement ici : un thread par tâche,
+premier passage immédiat, puis toutes les `interval` secondes.
+
+Hors du cycle requête, Django ne ferme jamais les connexions du thread :
+tout code ORM lancé dans un thread (tâches, to_thread, sync_to_async non
+thread-sensitive, pools de threads) passe par releasing_connections pour
+rendre sa connexion au pool MySQL (api.mysql_pool) une fois terminé.
+"""
+import functools
+import threading
+import time
+
+from django.db import connections
+from django.db.models import Count, Max
+
+_started = set()
+_lock = threading.Lock()
+
+
+def every(name, interval, fn):
+    """
+    Lance fn() maintenant puis toutes les interval() secondes (idempotent par nom).
+    interval: fonction, relue à chaque tour (réglage modifiable à chaud)
+    """
+    with _lock:
+        if name in _started:
+            return
+        _started.add(name)
+
+    def loop():
+        while True:
+            try:
+                fn()
+            except Exception as e:
+                print(f"⚠️ Tâche {name} échouée: {e}")
+            finally:
+                connections.close_all()
+            time.sleep(interval())
+
+    threading.Thread(target=loop, name=name, daemon=True).start()
+
+
+def releasing_connections(fn):
+    """Enveloppe fn pour fermer (rendre au pool) les connexions du thread après l'appel"""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            connections.close_all()
+    return wrapper
+
+
+def table_version(queryset):
+    """(nombre de lignes, plus grand id) : détecte les ajouts et suppressions"""
+    agg = queryset.aggregate(count=Count("pk"), max_id=Max("pk"))
+    return agg["count"], agg["max_id"] or 0
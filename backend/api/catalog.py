@@ -0,0 +1,288 @@
+"""
+Liste des destinations optimisée pour la lecture.
+
+Une page = une seule requête : jointure destinations -> cities, uniquement
+les colonnes affichées (values()), tri popularity_score DESC, id DESC et
+pagination par curseur (keyset) au lieu d'OFFSET. Le curseur encode
+(score, id) de la dernière ligne ; la page suivante repart de là via
+l'index, quelle que soit sa profondeur dans le catalogue.
+
+Validateurs HTTP (ETag, Last-Modified) : dérivés de la version du catalogue
+(CatalogVersion), sans lire la page, pour qu'un 304 n'exécute pas la requête.
+
+Colonnes et index attendus (tables non gérées par Django, à créer côté MySQL) :
+    ALTER TABLE destinations ADD COLUMN updated_at TIMESTAMP(6) NOT NULL
+        DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
+    ALTER TABLE cities ADD COLUMN updated_at TIMESTAMP(6) NOT NULL
+        DEFAULT CURRENT_TIMESTAMP(6) ON UPDATE CURRENT_TIMESTAMP(6);
+    CREATE INDEX idx_destinations_updated ON destinations (updated_at);
+    CREATE INDEX idx_cities_updated ON cities (updated_at);
+    CREATE INDEX idx_destinations_popularity ON destinations (popularity_score, id);
+    CREATE INDEX idx_destinations_city_popularity ON destinations (city_id, popularity_score, id);
+    CREATE INDEX idx_destinations_price_popularity ON destinations (avg_price_level, popularity_score, id);
+"""
+import base64
+import hashlib
+import json
+import threading
+import time
+from decimal import Decimal, InvalidOperation
+
+from django.conf import settings
+from django.db.models import Count, Max, Q
+
+from . import geo
+from .models import City, Destination
+
+DEFAULT_LIMIT = 20
+MAX_LIMIT = 100
+DEFAULT_RADIUS_KM = 100
+MAX_RADIUS_KM = 2000
+# Villes candidates max pour une recherche de proximité
+MAX_NEARBY_CITIES = 200
+
+COLUMNS = (
+    "id", "title", "description", "avg_price_level",
+    "popularity_score", "image_url", "city_id", "city__name",
+)
+
+
+class InvalidQuery(ValueError):
+    """Paramètre de liste invalide (-> 400)"""
+
+
+def encode_cursor(score, destination_id):
+    raw = json.dumps([None if score is None else str(score), destination_id])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor):
+    """(score Decimal ou None, id) à partir du curseur opaque"""
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        score, destination_id = json.loads(base64.urlsafe_b64decode(padded))
+        return (None if score is None else Decimal(score)), int(destination_id)
+    except (ValueError, TypeError, InvalidOperation):
+        raise InvalidQuery("Curseur invalide")
+
+
+def _int_param(params, name):
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return int(value)
+    except ValueError:
+        raise InvalidQuery(f"{name} doit être un entier")
+
+
+def _float_param(params, name):
+    value = params.get(name)
+    if value in (None, ""):
+        return None
+    try:
+        return float(value)
+    except ValueError:
+        raise InvalidQuery(f"{name} doit être un nombre")
+
+
+def _after(score, destination_id):
+    """
+    Lignes situées après (score, id) dans l'ordre score DESC, id DESC.
+    MySQL place les NULL en dernier en tri décroissant : après un score
+    non NULL viennent les scores plus faibles puis tous les NULL.
+    """
+    if score is None:
+        return Q(popularity_score__isnull=True, id__lt=destination_id)
+    return (
+        Q(popularity_score__lt=score)
+        | Q(popularity_score=score, id__lt=destination_id)
+        | Q(popularity_score__isnull=True)
+    )
+
+
+def _item(row):
+    """Ligne values() -> forme attendue par DestinationSerializer"""
+    return {
+        "id": row["id"],
+        "title": row["title"],
+        "description": row["description"],
+        "avg_price_level": row["avg_price_level"],
+        "popularity_score": row["popularity_score"],
+        "image_url": row["image_url"],
+        "city": {"id": row["city_id"], "name": row["city__name"]},
+    }
+
+
+def list_destinations(params):
+    """
+    Page de destinations à partir des paramètres de requête.
+
+    params: limit, cursor, price_level, min_price_level, max_price_level,
+            city_id, city (nom)
+    Retourne (lignes prêtes pour DestinationSerializer, curseur suivant ou None).
+    """
+    limit = _int_param(params, "limit") or DEFAULT_LIMIT
+    limit = max(1, min(limit, MAX_LIMIT))
+
+    qs = Destination.objects.all()
+
+    price_level = _int_param(params, "price_level")
+    if price_level is not None:
+        qs = qs.filter(avg_price_level=price_level)
+    min_price = _int_param(params, "min_price_level")
+    if min_price is not None:
+        qs = qs.filter(avg_price_level__gte=min_price)
+    max_price = _int_param(params, "max_price_level")
+    if max_price is not None:
+        qs = qs.filter(avg_price_level__lte=max_price)
+
+    city_id = _int_param(params, "city_id")
+    if city_id is not None:
+        qs = qs.filter(city_id=city_id)
+    city_name = (params.get("city") or "").strip()
+    if city_name:
+        qs = qs.filter(city__name=city_name)
+
+    cursor = params.get("cursor")
+    if cursor:
+        qs = qs.filter(_after(*decode_cursor(cursor)))
+
+    # Une ligne de plus pour savoir s'il existe une page suivante
+    rows = list(qs.order_by("-popularity_score", "-id").values(*COLUMNS)[:limit + 1])
+    has_more = len(rows) > limit
+    rows = rows[:limit]
+
+    items = [_item(row) for row in rows]
+    next_cursor = encode_cursor(rows[-1]["popularity_score"], rows[-1]["id"]) if has_more else None
+    return items, next_cursor
+
+
+def destinations_near(city_distances, limit=DEFAULT_LIMIT):
+    """
+    Destinations des villes données, de la plus proche à la plus lointaine
+    (puis par popularité). city_distances: [(city_id, distance_km)] de geo.
+    Une requête : WHERE city_id IN (...).
+    """
+    distances = dict(city_distances)
+    if not distances:
+        return []
+    rows = Destination.objects.filter(city_id__in=list(distances)).values(*COLUMNS)
+    items = [dict(_item(row), distance_km=distances[row["city_id"]]) for row in rows]
+    items.sort(key=lambda item: (item["distance_km"], -(item["popularity_score"] or 0), -item["id"]))
+    return items[:limit]
+
+
+def nearby_destinations(params):
+    """
+    Destinations autour d'un point (lat, lng) ou d'une ville (city).
+
+    params: lat, lng | city, radius_km (100, max 2000), limit
+    Retourne (origine, destinations avec distance_km).
+    """
+    limit = max(1, min(_int_param(params, "limit") or DEFAULT_LIMIT, MAX_LIMIT))
+    radius_km = _float_param(params, "radius_km") or DEFAULT_RADIUS_KM
+    radius_km = max(0.0, min(radius_km, MAX_RADIUS_KM))
+
+    geo.ensure_ready()
+    lat, lng = _float_param(params, "lat"), _float_param(params, "lng")
+    city_name = (params.get("city") or "").strip()
+    if lat is not None and lng is not None:
+        if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+            raise InvalidQuery("lat/lng hors limites")
+        origin = {"lat": lat, "lng": lng}
+    elif city_name:
+        located = geo.index.locate(city_name)
+        if located is None:
+            raise InvalidQuery(f"Ville inconnue ou sans coordonnées: {city_name}")
+        city_id, lat, lng = located
+        origin = {"city_id": city_id, "city": geo.index.name(city_id), "lat": lat, "lng": lng}
+    else:
+        raise InvalidQuery("Paramètres lat et lng, ou city, requis")
+
+    cities = geo.index.within(lat, lng, radius_km, limit=MAX_NEARBY_CITIES)
+    return origin, destinations_near(cities, limit)
+
+
+def destinations_by_ids(ids):
+    """Destinations dans l'ordre des ids donnés (une requête)"""
+    rows = {row["id"]: row for row in Destination.objects.filter(id__in=list(ids)).values(*COLUMNS)}
+    return [_item(rows[i]) for i in ids if i in rows]
+
+
+# -----------------------------
+# VERSION DU CATALOGUE
+# -----------------------------
+class CatalogVersion:
+    """
+    Version du catalogue pour les validateurs HTTP, obtenue sans lire de page.
+
+    Lue en base, donc identique dans tous les workers : nombre de destinations
+    et plus grands updated_at de destinations et cities (colonnes ON UPDATE
+    tenues par MySQL, y compris pour les écritures hors ORM ; deux requêtes
+    d'agrégat servies par les index). Relue au plus toutes les
+    CATALOG_VERSION_TTL secondes ; les signaux de l'ORM forcent la relecture
+    dans ce processus.
+
+    changed_at (Last-Modified) : plus grand updated_at. Une suppression ne le
+    fait pas avancer (seul le nombre change) : on prend alors l'instant où ce
+    processus l'a vue, pour ne jamais répondre 304 à un If-Modified-Since
+    antérieur. L'ETag reste le validateur exact.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = None
+        self._checked_at = None
+        self._invalidations = 0
+        self.changed_at = None
+
+    def invalidate(self):
+        """Écriture vue par un signal : état à relire à la prochaine requête"""
+        with self._lock:
+            self._checked_at = None
+            self._invalidations += 1
+
+    def _read_state(self):
+        """(nombre de destinations, updated_at max des destinations, updated_at max des villes)"""
+        destinations = Destination.objects.aggregate(count=Count("pk"), updated_at=Max("updated_at"))
+        cities = City.objects.aggregate(updated_at=Max("updated_at"))
+        return (destinations["count"], destinations["updated_at"], cities["updated_at"])
+
+    def current(self):
+        """(version, changed_at)"""
+        ttl = getattr(settings, "CATALOG_VERSION_TTL", 5)
+        now = time.monotonic()
+        with self._lock:
+            if self._checked_at is not None and now - self._checked_at < ttl:
+                return self._state, self.changed_at
+            invalidations = self._invalidations
+        state = self._read_state()
+        with self._lock:
+            if state != self._state:
+                changed_at = max((t.timestamp() for t in state[1:] if t is not None), default=0)
+                if self._state is not None and state[0] != self._state[0]:
+                    changed_at = max(changed_at, time.time())
+                self._state, self.changed_at = state, max(changed_at, self.changed_at or 0)
+            # Signal reçu pendant la lecture : l'état lu peut le précéder
+            if invalidations == self._invalidations:
+                self._checked_at = now
+            return self._state, self.changed_at
+
+
+version = CatalogVersion()
+
+
+def on_catalog_changed(sender, **kwargs):
+    version.invalidate()
+
+
+def list_validators(params):
+    """
+    (ETag, Last-Modified epoch) d'une page de list_destinations, sans la lire :
+    version du catalogue + paramètres de la requête.
+    """
+    current, changed_at = version.current()
+    query = sorted((key, values) for key, values in params.lists())
+    raw = json.dumps([current, query], default=str, separators=(",", ":"))
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest(), changed_at
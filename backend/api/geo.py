@@ -0,0 +1,343 @@
+"""
+Index géographique des villes (cities.lat / cities.lng) en mémoire.
+
+Les villes sont rangées dans une grille de cellules de GEO_CELL_DEG degrés,
+triées par numéro de cellule : une recherche "dans un rayon de N km" ne lit
+que les tranches de cellules qui recouvrent le cercle (une recherche binaire
+par ligne de la grille), puis filtre les candidats par distance haversine
+calculée d'un bloc avec NumPy. Les k plus proches élargissent le rayon
+jusqu'à en avoir assez.
+
+Mises à jour incrémentales : une ville ajoutée ou modifiée (signal Django ou
+nouvelles lignes détectées par le rafraîchissement périodique) va dans un
+petit delta parcouru en entier ; l'ancienne position est masquée. Au-delà de
+GEO_DELTA_MAX villes, le delta est fusionné dans une nouvelle grille.
+Les modifications faites hors Django sont reprises par la reconstruction
+complète (GEO_FULL_REBUILD_INTERVAL).
+"""
+import math
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+
+from gazetteer import fold
+
+from . import background, metrics
+from .models import City
+
+EARTH_RADIUS_KM = 6371.0088
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def haversine_km(lat, lng, lats, lngs, cos_lats):
+    """Distances (km) d'un point vers des tableaux de points, en radians"""
+    a = np.sin((lats - lat) / 2) ** 2 + math.cos(lat) * cos_lats * np.sin((lngs - lng) / 2) ** 2
+    return 2 * EARTH_RADIUS_KM * np.arcsin(np.sqrt(np.clip(a, 0.0, 1.0)))
+
+
+class CityGrid:
+    """Grille figée : tableaux NumPy triés par cellule"""
+
+    def __init__(self, ids, lats_deg, lngs_deg, cell_deg):
+        self.cell_deg = cell_deg
+        self.n_rows = int(math.ceil(180 / cell_deg))
+        self.n_cols = int(math.ceil(360 / cell_deg))
+
+        ids = np.asarray(ids, dtype=np.int64)
+        lats_deg = np.asarray(lats_deg, dtype=np.float64)
+        lngs_deg = np.asarray(lngs_deg, dtype=np.float64)
+        cells = self._row(lats_deg) * self.n_cols + self._col(lngs_deg)
+        order = np.argsort(cells, kind="stable")
+
+        self.cells = cells[order]
+        self.ids = ids[order]
+        self.lats = np.radians(lats_deg[order])
+        self.lngs = np.radians(lngs_deg[order])
+        self.cos_lats = np.cos(self.lats)
+        # id -> ligne, pour locate() sans parcourir la grille
+        self.row_of = {city_id: row for row, city_id in enumerate(self.ids.tolist())}
+
+    def __len__(self):
+        return len(self.ids)
+
+    def _row(self, lat_deg):
+        return np.clip(np.floor((lat_deg + 90) / self.cell_deg), 0, self.n_rows - 1).astype(np.int64)
+
+    def _col(self, lng_deg):
+        return np.floor((lng_deg + 180) / self.cell_deg).astype(np.int64) % self.n_cols
+
+    def candidates(self, lat_deg, lng_deg, radius_km):
+        """Indices des points des cellules qui recouvrent le cercle"""
+        angle = radius_km / EARTH_RADIUS_KM
+        if angle >= math.pi / 2:
+            return np.arange(len(self.ids))
+
+        dlat = math.degrees(angle)
+        row_lo = int(self._row(np.float64(lat_deg - dlat)))
+        row_hi = int(self._row(np.float64(lat_deg + dlat)))
+        rows = np.arange(row_lo, row_hi + 1)
+
+        # Cercle touchant un pôle : toutes les longitudes
+        ratio = math.sin(angle) / max(math.cos(math.radians(lat_deg)), 1e-12)
+        if lat_deg + dlat >= 90 or lat_deg - dlat <= -90 or ratio >= 1:
+            starts, ends = rows * self.n_cols, rows * self.n_cols + self.n_cols - 1
+        else:
+            dlng = math.degrees(math.asin(ratio))
+            col_lo = int(self._col(np.float64(lng_deg - dlng)))
+            col_hi = int(self._col(np.float64(lng_deg + dlng)))
+            if col_lo <= col_hi:
+                starts, ends = rows * self.n_cols + col_lo, rows * self.n_cols + col_hi
+            else:
+                # Passage de l'antiméridien : deux tranches par ligne
+                starts = np.concatenate([rows * self.n_cols + col_lo, rows * self.n_cols])
+                ends = np.concatenate([rows * self.n_cols + self.n_cols - 1, rows * self.n_cols + col_hi])
+
+        lo = np.searchsorted(self.cells, starts, side="left")
+        hi = np.searchsorted(self.cells, ends, side="right")
+        slices = [np.arange(a, b) for a, b in zip(lo, hi) if b > a]
+        return np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+
+
+class GeoIndex:
+    """
+    Grille + delta des villes modifiées depuis sa construction.
+    Les lectures prennent l'état courant (tuple remplacé d'un bloc) sans verrou.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._grid = None
+        self._delta = {}  # id -> (lat, lng) ou None si supprimée
+        self._state = None  # (grille, ids, lats, lngs, cos_lats du delta, ids masqués)
+        self._names = {}  # id -> nom
+        self._by_name = {}  # nom replié -> id
+        self._version = None
+        self._built_at = 0.0
+        self.full_builds = 0
+        self.incremental_updates = 0
+        self.merges = 0
+
+    @property
+    def ready(self):
+        return self._state is not None
+
+    # -- construction -------------------------------------------------------
+
+    def _queryset(self):
+        return City.objects.filter(lat__isnull=False, lng__isnull=False)
+
+    def rebuild(self):
+        """Reconstruction complète depuis la table cities"""
+        started = time.perf_counter()
+        version = background.table_version(City.objects.all())
+        ids, lats, lngs, names = [], [], [], {}
+        for city_id, name, lat, lng in self._queryset().values_list("id", "name", "lat", "lng").iterator(chunk_size=5000):
+            ids.append(city_id)
+            lats.append(float(lat))
+            lngs.append(float(lng))
+            names[city_id] = name
+        grid = CityGrid(ids, lats, lngs, _setting("GEO_CELL_DEG", 1.0))
+        with self._lock:
+            self._grid = grid
+            self._delta = {}
+            self._names = names
+            self._by_name = {fold(name).strip(): city_id for city_id, name in reversed(list(names.items()))}
+            self._version = version
+            self._built_at = time.time()
+            self._publish()
+            self.full_builds += 1
+        metrics.observe("geo.rebuild", time.perf_counter() - started)
+        print(f"🗺️ Index géographique: {len(grid)} villes")
+
+    def refresh(self):
+        """
+        Rafraîchissement périodique : rien si la table n'a pas bougé, chargement
+        des seules nouvelles lignes si elle n'a fait que grandir, sinon
+        reconstruction complète (de même après GEO_FULL_REBUILD_INTERVAL).
+        """
+        if self._version is None or time.time() - self._built_at > _setting("GEO_FULL_REBUILD_INTERVAL", 3600):
+            self.rebuild()
+            return
+        count, max_id = background.table_version(City.objects.all())
+        known_count, known_max = self._version
+        if (count, max_id) == (known_count, known_max):
+            return
+        added = list(City.objects.filter(id__gt=known_max).values_list("id", "name", "lat", "lng"))
+        if count - known_count != len(added):
+            # Suppressions ou modifications d'ids : on repart de la table
+            self.rebuild()
+            return
+        for city_id, name, lat, lng in added:
+            self.upsert(city_id, name, lat, lng)
+        with self._lock:
+            self._version = (count, max_id)
+
+    def upsert(self, city_id, name, lat, lng):
+        """Ajoute ou déplace une ville (lat/lng None : retirée de l'index)"""
+        with self._lock:
+            if self._grid is None:
+                return
+            old_name = self._names.get(city_id)
+            if old_name is not None and self._by_name.get(fold(old_name).strip()) == city_id:
+                del self._by_name[fold(old_name).strip()]
+            if lat is None or lng is None:
+                self._names.pop(city_id, None)
+                self._delta[city_id] = None
+            else:
+                self._names[city_id] = name
+                self._by_name.setdefault(fold(name).strip(), city_id)
+                self._delta[city_id] = (float(lat), float(lng))
+            self.incremental_updates += 1
+            self._publish()
+
+    def remove(self, city_id):
+        self.upsert(city_id, None, None, None)
+
+    def _publish(self):
+        """Recalcule l'état lu par les recherches (verrou tenu)"""
+        if len(self._delta) > _setting("GEO_DELTA_MAX", 512):
+            self._merge()
+        points = [(city_id, p[0], p[1]) for city_id, p in self._delta.items() if p is not None]
+        ids = np.array([p[0] for p in points], dtype=np.int64)
+        lats = np.radians(np.array([p[1] for p in points], dtype=np.float64))
+        lngs = np.radians(np.array([p[2] for p in points], dtype=np.float64))
+        masked = np.array(sorted(self._delta), dtype=np.int64)
+        self._state = (self._grid, ids, lats, lngs, np.cos(lats), masked)
+
+    def _merge(self):
+        """Fusionne le delta dans une nouvelle grille, sans relire la base"""
+        grid = self._grid
+        keep = ~np.isin(grid.ids, np.fromiter(self._delta, dtype=np.int64))
+        moved = [(city_id, p) for city_id, p in self._delta.items() if p is not None]
+        self._grid = CityGrid(
+            np.concatenate([grid.ids[keep], [city_id for city_id, _ in moved]]),
+            np.concatenate([np.degrees(grid.lats[keep]), [p[0] for _, p in moved]]),
+            np.concatenate([np.degrees(grid.lngs[keep]), [p[1] for _, p in moved]]),
+            grid.cell_deg,
+        )
+        self._delta = {}
+        self.merges += 1
+
+    # -- recherches ---------------------------------------------------------
+
+    def within(self, lat, lng, radius_km, limit=None):
+        """[(city_id, distance_km)] dans le rayon, du plus proche au plus lointain"""
+        state = self._state
+        if state is None:
+            return []
+        grid, d_ids, d_lats, d_lngs, d_cos, masked = state
+        lat_r, lng_r = math.radians(lat), math.radians(lng)
+
+        idx = grid.candidates(lat, lng, radius_km)
+        ids = grid.ids[idx]
+        dist = haversine_km(lat_r, lng_r, grid.lats[idx], grid.lngs[idx], grid.cos_lats[idx])
+        if masked.size:
+            visible = ~np.isin(ids, masked)
+            ids, dist = ids[visible], dist[visible]
+        if d_ids.size:
+            ids = np.concatenate([ids, d_ids])
+            dist = np.concatenate([dist, haversine_km(lat_r, lng_r, d_lats, d_lngs, d_cos)])
+
+        inside = dist <= radius_km
+        ids, dist = ids[inside], dist[inside]
+        if limit is not None and limit < len(ids):
+            part = np.argpartition(dist, limit - 1)[:limit]
+            ids, dist = ids[part], dist[part]
+        order = np.argsort(dist, kind="stable")
+        return [(int(i), round(float(d), 1)) for i, d in zip(ids[order], dist[order])]
+
+    def nearest(self, lat, lng, k=10, max_km=None):
+        """k villes les plus proches (rayon élargi par doublement)"""
+        max_km = max_km or math.pi * EARTH_RADIUS_KM
+        radius = min(_setting("GEO_NEAREST_START_KM", 50.0), max_km)
+        while True:
+            found = self.within(lat, lng, radius, limit=k)
+            if len(found) >= k or radius >= max_km:
+                return found
+            radius = min(radius * 2, max_km)
+
+    def locate(self, name):
+        """(city_id, lat, lng) d'une ville par son nom (casse et accents ignorés)"""
+        state = self._state
+        city_id = self._by_name.get(fold(name or "").strip())
+        if state is None or city_id is None:
+            return None
+        grid, d_ids, d_lats, d_lngs, _, masked = state
+        # Delta : au plus GEO_DELTA_MAX villes
+        hit = np.flatnonzero(d_ids == city_id)
+        if hit.size:
+            return city_id, math.degrees(d_lats[hit[0]]), math.degrees(d_lngs[hit[0]])
+        if city_id in masked:
+            return None
+        row = grid.row_of.get(city_id)
+        if row is None:
+            return None
+        return city_id, math.degrees(grid.lats[row]), math.degrees(grid.lngs[row])
+
+    def name(self, city_id):
+        return self._names.get(city_id)
+
+    def stats(self):
+        state = self._state
+        return {
+            "ready": state is not None,
+            "grid_cities": len(state[0]) if state else 0,
+            "delta_cities": len(state[1]) if state else 0,
+            "masked": len(state[5]) if state else 0,
+            "full_builds": self.full_builds,
+            "incremental_updates": self.incremental_updates,
+            "merges": self.merges,
+        }
+
+
+index = GeoIndex()
+_build_lock = threading.Lock()
+
+
+def ensure_ready():
+    """Construit l'index au premier besoin si le thread de fond ne l'a pas encore fait"""
+    if not index.ready:
+        with _build_lock:
+            if not index.ready:
+                index.rebuild()
+
+
+def start_refresher():
+    background.every("geo-refresh", lambda: _setting("GEO_REFRESH_INTERVAL", 60), _refresh)
+
+
+def _refresh():
+    with _build_lock:
+        index.refresh()
+
+
+def on_city_saved(sender, instance, **kwargs):
+    index.upsert(instance.id, instance.name, instance.lat, instance.lng)
+
+
+def on_city_deleted(sender, instance, **kwargs):
+    index.remove(instance.id)
+
+
+def nearby_alternatives(destination, radius_km=None, limit=None):
+    """
+    Villes proches d'une destination pour proposer des alternatives
+    (Hammamet -> Nabeul, Sousse...). [] si la ville est inconnue ou l'index pas prêt.
+    """
+    located = index.locate(destination)
+    if located is None:
+        return []
+    city_id, lat, lng = located
+    radius_km = radius_km or _setting("GEO_ALTERNATIVES_KM", 150)
+    limit = limit or _setting("GEO_ALTERNATIVES_LIMIT", 3)
+    found = index.within(lat, lng, radius_km, limit=limit + 1)
+    return [
+        {"city_id": other_id, "city": index.name(other_id), "distance_km": distance}
+        for other_id, distance in found
+        if other_id != city_id
+    ][:limit]
@@ -0,0 +1,109 @@
+"""
+Client HTTP partagé pour tous les appels sortants (Llama, scraping).
+
+Les connexions sont gardées ouvertes (keep-alive) dans des pools urllib3
+partagés par tous les threads ; chaque thread a sa propre Session requests
+(cookies / en-têtes) montée sur ces mêmes pools. Les appels idempotents
+(GET/HEAD) sont rejoués avec backoff sur erreur réseau ou 502/503/504.
+"""
+import threading
+
+import requests
+from django.conf import settings
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+_local = threading.local()
+_adapters_lock = threading.Lock()
+_adapters = None
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+def _build_adapter(maxsize, block):
+    retry = Retry(
+        total=_setting("HTTP_RETRIES", 2),
+        backoff_factor=_setting("HTTP_BACKOFF", 0.3),
+        status_forcelist=(502, 503, 504),
+        allowed_methods=frozenset(["GET", "HEAD"]),
+        respect_retry_after_header=True,
+        raise_on_status=False,
+    )
+    return HTTPAdapter(
+        pool_connections=_setting("HTTP_POOL_HOSTS", 10),
+        pool_maxsize=maxsize,
+        pool_block=block,
+        max_retries=retry,
+    )
+
+
+def _get_adapters():
+    """
+    Adapters partagés : un par défaut (http/https) + un par hôte limité
+    (settings.HTTP_HOST_LIMITS = {"http://127.0.0.1:8000": 8}), bloquant
+    au-delà de la limite au lieu d'ouvrir de nouvelles connexions.
+    """
+    global _adapters
+    if _adapters is None:
+        with _adapters_lock:
+            if _adapters is None:
+                default = _build_adapter(_setting("HTTP_POOL_MAXSIZE", 20), block=False)
+                adapters = {"http://": default, "https://": default}
+                for prefix, limit in _setting("HTTP_HOST_LIMITS", {}).items():
+                    adapters[prefix] = _build_adapter(limit, block=True)
+                _adapters = adapters
+    return _adapters
+
+
+def session():
+    """Session requests du thread courant, montée sur les pools partagés"""
+    s = getattr(_local, "session", None)
+    if s is None:
+        s = requests.Session()
+        for prefix, adapter in _get_adapters().items():
+            s.mount(prefix, adapter)
+        _local.session = s
+    return s
+
+
+def default_timeout(read=None):
+    """Timeout (connexion, lecture) ; read remplace la lecture par défaut"""
+    return (
+        _setting("HTTP_CONNECT_TIMEOUT", 3.05),
+        read if read is not None else _setting("HTTP_READ_TIMEOUT", 30),
+    )
+
+
+def get(url, timeout=None, **kwargs):
+    """GET idempotent (rejoué en cas d'erreur transitoire)"""
+    return session().get(url, timeout=default_timeout(timeout), **kwargs)
+
+
+def post(url, timeout=None, **kwargs):
+    """POST (non rejoué, sauf échec de connexion avant envoi)"""
+    return session().post(url, timeout=default_timeout(timeout), **kwargs)
+
+
+def stats():
+    """État des pools de connexions par hôte"""
+    pools = {}
+    seen = set()
+    for adapter in _get_adapters().values():
+        if id(adapter) in seen:
+            continue
+        seen.add(id(adapter))
+        manager = adapter.poolmanager
+        for key in list(manager.pools.keys()):
+            pool = manager.pools.get(key)
+            if pool is None:
+                continue
+            pools[f"{pool.scheme}://{pool.host}:{pool.port}"] = {
+                "connections_opened": pool.num_connections,
+                "requests": pool.num_requests,
+                "idle": pool.pool.qsize() if pool.pool is not None else 0,
+                "maxsize": adapter._pool_maxsize,
+                "blocking": adapter._pool_block,
+            }
+    return pools
@@ -0,0 +1,61 @@
+"""
+Cache des intentions extraites par Llama, indexé sur le message normalisé.
+
+Stocké dans le cache Django "intent" (settings.CACHES) : mémoire locale par
+défaut (LRU + MAX_ENTRIES), ou fichier / base de données selon la config.
+"""
+import hashlib
+import re
+
+from django.core.cache import caches
+
+from gazetteer import fold
+
+from . import metrics
+
+CACHE_ALIAS = "intent"
+
+
+def normalize_message(message):
+    """
+    "  Hôtel  pas CHER à Paris " -> "hotel pas cher a paris"
+    (casse repliée, accents retirés, espaces fusionnés)
+    """
+    return re.sub(r"\s+", " ", fold(message)).strip()
+
+
+def cache_key(message):
+    digest = hashlib.sha1(normalize_message(message).encode("utf-8")).hexdigest()
+    return f"intent:{digest}"
+
+
+def lookup(message):
+    """Intention en cache pour ce message (ou None)"""
+    intent = caches[CACHE_ALIAS].get(cache_key(message))
+    metrics.incr("intent_cache.hits" if intent is not None else "intent_cache.misses")
+    return intent
+
+
+def store(message, intent):
+    caches[CACHE_ALIAS].set(cache_key(message), intent)
+
+
+async def alookup(message):
+    """Variante asynchrone de lookup (vues ASGI)"""
+    intent = await caches[CACHE_ALIAS].aget(cache_key(message))
+    metrics.incr("intent_cache.hits" if intent is not None else "intent_cache.misses")
+    return intent
+
+
+async def astore(message, intent):
+    await caches[CACHE_ALIAS].aset(cache_key(message), intent)
+
+
+def stats():
+    hits = metrics.get("intent_cache.hits")
+    misses = metrics.get("intent_cache.misses")
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_rate": round(hits / (hits + misses), 4) if hits + misses else None,
+    }
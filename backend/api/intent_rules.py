@@ -0,0 +1,232 @@
+"""
+Extraction d'intention par règles, avec score de confiance.
+
+Quand les règles trouvent assez d'informations (ville connue, budget, durée...),
+l'intention est retournée sans appeler Llama. Un échantillon de ces requêtes est
+rejoué en arrière-plan sur Llama (shadow run) pour mesurer le désaccord.
+"""
+import random
+import re
+import threading
+import time
+
+from django.conf import settings
+
+from gazetteer import DEFAULT_GAZETTEER
+from preferences import extract_preferences
+
+from . import background, metrics
+from .models import City
+
+# Regex compilées une fois (destination après préposition, mots capitalisés, nombres)
+PREPOSITION_REGEX = re.compile(r"(?:\bà\b|\bvers\b|\bpour\b|\bto\b)\s+([A-ZÀÂÄÉÈÊËÎÏÔÖÛÜŸ][\w'’\-éèàùâäêëîïôöûüç]+(?:\s+[A-ZÀÂÄÉÈÊËÎÏÔÖÛÜŸ][\w'’\-éèàùâäêëîïôöûüç]+){0,3})")
+CAPITALIZED_REGEX = re.compile(r"\b[A-ZÀÂÄÉÈÊËÎÏÔÖÛÜŸ][a-zàâäéèêëîïôöûüç'’\-]+\b")
+BUDGET_REGEX = re.compile(r'(\d+)\s*(dt|dinars|euros?|€)')
+DUREE_REGEX = re.compile(r'(\d+)\s*(nuits?|jours?)')
+PERSONNES_REGEX = re.compile(r'pour\s+(\d+)\s*(personnes?|pers|pax?)')
+
+# Poids de chaque information trouvée dans le calcul de confiance
+SIGNAL_WEIGHTS = {
+    ("destination", "known"): 0.45,
+    ("destination", "preposition"): 0.25,
+    ("destination", "capitalized"): 0.1,
+    ("budget", "amount"): 0.25,
+    ("budget", "keyword"): 0.1,
+    ("duree", True): 0.15,
+    ("personnes", True): 0.1,
+    ("interets", True): 0.05,
+}
+
+def extract_intent_with_signals(message):
+    """
+    Extraction par règles. Retourne (intent, signals) où signals indique
+    quelles informations ont réellement été trouvées dans le message
+    (les autres champs gardent leur valeur par défaut).
+    """
+    message_lower = message.lower()
+    
+    intent = {
+        "destination": None, # Pas de contrainte locale: aucune destination par défaut
+        "budget": 100,          # Budget par défaut (en DT, pour le scraping)
+        "type_hebergement": "hôtel",
+        "duree": 3,
+        "personnes": 2,
+        "interets": []
+    }
+    signals = {}
+
+    # Un seul passage du gazetteer : villes connues, mots-clés budget et intérêts
+    prefs = extract_preferences(message, gazetteer=get_gazetteer())
+
+    # Détection destination (globale)
+    # 1) Villes connues (gazetteer, table cities incluse)
+    if prefs["destination"]:
+        intent["destination"] = prefs["destination"]
+        signals["destination"] = "known"
+
+    # 2) Regex basée sur prépositions courantes (à, vers, pour, to) en conservant la casse
+    if not intent["destination"]:
+        m = PREPOSITION_REGEX.search(message)
+        # éviter de capter des mots trop génériques
+        if m and len(m.group(1).strip()) >= 3:
+            intent["destination"] = m.group(1).strip()
+            signals["destination"] = "preposition"
+
+    # 3) Fallback ultra simple: le dernier mot capitalisé (souvent la ville en fin de phrase)
+    if not intent["destination"]:
+        tokens = CAPITALIZED_REGEX.findall(message)
+        if tokens:
+            intent["destination"] = tokens[-1]
+            signals["destination"] = "capitalized"
+
+    # Détection budget
+    budget_match = BUDGET_REGEX.search(message_lower)
+    if budget_match:
+        intent["budget"] = int(budget_match.group(1))
+        signals["budget"] = "amount"
+        # Conversion Euro -> Dinars (approximation 1 EUR ≈ 3 TND)
+        if 'euro' in message_lower or '€' in message_lower:
+            intent["budget"] = intent["budget"] * 3
+    elif prefs["budget"]:
+        signals["budget"] = "keyword"
+
+    # Détection durée (nuits/jours)
+    duree_match = DUREE_REGEX.search(message_lower)
+    if duree_match:
+        intent["duree"] = int(duree_match.group(1))
+        signals["duree"] = True
+
+    # Détection personnes
+    pers_match = PERSONNES_REGEX.search(message_lower)
+    if pers_match:
+        intent["personnes"] = int(pers_match.group(1))
+        signals["personnes"] = True
+
+    # Détection intérêts
+    intent["interets"] = prefs["interests"]
+    if intent["interets"]:
+        signals["interets"] = True
+
+    return intent, signals
+
+def extract_intent_manual(message):
+    """
+    Fallback manuel si Llama échoue.
+    """
+    return extract_intent_with_signals(message)[0]
+
+# -----------------------------
+# GAZETTEER (mots-clés par défaut + table cities)
+# -----------------------------
+_gazetteer = DEFAULT_GAZETTEER
+_gazetteer_loaded = False
+
+def get_gazetteer():
+    """
+    Gazetteer courant (mots-clés par défaut tant que la table cities n'a pas
+    été lue). Simple lecture : la reconstruction se fait en arrière-plan.
+    """
+    return _gazetteer
+
+def refresh_gazetteer():
+    """Reconstruit le gazetteer avec les villes de la table cities"""
+    global _gazetteer, _gazetteer_loaded
+    try:
+        names = list(City.objects.values_list("name", flat=True))
+    except Exception as e:
+        # Base indisponible : garder l'automate courant, réessayer plus tôt
+        print(f"⚠️ Gazetteer sans table cities: {e}")
+        _gazetteer_loaded = False
+        return
+    _gazetteer = DEFAULT_GAZETTEER.extended((name, "destination", name) for name in names)
+    _gazetteer_loaded = True
+    print(f"🗺️ Gazetteer reconstruit ({len(_gazetteer.entries())} mots-clés)")
+
+def _refresh_interval():
+    if not _gazetteer_loaded:
+        return 60
+    return getattr(settings, "GAZETTEER_REFRESH_SECONDS", 3600)
+
+def start_refresher():
+    """Reconstruction toutes les GAZETTEER_REFRESH_SECONDS (60 s après un échec)"""
+    background.every("gazetteer-refresh", _refresh_interval, refresh_gazetteer)
+
+def confidence(signals):
+    """Score entre 0 et 1 à partir des informations trouvées"""
+    return min(1.0, sum(SIGNAL_WEIGHTS.get(item, 0) for item in signals.items()))
+
+def score_intent(message):
+    """
+    Retourne (intent, confidence) pour le message.
+    """
+    started = time.monotonic()
+    intent, signals = extract_intent_with_signals(message)
+    score = confidence(signals)
+    metrics.observe("intent.rules", time.monotonic() - started)
+    return intent, score
+
+def threshold():
+    """Confiance minimale pour ne pas appeler Llama (settings.INTENT_RULES_THRESHOLD)"""
+    return getattr(settings, "INTENT_RULES_THRESHOLD", 0.8)
+
+# -----------------------------
+# SHADOW RUN (mesure du désaccord règles / Llama)
+# -----------------------------
+_shadow_slot = threading.Semaphore(1)
+
+def _normalize_value(value):
+    if isinstance(value, str):
+        return value.strip().casefold() or None
+    return value
+
+def compare_intents(rule_intent, llm_intent):
+    """Liste des champs sur lesquels les deux intentions divergent"""
+    fields = ("destination", "budget", "duree", "personnes")
+    return [
+        field for field in fields
+        if llm_intent.get(field) is not None
+        and _normalize_value(rule_intent.get(field)) != _normalize_value(llm_intent.get(field))
+    ]
+
+def maybe_shadow(message, rule_intent, llm_extract):
+    """
+    Rejoue le message sur Llama en arrière-plan pour un échantillon des requêtes
+    (settings.INTENT_SHADOW_RATE). Au plus un shadow run à la fois.
+    """
+    rate = getattr(settings, "INTENT_SHADOW_RATE", 0.05)
+    if rate <= 0 or random.random() >= rate:
+        return
+    if not _shadow_slot.acquire(blocking=False):
+        return
+
+    def run():
+        try:
+            llm_intent = llm_extract(message)
+            if llm_intent is None:
+                return
+            diff = compare_intents(rule_intent, llm_intent)
+            metrics.incr("intent.shadow.runs")
+            if diff:
+                metrics.incr("intent.shadow.disagreements")
+                for field in diff:
+                    metrics.incr(f"intent.shadow.disagreements.{field}")
+                print(f"🔎 Désaccord règles/Llama sur {diff} pour: {message}")
+        except Exception as e:
+            print(f"⚠️ Erreur shadow run: {e}")
+        finally:
+            _shadow_slot.release()
+
+    threading.Thread(target=run, name="intent-shadow", daemon=True).start()
+
+def stats():
+    rule = metrics.get("intent.path.rules")
+    llm = metrics.get("intent.path.llm")
+    runs = metrics.get("intent.shadow.runs")
+    return {
+        "threshold": threshold(),
+        "rules": rule,
+        "llm": llm,
+        "llm_call_rate": round(llm / (rule + llm), 4) if rule + llm else None,
+        "shadow_runs": runs,
+        "disagreement_rate": round(metrics.get("intent.shadow.disagreements") / runs, 4) if runs else None,
+    }
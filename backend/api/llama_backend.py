@@ -0,0 +1,234 @@
+"""
+Répliques du serveur Llama : état de santé et routage des requêtes.
+
+Les vues ne sondent jamais Llama : elles lisent seulement l'état courant
+(chat_url(), lease(), snapshot()). Un thread démon interroge /health de chaque
+réplique à intervalle régulier (plus souvent tant qu'une réplique est
+injoignable) et met à jour la latence moyenne (EWMA), la dernière erreur et
+les échecs consécutifs. Une erreur constatée sur un appel réel est signalée
+via report_failure(), ce qui réveille la sonde sans attendre l'intervalle.
+
+Routage (settings.LLAMA_URLS) : parmi les répliques saines, celle qui a le
+moins de requêtes en cours. Avec LLAMA_SESSION_AFFINITY, un user_id va
+toujours sur la même réplique (hachage rendez-vous) pour garder son cache de
+conversation chaud, sauf si elle est nettement plus chargée que les autres.
+"""
+import hashlib
+import threading
+import time
+from contextlib import contextmanager
+
+import requests
+from django.conf import settings
+
+from . import http_client
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class LlamaBackend:
+    """
+    Args:
+        base_url: racine du serveur Llama (ex. "http://127.0.0.1:8000")
+    """
+    EWMA_ALPHA = 0.3
+
+    def __init__(self, base_url):
+        self.base_url = base_url.rstrip("/")
+        self.chat_url = f"{self.base_url}/api/chat/"
+        self.intent_url = f"{self.base_url}/api/intent/"
+        self.complete_url = f"{self.base_url}/v1/complete"
+        self.health_url = f"{self.base_url}/health"
+        self.healthy = False
+        self.checked = False
+        self.latency_ewma_ms = None
+        self.last_error = None
+        self.consecutive_failures = 0
+        self.last_check = None
+        self.outstanding = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        with self._lock:
+            self.outstanding += 1
+            self.requests += 1
+
+    def release(self):
+        with self._lock:
+            self.outstanding -= 1
+
+    def affinity_score(self, user_id):
+        """Poids rendez-vous de (réplique, user_id) : la plus forte gagne"""
+        digest = hashlib.sha1(f"{self.base_url}|{user_id}".encode("utf-8")).digest()
+        return int.from_bytes(digest[:8], "big")
+
+    def record_success(self, latency):
+        with self._lock:
+            latency_ms = latency * 1000
+            if self.latency_ewma_ms is None:
+                self.latency_ewma_ms = latency_ms
+            else:
+                self.latency_ewma_ms += self.EWMA_ALPHA * (latency_ms - self.latency_ewma_ms)
+            if not self.healthy:
+                print(f"✅ Serveur Llama disponible: {self.base_url}")
+            self.healthy = True
+            self.checked = True
+            self.consecutive_failures = 0
+            self.last_check = time.time()
+
+    def record_failure(self, error):
+        with self._lock:
+            self.consecutive_failures += 1
+            self.last_error = error
+            self.last_check = time.time()
+            self.checked = True
+            if self.healthy and self.consecutive_failures >= _setting("LLAMA_FAILURE_THRESHOLD", 2):
+                print(f"❌ Serveur Llama indisponible ({error}) - Mode simulation activé")
+                self.healthy = False
+
+    def probe(self):
+        """Un appel à /health (thread de la sonde uniquement)"""
+        started = time.monotonic()
+        try:
+            response = http_client.session().get(self.health_url, timeout=(
+                _setting("HTTP_CONNECT_TIMEOUT", 3.05), _setting("LLAMA_PROBE_TIMEOUT", 2)
+            ))
+            if response.status_code == 200:
+                self.record_success(time.monotonic() - started)
+            else:
+                self.record_failure(f"HTTP {response.status_code}")
+        except requests.exceptions.Timeout:
+            self.record_failure("timeout")
+        except Exception as e:
+            self.record_failure(type(e).__name__)
+
+    def snapshot(self):
+        with self._lock:
+            if not self.checked:
+                status = "unknown"
+            else:
+                status = "connected" if self.healthy else "disconnected"
+            return {
+                "status": status,
+                "url": self.chat_url if self.healthy else None,
+                "outstanding": self.outstanding,
+                "requests": self.requests,
+                "latency_ewma_ms": round(self.latency_ewma_ms, 2) if self.latency_ewma_ms is not None else None,
+                "last_error": self.last_error,
+                "consecutive_failures": self.consecutive_failures,
+                "last_check_age_s": round(time.time() - self.last_check, 1) if self.last_check else None,
+            }
+
+
+# -----------------------------
+# POOL DE RÉPLIQUES
+# -----------------------------
+class LlamaPool:
+    """
+    Args:
+        urls: racines des répliques (ex. ["http://127.0.0.1:8000", "http://127.0.0.1:8002"])
+    """
+
+    def __init__(self, urls):
+        self.replicas = [LlamaBackend(url) for url in urls if url.strip()]
+
+    def healthy(self):
+        return [replica for replica in self.replicas if replica.healthy]
+
+    def pick(self, user_id=None):
+        """Réplique saine la moins chargée (ou celle du user_id), None si aucune"""
+        candidates = self.healthy()
+        if not candidates:
+            return None
+        least = min(candidates, key=lambda r: (r.outstanding, r.latency_ewma_ms or 0))
+        if user_id is None or not _setting("LLAMA_SESSION_AFFINITY", False):
+            return least
+        preferred = max(candidates, key=lambda r: r.affinity_score(user_id))
+        if preferred.outstanding - least.outstanding > _setting("LLAMA_AFFINITY_MAX_SKEW", 4):
+            return least
+        return preferred
+
+    def snapshot(self):
+        replicas = [replica.snapshot() for replica in self.replicas]
+        healthy = [r for r in replicas if r["status"] == "connected"]
+        if healthy:
+            status = "connected"
+        elif any(r["status"] == "unknown" for r in replicas):
+            status = "unknown"
+        else:
+            status = "disconnected"
+        return {
+            "status": status,
+            "url": healthy[0]["url"] if healthy else None,
+            "healthy_replicas": len(healthy),
+            "replicas": replicas,
+        }
+
+
+# -----------------------------
+# SONDE EN ARRIÈRE-PLAN
+# -----------------------------
+pool = LlamaPool(_setting("LLAMA_URLS", None) or [_setting("LLAMA_URL", "http://127.0.0.1:8000")])
+
+_wakeup = threading.Event()
+_started = False
+_start_lock = threading.Lock()
+
+
+def _probe_loop():
+    while True:
+        for replica in pool.replicas:
+            replica.probe()
+        if all(replica.healthy for replica in pool.replicas):
+            interval = _setting("LLAMA_PROBE_INTERVAL", 10)
+        else:
+            interval = _setting("LLAMA_PROBE_RETRY_INTERVAL", 2)
+        _wakeup.wait(interval)
+        _wakeup.clear()
+
+
+def start_prober():
+    """Démarre la sonde (idempotent) ; le 1er sondage part immédiatement"""
+    global _started
+    with _start_lock:
+        if _started:
+            return
+        _started = True
+        threading.Thread(target=_probe_loop, name="llama-prober", daemon=True).start()
+
+
+def chat_url():
+    """URL du chat d'une réplique disponible, sinon None (mode simulation)"""
+    replica = pool.pick()
+    return replica.chat_url if replica is not None else None
+
+
+@contextmanager
+def lease(user_id=None):
+    """
+    Réserve une réplique pour la durée d'un appel (compte les requêtes en cours).
+    Produit None si aucune réplique n'est disponible.
+    """
+    replica = pool.pick(user_id)
+    if replica is None:
+        yield None
+        return
+    replica.acquire()
+    try:
+        yield replica
+    finally:
+        replica.release()
+
+
+def report_failure(error, replica=None):
+    """Erreur constatée sur un appel réel : compte l'échec et relance la sonde"""
+    if replica is not None:
+        replica.record_failure(error)
+    _wakeup.set()
+
+
+def snapshot():
+    return pool.snapshot()
@@ -0,0 +1,48 @@
+"""
+Compteurs et latences en mémoire, exposés par /api/metrics/.
+"""
+import threading
+from collections import defaultdict, deque
+
+_lock = threading.Lock()
+_counters = defaultdict(int)
+_timings = defaultdict(lambda: deque(maxlen=1000))
+
+
+def incr(name, value=1):
+    """Incrémente un compteur"""
+    with _lock:
+        _counters[name] += value
+
+
+def observe(name, seconds):
+    """Enregistre une durée (secondes) pour la série name"""
+    with _lock:
+        _timings[name].append(seconds)
+
+
+def get(name):
+    with _lock:
+        return _counters.get(name, 0)
+
+
+def percentile(values, p):
+    return values[min(len(values) - 1, int(len(values) * p))]
+
+
+def snapshot():
+    """Copie de tous les compteurs et des percentiles de latence (ms)"""
+    with _lock:
+        counters = dict(_counters)
+        timings = {name: sorted(values) for name, values in _timings.items() if values}
+    return {
+        "counters": counters,
+        "timings_ms": {
+            name: {
+                "count": len(values),
+                "p50": round(percentile(values, 0.50) * 1000, 1),
+                "p99": round(percentile(values, 0.99) * 1000, 1),
+            }
+            for name, values in timings.items()
+        },
+    }
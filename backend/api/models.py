@@ -7,6 +7,8 @@ class City(models.Model):
     name = models.CharField(max_length=150)
     lat = models.DecimalField(max_digits=9, decimal_places=6, null=True)
     lng = models.DecimalField(max_digits=9, decimal_places=6, null=True)
+    # Tenue à jour par MySQL (ON UPDATE), voir api/catalog.py
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         managed = False
@@ -21,6 +23,8 @@ class Destination(models.Model):
     avg_price_level = models.SmallIntegerField(null=True)
     popularity_score = models.DecimalField(max_digits=5, decimal_places=2, null=True)
     image_url = models.CharField(max_length=500, null=True)
+    # Tenue à jour par MySQL (ON UPDATE), voir api/catalog.py
+    updated_at = models.DateTimeField(auto_now=True)
 
     class Meta:
         managed = False
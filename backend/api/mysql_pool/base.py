@@ -0,0 +1,39 @@
+"""
+Backend MySQL avec pool de connexions (ENGINE = "api.mysql_pool").
+
+Identique à django.db.backends.mysql, sauf que les connexions viennent du
+pool (pool.py) et y retournent à la fermeture au lieu d'être coupées. Avec
+CONN_MAX_AGE = 0, Django "ferme" la connexion à la fin de chaque requête :
+elle est rendue au pool, que la requête arrive par WSGI ou ASGI.
+
+Options (clé POOL de DATABASES[alias]) : MAX_SIZE, IDLE_TIMEOUT,
+CHECKOUT_TIMEOUT, HEALTH_CHECK_AFTER.
+"""
+from django.db.backends.mysql.base import DatabaseWrapper as MySQLDatabaseWrapper
+
+from .pool import get_pool
+
+
+class DatabaseWrapper(MySQLDatabaseWrapper):
+
+    def _pool(self, conn_params=None):
+        def connect():
+            return MySQLDatabaseWrapper.get_new_connection(self, conn_params)
+        return get_pool(self.alias, self.settings_dict.get("POOL", {}), connect)
+
+    def get_new_connection(self, conn_params):
+        return self._pool(conn_params).checkout()
+
+    def _close(self):
+        if self.connection is None:
+            return
+        # Erreur pendant la requête : ne rendre la connexion que si elle répond
+        broken = self.errors_occurred and not self.is_usable()
+        try:
+            # Pas de transaction ouverte dans une connexion rendue
+            if not self.get_autocommit():
+                self.connection.rollback()
+        except Exception:
+            broken = True
+        with self.wrap_database_errors:
+            self._pool().checkin(self.connection, broken=broken)
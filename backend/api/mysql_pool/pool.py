@@ -0,0 +1,168 @@
+"""
+Pool de connexions MySQL partagé par tous les threads du processus.
+
+Les connexions rendues sont gardées ouvertes (au plus max_size au total) et
+réutilisées dans l'ordre LIFO, ce qui laisse expirer les moins utilisées
+(idle_timeout). Au moment de l'emprunt, une connexion restée inactive est
+vérifiée par un ping avant d'être rendue à Django.
+"""
+import threading
+import time
+from collections import deque
+
+
+class PoolTimeoutError(Exception):
+    """Aucune connexion libérée dans le délai d'attente."""
+
+
+class ConnectionPool:
+    """
+    Args:
+        connect: fonction qui ouvre une nouvelle connexion
+        max_size: connexions ouvertes max (empruntées + libres)
+        idle_timeout: secondes avant fermeture d'une connexion libre
+        checkout_timeout: attente max d'une connexion quand le pool est plein
+        health_check_after: ping à l'emprunt si la connexion est libre depuis plus longtemps
+    """
+
+    def __init__(self, connect, max_size=10, idle_timeout=300, checkout_timeout=10, health_check_after=1):
+        self.connect = connect
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.checkout_timeout = checkout_timeout
+        self.health_check_after = health_check_after
+        self._idle = deque()  # (connexion, rendue à)
+        self._size = 0
+        self._cond = threading.Condition()
+        self.created = 0
+        self.checkouts = 0
+        self.reused = 0
+        self.expired = 0
+        self.health_check_failures = 0
+        self.wait_timeouts = 0
+        self._wait_seconds = 0.0
+
+    def checkout(self):
+        started = time.monotonic()
+        while True:
+            conn, returned_at = self._reserve(started)
+            if conn is None:
+                # Place réservée : ouverture hors verrou
+                try:
+                    conn = self.connect()
+                except Exception:
+                    self._release_slot()
+                    raise
+                with self._cond:
+                    self.created += 1
+                break
+            if time.monotonic() - returned_at < self.health_check_after or self._ping(conn):
+                with self._cond:
+                    self.reused += 1
+                break
+            with self._cond:
+                self.health_check_failures += 1
+            self._discard(conn)
+
+        with self._cond:
+            self.checkouts += 1
+            self._wait_seconds += time.monotonic() - started
+        return conn
+
+    def _reserve(self, started):
+        """Connexion libre (conn, rendue à) ou (None, None) avec une place réservée"""
+        with self._cond:
+            while True:
+                now = time.monotonic()
+                while self._idle:
+                    conn, returned_at = self._idle.pop()
+                    if now - returned_at <= self.idle_timeout:
+                        return conn, returned_at
+                    self.expired += 1
+                    self._size -= 1
+                    self._close(conn)
+                if self._size < self.max_size:
+                    self._size += 1
+                    return None, None
+                remaining = self.checkout_timeout - (now - started)
+                if remaining <= 0:
+                    self.wait_timeouts += 1
+                    raise PoolTimeoutError(
+                        f"Pool MySQL saturé ({self.max_size} connexions) après {self.checkout_timeout}s"
+                    )
+                self._cond.wait(remaining)
+
+    def checkin(self, conn, broken=False):
+        """Rend une connexion au pool (fermée si broken)"""
+        if broken:
+            self._discard(conn)
+            return
+        with self._cond:
+            self._idle.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def _discard(self, conn):
+        self._close(conn)
+        self._release_slot()
+
+    def _release_slot(self):
+        with self._cond:
+            self._size -= 1
+            self._cond.notify()
+
+    @staticmethod
+    def _ping(conn):
+        try:
+            conn.ping()
+            return True
+        except Exception:
+            return False
+
+    @staticmethod
+    def _close(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    def stats(self):
+        with self._cond:
+            return {
+                "max_size": self.max_size,
+                "open": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "created": self.created,
+                "checkouts": self.checkouts,
+                "reused": self.reused,
+                "expired": self.expired,
+                "health_check_failures": self.health_check_failures,
+                "wait_timeouts": self.wait_timeouts,
+                "avg_checkout_ms": round(self._wait_seconds / self.checkouts * 1000, 3) if self.checkouts else None,
+            }
+
+
+_pools = {}
+_pools_lock = threading.Lock()
+
+
+def get_pool(alias, options, connect):
+    """Pool de l'alias de base (créé au premier emprunt)"""
+    pool = _pools.get(alias)
+    if pool is None:
+        with _pools_lock:
+            pool = _pools.get(alias)
+            if pool is None:
+                pool = _pools[alias] = ConnectionPool(
+                    connect,
+                    max_size=options.get("MAX_SIZE", 10),
+                    idle_timeout=options.get("IDLE_TIMEOUT", 300),
+                    checkout_timeout=options.get("CHECKOUT_TIMEOUT", 10),
+                    health_check_after=options.get("HEALTH_CHECK_AFTER", 1),
+                )
+    return pool
+
+
+def stats():
+    """Statistiques de tous les pools, par alias"""
+    return {alias: pool.stats() for alias, pool in _pools.items()}
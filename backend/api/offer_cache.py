@@ -0,0 +1,107 @@
+"""
+Cache des offres par (destination normalisée, tranche de budget, personnes).
+
+Stale-while-revalidate : une entrée fraîche est servie telle quelle ; une
+entrée périmée (mais pas expirée) est servie immédiatement et rafraîchie en
+arrière-plan ; sans entrée, la collecte est faite en direct. Dans tous les cas
+une seule collecte par clé est en cours à la fois (single-flight) : 50 requêtes
+simultanées pour "Paris" déclenchent un seul scraping.
+
+Stocké dans le cache Django "offers" (settings.CACHES) : la taille max vient
+de MAX_ENTRIES, la durée de vie totale de TIMEOUT.
+"""
+import hashlib
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import caches
+
+from gazetteer import fold
+from scraper import PRICE_RANGES, budget_band
+
+from . import background, metrics
+from .singleflight import SingleFlight
+
+CACHE_ALIAS = "offers"
+
+_flight = SingleFlight("offer_cache.fetch")
+_refresher = ThreadPoolExecutor(max_workers=2, thread_name_prefix="offer-refresh")
+
+
+def cache_key(destination, budget, personnes):
+    raw = f"{fold(destination or '').strip()}|{budget_band(budget)}|{personnes}"
+    return "offers:" + hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+def band_budget(budget):
+    """
+    Budget par nuit utilisé pour la collecte : borne haute de la tranche, pour
+    que l'entrée partagée couvre tous les budgets de la tranche (et ne dépende
+    pas du budget exact du premier appelant).
+    """
+    return PRICE_RANGES[budget_band(budget)][1]
+
+
+def fresh_ttl():
+    """Durée (secondes) pendant laquelle une entrée est servie sans rafraîchissement"""
+    return getattr(settings, "OFFER_CACHE_FRESH_TTL", 300)
+
+
+def _fetch_and_store(key, fetch):
+    offers = fetch()
+    caches[CACHE_ALIAS].set(key, {"offers": offers, "fetched_at": time.time()})
+    return offers
+
+
+@background.releasing_connections
+def _refresh(key, fetch):
+    try:
+        _flight.do(key, lambda: _fetch_and_store(key, fetch))
+        metrics.incr("offer_cache.refreshes")
+    except Exception as e:
+        print(f"⚠️ Rafraîchissement des offres échoué: {e}")
+
+
+def get_or_fetch(destination, budget, personnes, fetch):
+    """
+    Offres pour la requête, depuis le cache si possible.
+
+    Args:
+        fetch: fonction fetch(budget) qui collecte les offres ; reçoit le budget
+               de la tranche (band_budget), appelée au plus une fois à la fois par clé
+    """
+    key = cache_key(destination, budget, personnes)
+
+    def band_fetch():
+        return fetch(band_budget(budget))
+
+    entry = caches[CACHE_ALIAS].get(key)
+
+    if entry is not None:
+        age = time.time() - entry["fetched_at"]
+        if age < fresh_ttl():
+            metrics.incr("offer_cache.hits")
+        else:
+            metrics.incr("offer_cache.stale")
+            if not _flight.in_flight(key):
+                _refresher.submit(_refresh, key, band_fetch)
+        return entry["offers"]
+
+    metrics.incr("offer_cache.misses")
+    return _flight.do(key, lambda: _fetch_and_store(key, band_fetch))
+
+
+def stats():
+    hits = metrics.get("offer_cache.hits")
+    stale = metrics.get("offer_cache.stale")
+    misses = metrics.get("offer_cache.misses")
+    total = hits + stale + misses
+    return {
+        "hits": hits,
+        "stale_served": stale,
+        "misses": misses,
+        "hit_rate": round((hits + stale) / total, 4) if total else None,
+        "refreshes": metrics.get("offer_cache.refreshes"),
+        "fetch": _flight.stats(),
+    }
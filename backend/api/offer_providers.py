@@ -0,0 +1,85 @@
+"""
+Fournisseurs d'offres enregistrés dans le registre de api/providers.py.
+
+Regroupe les sources de views.py (TripAdvisor, simulations, deep links) et
+celles de scraper.py. Importé par ApiConfig.ready().
+"""
+import scraper
+
+from . import views
+from .providers import OfferProvider, register
+
+
+@register
+class TripAdvisorProvider(OfferProvider):
+    name = "tripadvisor"
+    timeout = 6
+    max_concurrency = 4
+
+    def fetch(self, query):
+        return views.fetch_tripadvisor(query["destination"], query["budget"], timeout=self.timeout)
+
+
+@register
+class BookingSimulationProvider(OfferProvider):
+    name = "booking"
+    timeout = 2
+
+    def fetch(self, query):
+        return views.scrape_booking_simulation(query["destination"], query["budget"])
+
+
+@register
+class ExpediaSimulationProvider(OfferProvider):
+    name = "expedia"
+    timeout = 2
+
+    def fetch(self, query):
+        return views.scrape_expedia_simulation(query["destination"], query["budget"])
+
+
+@register
+class DeepLinksProvider(OfferProvider):
+    name = "deep_links"
+    timeout = 1
+    max_concurrency = 16
+
+    def fetch(self, query):
+        estimated = views.estimate_nightly_price(query["destination"], query["budget"])
+        return views.build_deep_links(
+            query["destination"],
+            adultes=query["personnes"],
+            estimated_price=estimated,
+            estimated_total=estimated
+        )
+
+
+@register
+class ScraperBookingProvider(OfferProvider):
+    name = "scraper_booking"
+    timeout = 10
+
+    def fetch(self, query):
+        return scraper.scrape_booking(query["destination"], None, None, budget=scraper.budget_band(query["budget"]))
+
+
+@register
+class ScraperAirbnbProvider(OfferProvider):
+    name = "scraper_airbnb"
+    timeout = 10
+
+    def fetch(self, query):
+        return scraper.scrape_airbnb(query["destination"], budget=scraper.budget_band(query["budget"]))
+
+
+@register
+class ScraperOffersProvider(OfferProvider):
+    """Offres fictives de scraper.py (désactivé par défaut, voir settings.OFFER_PROVIDERS)"""
+    name = "scraper_offers"
+    timeout = 2
+
+    def fetch(self, query):
+        return scraper.scrape_offers({
+            "destination": query["destination"],
+            "budget": scraper.budget_band(query["budget"]),
+        })
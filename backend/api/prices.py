@@ -0,0 +1,479 @@
+"""
+Agrégats de prix des chambres par ville, devise et mois (room_offers).
+
+Les offres encore disponibles sont chargées en mémoire dans des tableaux
+NumPy triés par (ville + devise, début de disponibilité). Sur ces tableaux :
+  - agrégats précalculés min / médiane / p90 par (ville, devise), en tout et
+    par mois sur PRICE_BUCKET_MONTHS mois ;
+  - index d'intervalles pour "offres disponibles entre D1 et D2" : dans la
+    tranche de la ville, les débuts sont triés et la durée max d'une offre
+    est connue, donc seules les offres qui commencent entre D1 - durée max
+    et D2 sont lues (deux recherches binaires), puis filtrées sur la fin.
+
+Mises à jour incrémentales comme l'index géographique : offres ajoutées
+(nouveaux ids) ou enregistrées via l'ORM dans un delta, ancienne version
+masquée, seuls les agrégats des groupes touchés sont recalculés ; fusion
+au-delà de PRICE_DELTA_MAX. Reconstruction complète toutes les
+PRICE_FULL_REBUILD_INTERVAL secondes (offres expirées, nouveaux mois).
+
+room_offers n'a que room_type_id : la ville de chaque type de chambre vient
+de la requête ROOM_TYPE_CITY_SQL (lignes room_type_id, city_id). Sans elle,
+aucun agrégat n'est possible : avertissement au démarrage (check api.W001),
+book.configured = False dans /api/health/ et /api/prices/ répond 503.
+"""
+import threading
+import time
+from datetime import date, timedelta
+
+import numpy as np
+from django.conf import settings
+from django.core import checks
+from django.core.exceptions import ImproperlyConfigured
+from django.db import connection
+
+from . import background, metrics
+from .models import RoomOffer
+
+QUANTILES = (0.5, 0.9)
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+NOT_CONFIGURED = (
+    "ROOM_TYPE_CITY_SQL non configurée : room_offers ne peut pas être rattachée "
+    "aux villes, aucun agrégat de prix"
+)
+
+
+def room_type_cities():
+    """{room_type_id: city_id} depuis ROOM_TYPE_CITY_SQL (ImproperlyConfigured si absente)"""
+    sql = _setting("ROOM_TYPE_CITY_SQL", "")
+    if not sql:
+        raise ImproperlyConfigured(NOT_CONFIGURED)
+    with connection.cursor() as cursor:
+        cursor.execute(sql)
+        return {room_type_id: city_id for room_type_id, city_id in cursor.fetchall()}
+
+
+@checks.register
+def check_room_type_mapping(app_configs, **kwargs):
+    """Avertit dès le démarrage (runserver, migrate, check...) si la requête manque"""
+    if _setting("ROOM_TYPE_CITY_SQL", ""):
+        return []
+    return [checks.Warning(
+        NOT_CONFIGURED,
+        hint="Définir ROOM_TYPE_CITY_SQL (SELECT room_type_id, city_id ...) dans l'environnement.",
+        id="api.W001",
+    )]
+
+
+def group_stats(groups, values):
+    """
+    Statistiques par groupe en un passage trié.
+    Retourne (groupes, nombre, min, médiane, p90) ; quantiles interpolés
+    comme np.percentile.
+    """
+    order = np.lexsort((values, groups))
+    groups, values = groups[order], values[order]
+    keys, starts, counts = np.unique(groups, return_index=True, return_counts=True)
+
+    def quantile(q):
+        pos = starts + q * (counts - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.ceil(pos).astype(np.int64)
+        return values[lo] + (values[hi] - values[lo]) * (pos - lo)
+
+    return keys, counts, values[starts], quantile(QUANTILES[0]), quantile(QUANTILES[1])
+
+
+def summarize(values):
+    if not len(values):
+        return None
+    median, p90 = np.percentile(values, [q * 100 for q in QUANTILES])
+    return {"count": int(len(values)), "min": round(float(values.min()), 2),
+            "median": round(float(median), 2), "p90": round(float(p90), 2)}
+
+
+def month_buckets(today, months):
+    """[(clé "AAAA-MM", premier jour, dernier jour)] en ordinaux, mois courant inclus"""
+    buckets = []
+    first = today.replace(day=1)
+    for _ in range(months):
+        following = (first + timedelta(days=32)).replace(day=1)
+        buckets.append((first.strftime("%Y-%m"), first.toordinal(), following.toordinal() - 1))
+        first = following
+    return buckets
+
+
+class OfferArrays:
+    """Offres figées, triées par (groupe, début)"""
+
+    def __init__(self, ids, groups, prices, starts, ends, n_groups):
+        order = np.lexsort((starts, groups))
+        self.ids = np.asarray(ids, dtype=np.int64)[order]
+        self.groups = np.asarray(groups, dtype=np.int64)[order]
+        self.prices = np.asarray(prices, dtype=np.float64)[order]
+        self.starts = np.asarray(starts, dtype=np.int64)[order]
+        self.ends = np.asarray(ends, dtype=np.int64)[order]
+        self.max_id = int(self.ids.max()) if len(self.ids) else 0
+        # Ids triés (et leur ligne) : retrouver une offre par recherche binaire
+        self._id_order = np.argsort(self.ids, kind="stable")
+        self._sorted_ids = self.ids[self._id_order]
+        # Durée max d'une offre par groupe : borne basse des débuts à lire
+        self.max_span = np.zeros(n_groups, dtype=np.int64)
+        if len(self.ids):
+            np.maximum.at(self.max_span, self.groups, self.ends - self.starts)
+
+    def __len__(self):
+        return len(self.ids)
+
+    def row_of(self, offer_id):
+        """Ligne de l'offre, None si absente"""
+        pos = int(np.searchsorted(self._sorted_ids, offer_id))
+        if pos < len(self._sorted_ids) and self._sorted_ids[pos] == offer_id:
+            return int(self._id_order[pos])
+        return None
+
+    def group_rows(self, groups):
+        """Lignes des offres des groupes donnés (tranches contiguës)"""
+        slices = [np.arange(*self.group_slice(group)) for group in sorted(groups)]
+        return np.concatenate(slices) if slices else np.empty(0, dtype=np.int64)
+
+    def group_slice(self, group):
+        return (
+            int(np.searchsorted(self.groups, group, side="left")),
+            int(np.searchsorted(self.groups, group, side="right")),
+        )
+
+    def overlapping(self, group, first_day, last_day):
+        """Indices des offres du groupe disponibles au moins un jour de [first_day, last_day]"""
+        lo, hi = self.group_slice(group)
+        span = self.max_span[group] if group < len(self.max_span) else 0
+        starts = self.starts[lo:hi]
+        a = lo + int(np.searchsorted(starts, first_day - span, side="left"))
+        b = lo + int(np.searchsorted(starts, last_day, side="right"))
+        idx = np.arange(a, b)
+        return idx[self.ends[idx] >= first_day]
+
+
+class OfferBook:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._group_of = {}  # (city_id, devise) -> numéro de groupe
+        self._group_keys = []
+        self._room_types = {}
+        self.configured = None  # False : ROOM_TYPE_CITY_SQL absente (voir check api.W001)
+        self._main = None
+        self._delta = {}  # id -> (groupe, prix, début, fin) ou None si retirée
+        self._state = None  # (groupes, principal, ids, groupes, prix, débuts, fins du delta, ids masqués)
+        self._overall = {}  # (city_id, devise) -> stats
+        self._buckets = {}  # (city_id, devise) -> {mois: stats}
+        self._version = None
+        self._built_at = 0.0
+        self.version = 0  # incrémenté à chaque publication (lu par le moteur de recommandations)
+        self.full_builds = 0
+        self.incremental_updates = 0
+        self.merges = 0
+
+    @property
+    def ready(self):
+        return self._state is not None
+
+    def _group(self, city_id, currency):
+        key = (city_id, currency.upper())
+        group = self._group_of.get(key)
+        if group is None:
+            group = self._group_of[key] = len(self._group_keys)
+            self._group_keys.append(key)
+        return group
+
+    # -- construction -------------------------------------------------------
+
+    def rebuild(self):
+        """Rechargement complet des offres encore disponibles"""
+        started = time.perf_counter()
+        version = background.table_version(RoomOffer.objects.all())
+        try:
+            room_types = room_type_cities()
+            configured = True
+        except ImproperlyConfigured as e:
+            print(f"⚠️ {e}")
+            room_types, configured = {}, False
+        if configured and not room_types:
+            print("⚠️ ROOM_TYPE_CITY_SQL ne renvoie aucune ligne : aucun agrégat de prix")
+        today = date.today()
+        ids, groups, prices, starts, ends = [], [], [], [], []
+        group_of, group_keys = {}, []
+        if room_types:
+            rows = (
+                RoomOffer.objects.filter(available_to__gte=today)
+                .values_list("id", "room_type_id", "currency", "price_per_night", "available_from", "available_to")
+                .iterator(chunk_size=20000)
+            )
+            for offer_id, room_type_id, currency, price, available_from, available_to in rows:
+                city_id = room_types.get(room_type_id)
+                if city_id is None:
+                    continue
+                key = (city_id, currency.upper())
+                group = group_of.get(key)
+                if group is None:
+                    group = group_of[key] = len(group_keys)
+                    group_keys.append(key)
+                ids.append(offer_id)
+                groups.append(group)
+                prices.append(float(price))
+                starts.append(available_from.toordinal())
+                ends.append(available_to.toordinal())
+        main = OfferArrays(ids, groups, prices, starts, ends, len(group_keys))
+        with self._lock:
+            self._group_of, self._group_keys = group_of, group_keys
+            self._room_types = room_types
+            self.configured = configured
+            self._main = main
+            self._delta = {}
+            self._version = version
+            self._built_at = time.time()
+            self._publish(dirty=None)
+            self.full_builds += 1
+        metrics.observe("prices.rebuild", time.perf_counter() - started)
+        print(f"💶 Agrégats de prix: {len(ids)} offres, {len(self._group_keys)} (ville, devise)")
+
+    def refresh(self):
+        """Rien si la table n'a pas bougé, sinon lecture des seules nouvelles offres"""
+        if self._version is None or time.time() - self._built_at > _setting("PRICE_FULL_REBUILD_INTERVAL", 3600):
+            self.rebuild()
+            return
+        count, max_id = background.table_version(RoomOffer.objects.all())
+        known_count, known_max = self._version
+        if (count, max_id) == (known_count, known_max):
+            return
+        added = list(
+            RoomOffer.objects.filter(id__gt=known_max)
+            .values_list("id", "room_type_id", "currency", "price_per_night", "available_from", "available_to")
+        )
+        if count - known_count != len(added):
+            # Offres supprimées : on repart de la table
+            self.rebuild()
+            return
+        if self.configured and any(row[1] not in self._room_types for row in added):
+            self._room_types = room_type_cities()
+        self.upsert_many(added)
+        with self._lock:
+            self._version = (count, max_id)
+
+    def upsert_many(self, rows):
+        """Offres (id, room_type_id, devise, prix, du, au) ajoutées ou modifiées"""
+        today = date.today().toordinal()
+        with self._lock:
+            if self._main is None:
+                return
+            dirty = set()
+            for offer_id, room_type_id, currency, price, available_from, available_to in rows:
+                previous = self._delta.get(offer_id)
+                if previous is not None:
+                    dirty.add(previous[0])
+                # Offre déjà chargée (id connu) : son ancien groupe est à recalculer
+                row = self._main.row_of(offer_id)
+                if row is not None:
+                    dirty.add(int(self._main.groups[row]))
+                city_id = self._room_types.get(room_type_id)
+                if city_id is None or available_to is None or available_to.toordinal() < today:
+                    self._delta[offer_id] = None
+                    continue
+                group = self._group(city_id, currency)
+                self._delta[offer_id] = (group, float(price), available_from.toordinal(), available_to.toordinal())
+                dirty.add(group)
+            self.incremental_updates += 1
+            self._publish(dirty=dirty)
+
+    def remove(self, offer_id):
+        with self._lock:
+            if self._main is None:
+                return
+            dirty = set()
+            previous = self._delta.get(offer_id)
+            if previous is not None:
+                dirty.add(previous[0])
+            row = self._main.row_of(offer_id)
+            if row is not None:
+                dirty.add(int(self._main.groups[row]))
+            self._delta[offer_id] = None
+            self._publish(dirty=dirty)
+
+    def _delta_arrays(self):
+        live = [(offer_id, row) for offer_id, row in self._delta.items() if row is not None]
+        return (
+            np.array([offer_id for offer_id, _ in live], dtype=np.int64),
+            np.array([row[0] for _, row in live], dtype=np.int64),
+            np.array([row[1] for _, row in live], dtype=np.float64),
+            np.array([row[2] for _, row in live], dtype=np.int64),
+            np.array([row[3] for _, row in live], dtype=np.int64),
+        )
+
+    def _merge(self):
+        """Fusionne le delta dans de nouveaux tableaux triés, sans relire la base"""
+        main = self._main
+        keep = ~np.isin(main.ids, np.fromiter(self._delta, dtype=np.int64))
+        d_ids, d_groups, d_prices, d_starts, d_ends = self._delta_arrays()
+        self._main = OfferArrays(
+            np.concatenate([main.ids[keep], d_ids]),
+            np.concatenate([main.groups[keep], d_groups]),
+            np.concatenate([main.prices[keep], d_prices]),
+            np.concatenate([main.starts[keep], d_starts]),
+            np.concatenate([main.ends[keep], d_ends]),
+            len(self._group_keys),
+        )
+        self._delta = {}
+        self.merges += 1
+
+    def _publish(self, dirty):
+        """
+        Met à jour l'état lu par les requêtes (verrou tenu).
+        dirty: groupes dont les agrégats sont à recalculer (None : tous)
+        """
+        if len(self._delta) > _setting("PRICE_DELTA_MAX", 5000):
+            self._merge()
+        main = self._main
+        d_ids, d_groups, d_prices, d_starts, d_ends = self._delta_arrays()
+        masked = np.array(sorted(self._delta), dtype=np.int64)
+
+        # Offres visibles des groupes à recalculer : seules leurs tranches du
+        # tableau principal sont lues, pas le tableau entier
+        if dirty is None:
+            rows = np.arange(len(main))
+            d_select = np.ones(len(d_ids), dtype=bool)
+        else:
+            rows = main.group_rows(dirty)
+            d_select = np.isin(d_groups, np.fromiter(dirty, dtype=np.int64))
+        if masked.size and len(rows):
+            rows = rows[~np.isin(main.ids[rows], masked)]
+        groups = np.concatenate([main.groups[rows], d_groups[d_select]])
+        prices = np.concatenate([main.prices[rows], d_prices[d_select]])
+        starts = np.concatenate([main.starts[rows], d_starts[d_select]])
+        ends = np.concatenate([main.ends[rows], d_ends[d_select]])
+
+        overall, buckets = self._aggregate(groups, prices, starts, ends)
+        if dirty is None:
+            self._overall, self._buckets = overall, buckets
+        else:
+            # Copies : les requêtes en cours gardent l'ancienne version
+            self._overall, self._buckets = dict(self._overall), dict(self._buckets)
+            for group in dirty:
+                key = self._group_keys[group]
+                self._overall.pop(key, None)
+                self._buckets.pop(key, None)
+            self._overall.update(overall)
+            self._buckets.update(buckets)
+
+        self._state = (self._group_of, main, d_ids, d_groups, d_prices, d_starts, d_ends, masked)
+        self.version += 1
+
+    def _aggregate(self, groups, prices, starts, ends):
+        """Agrégats (global, par mois) des offres données, par (ville, devise)"""
+        overall, buckets = {}, {}
+        if not len(groups):
+            return overall, buckets
+        for group, n, low, median, p90 in zip(*group_stats(groups, prices)):
+            overall[self._group_keys[group]] = {
+                "count": int(n), "min": round(float(low), 2),
+                "median": round(float(median), 2), "p90": round(float(p90), 2),
+            }
+        for month, first_day, last_day in month_buckets(date.today(), _setting("PRICE_BUCKET_MONTHS", 12)):
+            inside = (starts <= last_day) & (ends >= first_day)
+            if not inside.any():
+                continue
+            for group, n, low, median, p90 in zip(*group_stats(groups[inside], prices[inside])):
+                buckets.setdefault(self._group_keys[group], {})[month] = {
+                    "count": int(n), "min": round(float(low), 2),
+                    "median": round(float(median), 2), "p90": round(float(p90), 2),
+                }
+        return overall, buckets
+
+    # -- lectures -----------------------------------------------------------
+
+    def city_prices(self, city_id, currency):
+        """min / médiane / p90 par nuit des offres disponibles (None sans offre)"""
+        return self._overall.get((city_id, currency.upper()))
+
+    def calendar(self, city_id, currency):
+        """{mois: stats} sur les PRICE_BUCKET_MONTHS prochains mois"""
+        return self._buckets.get((city_id, currency.upper()), {})
+
+    def quote(self, city_id, currency, checkin, checkout=None):
+        """Prix par nuit des offres disponibles sur au moins une nuit du séjour"""
+        state = self._state
+        if state is None:
+            return None
+        group_of, main, d_ids, d_groups, d_prices, d_starts, d_ends, masked = state
+        group = group_of.get((city_id, currency.upper()))
+        if group is None:
+            return None
+        first_day = checkin.toordinal()
+        # Le jour du départ n'est pas une nuit
+        last_day = max(first_day, checkout.toordinal() - 1) if checkout else first_day
+
+        idx = main.overlapping(group, first_day, last_day)
+        if masked.size and len(idx):
+            idx = idx[~np.isin(main.ids[idx], masked)]
+        in_delta = (d_groups == group) & (d_starts <= last_day) & (d_ends >= first_day)
+        return summarize(np.concatenate([main.prices[idx], d_prices[in_delta]]))
+
+    def overall_items(self):
+        return list(self._overall.items())
+
+    def stats(self):
+        state = self._state
+        return {
+            "ready": state is not None,
+            "configured": self.configured,
+            "offers": len(state[1]) if state else 0,
+            "delta_offers": len(state[2]) if state else 0,
+            "groups": len(self._overall),
+            "room_types": len(self._room_types),
+            "full_builds": self.full_builds,
+            "incremental_updates": self.incremental_updates,
+            "merges": self.merges,
+        }
+
+
+book = OfferBook()
+_build_lock = threading.Lock()
+
+
+def ensure_ready():
+    if not book.ready:
+        with _build_lock:
+            if not book.ready:
+                book.rebuild()
+
+
+def start_refresher():
+    background.every("prices-refresh", lambda: _setting("PRICE_REFRESH_INTERVAL", 60), _refresh)
+
+
+def _refresh():
+    with _build_lock:
+        book.refresh()
+
+
+def on_offer_saved(sender, instance, **kwargs):
+    book.upsert_many([(
+        instance.id, instance.room_type_id, instance.currency,
+        instance.price_per_night, instance.available_from, instance.available_to,
+    )])
+
+
+def on_offer_deleted(sender, instance, **kwargs):
+    book.remove(instance.id)
+
+
+def nightly_price(city_id, currency=None, checkin=None, checkout=None):
+    """Prix médian par nuit (dates du séjour si connues), None sans données"""
+    currency = currency or _setting("PRICE_DEFAULT_CURRENCY", "TND")
+    if city_id is None:
+        return None
+    stats = book.quote(city_id, currency, checkin, checkout) if checkin else book.city_prices(city_id, currency)
+    return stats["median"] if stats else None
@@ -0,0 +1,214 @@
+"""
+Collecte concurrente des offres auprès des fournisseurs (TripAdvisor, Booking...).
+
+Chaque fournisseur est une classe OfferProvider enregistrée dans le registre
+(voir api/offer_providers.py) avec son propre timeout, sa limite de concurrence
+et son disjoncteur. Tous les fournisseurs actifs partent en même temps sur un
+pool de threads partagé ; on garde ce qui est arrivé avant l'échéance. Les
+retardataires non démarrés sont annulés, les autres ignorés (leur résultat
+est jeté mais leur latence est quand même mesurée).
+"""
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+from django.conf import settings
+from django.db import connections
+
+from . import metrics
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "PROVIDER_WORKERS", 16),
+    thread_name_prefix="provider",
+)
+
+
+# -----------------------------
+# DISJONCTEUR
+# -----------------------------
+class CircuitBreaker:
+    """
+    closed : appels normaux. Après failure_threshold échecs consécutifs -> open.
+    open : appels refusés sans attendre pendant reset_timeout secondes.
+    half_open : un seul appel d'essai ; succès -> closed, échec -> open.
+    """
+
+    def __init__(self, failure_threshold=3, reset_timeout=30):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = "closed"
+        self.failures = 0
+        self.opened_at = 0
+        self._probing = False
+        self._lock = threading.Lock()
+
+    def allow(self):
+        with self._lock:
+            if self.state == "closed":
+                return True
+            if self.state == "open" and time.monotonic() - self.opened_at >= self.reset_timeout:
+                self.state = "half_open"
+            if self.state == "half_open" and not self._probing:
+                self._probing = True
+                return True
+            return False
+
+    def record_success(self):
+        with self._lock:
+            self.state = "closed"
+            self.failures = 0
+            self._probing = False
+
+    def record_failure(self):
+        with self._lock:
+            self.failures += 1
+            self._probing = False
+            if self.state == "half_open" or self.failures >= self.failure_threshold:
+                self.state = "open"
+                self.opened_at = time.monotonic()
+
+
+# -----------------------------
+# FOURNISSEURS
+# -----------------------------
+class OfferProvider:
+    """
+    Interface commune des fournisseurs d'offres.
+    Les sous-classes définissent name (sans point, sert de clé de métrique)
+    et fetch(query) qui lève une exception en cas d'échec.
+    """
+    name = None
+    timeout = 5            # secondes, borné par l'échéance globale
+    max_concurrency = 4    # appels simultanés max (au-delà : fournisseur sauté)
+    failure_threshold = 3
+    reset_timeout = 30
+
+    def __init__(self):
+        self.breaker = CircuitBreaker(self.failure_threshold, self.reset_timeout)
+        self._slots = threading.BoundedSemaphore(self.max_concurrency)
+
+    def fetch(self, query):
+        """
+        Args:
+            query: dict avec destination, budget, personnes
+        Returns:
+            list: offres au format des annonces
+        """
+        raise NotImplementedError
+
+    def _call(self, query):
+        started = time.monotonic()
+        try:
+            return self.fetch(query)
+        finally:
+            # Thread du pool, hors requête : rendre la connexion éventuelle
+            connections.close_all()
+            self._slots.release()
+            metrics.observe(f"provider.{self.name}", time.monotonic() - started)
+
+
+_registry = {}
+
+
+def register(provider_class):
+    """Décorateur : enregistre une instance du fournisseur"""
+    _registry[provider_class.name] = provider_class()
+    return provider_class
+
+
+def active_providers():
+    """Fournisseurs activés (settings.OFFER_PROVIDERS, tous par défaut), dans l'ordre"""
+    names = getattr(settings, "OFFER_PROVIDERS", None)
+    if names is None:
+        return list(_registry.values())
+    return [_registry[name] for name in names if name in _registry]
+
+
+def collect(query, deadline=None):
+    """
+    Interroge les fournisseurs actifs en parallèle.
+
+    Args:
+        query: dict avec destination, budget, personnes
+        deadline: attente max en secondes (settings.PROVIDER_DEADLINE par défaut)
+
+    Returns:
+        list: [(nom, offres)] dans l'ordre du registre, pour les fournisseurs
+        terminés à temps et sans erreur
+    """
+    if deadline is None:
+        deadline = getattr(settings, "PROVIDER_DEADLINE", 8)
+
+    started = time.monotonic()
+    pending = {}
+    order = []
+    for provider in active_providers():
+        metrics.incr(f"provider.{provider.name}.calls")
+        # Fournisseur saturé ou disjoncteur ouvert : coût nul, on passe.
+        # L'emplacement d'abord : en half_open, allow() réserve l'unique appel
+        # d'essai, qui doit alors vraiment partir (sinon le disjoncteur reste bloqué)
+        if not provider._slots.acquire(blocking=False):
+            metrics.incr(f"provider.{provider.name}.skipped_busy")
+            continue
+        if not provider.breaker.allow():
+            provider._slots.release()
+            metrics.incr(f"provider.{provider.name}.skipped_open")
+            continue
+        future = _executor.submit(provider._call, query)
+        pending[future] = (provider, started + min(provider.timeout, deadline))
+        order.append(future)
+
+    results = {}
+    while pending:
+        now = time.monotonic()
+        for future, (provider, expires_at) in list(pending.items()):
+            if future.done():
+                continue
+            if now >= expires_at:
+                del pending[future]
+                if future.cancel():
+                    # Jamais démarré : _call ne rendra pas l'emplacement
+                    provider._slots.release()
+                provider.breaker.record_failure()
+                metrics.incr(f"provider.{provider.name}.late")
+                print(f"⏱️ {provider.name}: pas de réponse à temps, ignoré")
+        done = [future for future in pending if future.done()]
+        if not done and pending:
+            next_expiry = min(expires_at for _, expires_at in pending.values())
+            done, _ = wait(list(pending), timeout=max(0, next_expiry - now), return_when=FIRST_COMPLETED)
+        for future in done:
+            provider, _ = pending.pop(future)
+            try:
+                results[future] = (provider.name, future.result())
+                provider.breaker.record_success()
+                metrics.incr(f"provider.{provider.name}.success")
+            except Exception as e:
+                provider.breaker.record_failure()
+                metrics.incr(f"provider.{provider.name}.failure")
+                print(f"❌ Erreur {provider.name}: {e}")
+
+    return [results[future] for future in order if future in results]
+
+
+def stats():
+    """Taux de succès, latences et état du disjoncteur par fournisseur"""
+    snapshot = metrics.snapshot()
+    counters, timings = snapshot["counters"], snapshot["timings_ms"]
+    result = {}
+    for name, provider in _registry.items():
+        calls = counters.get(f"provider.{name}.calls", 0)
+        success = counters.get(f"provider.{name}.success", 0)
+        failure = counters.get(f"provider.{name}.failure", 0)
+        late = counters.get(f"provider.{name}.late", 0)
+        result[name] = {
+            "calls": calls,
+            "success": success,
+            "failure": failure,
+            "late": late,
+            "skipped_open": counters.get(f"provider.{name}.skipped_open", 0),
+            "skipped_busy": counters.get(f"provider.{name}.skipped_busy", 0),
+            "success_rate": round(success / (success + failure + late), 4) if success + failure + late else None,
+            "latency_ms": timings.get(f"provider.{name}"),
+            "breaker": provider.breaker.state,
+        }
+    return result
@@ -0,0 +1,412 @@
+"""
+Moteur de recommandations : classement des destinations pour un utilisateur.
+
+Les caractéristiques par ville sont précalculées en mémoire (tableaux NumPy) :
+nombre d'attractions par catégorie, prix médian des chambres par devise, et
+pour chaque destination sa ville, sa popularité et son niveau de prix. Une
+recommandation n'est alors qu'un calcul vectoriel sur tout le catalogue
+(intérêts, budget, popularité) suivi d'un tri partiel (argpartition) des K
+meilleurs.
+
+Rafraîchissement incrémental (thread de fond, voir background.py) : par
+table, rien si (nombre de lignes, id max) n'a pas bougé ; seules les lignes
+ajoutées sont lues si la table n'a fait que grandir ; sinon la partie
+concernée est recalculée. Les villes modifiées via l'ORM (signaux) sont
+recalculées au tour suivant.
+
+Prix médians : repris des agrégats de prix (prices.py) à chaque nouvelle
+version ; sans offre pour la ville, le budget est estimé à partir de
+avg_price_level.
+"""
+import json
+import threading
+import time
+
+import numpy as np
+from django.conf import settings
+from django.db.models import Count
+
+from gazetteer import INTEREST_KEYWORDS, Gazetteer, fold
+
+from . import background, metrics, prices
+from .models import Attraction, Destination, UserPreference
+
+# Poids des composantes du score
+WEIGHTS = {"interests": 0.5, "budget": 0.3, "popularity": 0.2}
+
+# Mots (repliés) reconnus dans les catégories d'attractions, par intérêt
+INTEREST_CATEGORIES = {
+    "plage": ("plage", "beach", "mer", "sea", "baignade", "snorkel", "plongee", "diving"),
+    "culture": ("culture", "musee", "museum", "monument", "histoire", "history", "patrimoine",
+                "heritage", "art", "medina", "archeologie", "archeologique", "archaeology",
+                "archaeological", "religion", "religieux", "religious", "theatre"),
+    "nature": ("nature", "parc", "park", "randonnee", "hiking", "montagne", "mountain",
+               "jardin", "garden", "desert", "lac", "lake", "foret", "forest"),
+    "aventure": ("aventure", "adventure", "sport", "quad", "surf", "escalade", "climbing", "safari"),
+    "ville": ("ville", "city", "shopping", "souk", "marche", "market", "nightlife", "restaurant"),
+}
+
+
+
+def build_interest_gazetteer():
+    gazetteer = Gazetteer()
+    for interest, words in INTEREST_CATEGORIES.items():
+        for word in words:
+            gazetteer.add(word, "interest", interest)
+    return gazetteer.build()
+
+
+# Automate des mots-clés de INTEREST_CATEGORIES (valeur : l'intérêt), construit une fois
+INTEREST_GAZETTEER = build_interest_gazetteer()
+
+# Intérêts libres (hors INTEREST_CATEGORIES) dont la colonne est gardée par instantané
+MAX_FREE_INTERESTS = 256
+
+# Attractions d'une catégorie à partir desquelles l'intérêt est quasi couvert
+ATTRACTION_SATURATION = 5.0
+
+# Niveau de prix (avg_price_level) -> ordre de grandeur du prix par nuit,
+# utilisé quand la ville n'a pas d'offre dans la devise de l'utilisateur
+PRICE_LEVEL_NIGHTLY = {1: 40, 2: 80, 3: 150, 4: 300, 5: 500}
+
+
+def _setting(name, default):
+    return getattr(settings, name, default)
+
+
+class Features:
+    """Instantané figé des caractéristiques, partagé par les recherches"""
+
+    def __init__(self, city_ids, categories, counts, medians, dest_ids, dest_cities, dest_popularity, dest_level_prices):
+        self.city_ids = city_ids  # np.int64 (n_villes)
+        self.categories = categories  # noms repliés (n_catégories)
+        self.counts = counts  # float (n_villes, n_catégories)
+        self.medians = medians  # devise -> float (n_villes), NaN sans offre
+        self.dest_ids = dest_ids  # np.int64 (n_destinations)
+        self.dest_cities = dest_cities  # ligne de ville de chaque destination
+        self.dest_popularity = dest_popularity  # popularité / max, 0 si inconnue
+        self.dest_level_prices = dest_level_prices  # prix indicatif du niveau de prix, NaN si inconnu
+        # Colonnes d'interest_matrix, calculées au premier usage (instantané figé)
+        self._interest_columns = None
+        self._free_columns = {}
+
+    def _known_columns(self):
+        """Intérêt de INTEREST_CATEGORIES -> colonne (n_catégories), en un passage"""
+        columns = self._interest_columns
+        if columns is None:
+            columns = {interest: np.zeros(len(self.categories)) for interest in INTEREST_CATEGORIES}
+            for row, category in enumerate(self.categories):
+                for interest in INTEREST_GAZETTEER.values(category, "interest"):
+                    columns[interest][row] = 1.0
+            self._interest_columns = columns
+        return columns
+
+    def _free_column(self, word):
+        column = self._free_columns.get(word)
+        if column is None:
+            keywords = Gazetteer()
+            keywords.add(word, "interest", word)
+            keywords.build()
+            column = np.array([1.0 if keywords.values(category, "interest") else 0.0 for category in self.categories])
+            if len(self._free_columns) < MAX_FREE_INTERESTS:
+                self._free_columns[word] = column
+        return column
+
+    def interest_matrix(self, interests):
+        """
+        (n_catégories, n_intérêts) : 1 si un mot-clé de l'intérêt apparaît comme
+        mot entier dans la catégorie (même règle que le gazetteer : "lac" ne
+        correspond pas à "place", ni "park" à "parking").
+        """
+        known = self._known_columns()
+        matrix = np.zeros((len(self.categories), len(interests)))
+        for column, interest in enumerate(interests):
+            interest = INTEREST_KEYWORDS.get(interest, interest)
+            matrix[:, column] = known[interest] if interest in known else self._free_column(interest)
+        return matrix
+
+
+class Recommender:
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.features = None
+        self._versions = {}
+        self._dirty_cities = set()
+        self._destinations_dirty = False
+        self._built_at = 0.0
+        # Sources brutes conservées pour les mises à jour incrémentales
+        self._city_ids = np.empty(0, dtype=np.int64)
+        self._categories = []
+        self._counts = np.zeros((0, 0))
+        self._medians = {}
+        self._destinations = None
+        self._prices_version = None
+        self.full_builds = 0
+        self.incremental_updates = 0
+
+    @property
+    def ready(self):
+        return self.features is not None
+
+    # -- chargement ---------------------------------------------------------
+
+    def _load_destinations(self):
+        rows = list(Destination.objects.values_list("id", "city_id", "popularity_score", "avg_price_level"))
+        self._destinations = rows
+        self._city_ids = np.array(sorted({city_id for _, city_id, _, _ in rows}), dtype=np.int64)
+
+    def _row_of(self):
+        return {int(c): i for i, c in enumerate(self._city_ids)}
+
+    def _count_attractions(self, city_ids=None):
+        """Comptes (ville, catégorie) : une requête GROUP BY"""
+        qs = Attraction.objects.exclude(category__isnull=True)
+        if city_ids is not None:
+            qs = qs.filter(city_id__in=list(city_ids))
+        return qs.values_list("city_id", "category").annotate(n=Count("id"))
+
+    def _apply_counts(self, rows, reset_cities=None):
+        """Ajoute des comptes (city_id, catégorie, n) ; reset_cities remis à zéro d'abord"""
+        row_of = self._row_of()
+        if reset_cities is not None:
+            for city_id in reset_cities:
+                if city_id in row_of:
+                    self._counts[row_of[city_id]] = 0
+        column_of = {category: j for j, category in enumerate(self._categories)}
+        for city_id, category, n in rows:
+            row = row_of.get(city_id)
+            if row is None:
+                continue
+            category = fold(category).strip()
+            column = column_of.get(category)
+            if column is None:
+                column = column_of[category] = len(self._categories)
+                self._categories.append(category)
+                self._counts = np.hstack([self._counts, np.zeros((len(self._city_ids), 1))])
+            self._counts[row, column] += n
+
+    def _rebuild_counts(self):
+        self._categories = []
+        self._counts = np.zeros((len(self._city_ids), 0))
+        self._apply_counts(self._count_attractions())
+
+    def _rebuild_medians(self):
+        """Médianes par devise, alignées sur les villes, depuis les agrégats de prix"""
+        self._prices_version = prices.book.version
+        row_of = self._row_of()
+        medians = {}
+        for (city_id, currency), stats in prices.book.overall_items():
+            row = row_of.get(city_id)
+            if row is not None:
+                medians.setdefault(currency, np.full(len(self._city_ids), np.nan))[row] = stats["median"]
+        self._medians = medians
+
+    def rebuild(self):
+        """Recalcul complet (catalogue, attractions, médianes)"""
+        started = time.perf_counter()
+        versions = {
+            "destinations": background.table_version(Destination.objects.all()),
+            "attractions": background.table_version(Attraction.objects.all()),
+        }
+        with self._lock:
+            self._dirty_cities.clear()
+            self._destinations_dirty = False
+        self._load_destinations()
+        self._rebuild_counts()
+        self._rebuild_medians()
+        self._versions = versions
+        self._built_at = time.time()
+        self._publish()
+        self.full_builds += 1
+        metrics.observe("recommender.rebuild", time.perf_counter() - started)
+        print(f"🎯 Recommandations: {len(self._destinations)} destinations, {len(self._city_ids)} villes")
+
+    def refresh(self):
+        """
+        Mise à jour incrémentale (appelée par le thread de fond). Reconstruction
+        complète après RECO_FULL_REBUILD_INTERVAL (modifications faites hors de
+        l'ORM).
+        """
+        if self.features is None or time.time() - self._built_at > _setting("RECO_FULL_REBUILD_INTERVAL", 3600):
+            self.rebuild()
+            return
+        changed = False
+        with self._lock:
+            destinations_dirty, self._destinations_dirty = self._destinations_dirty, False
+
+        version = background.table_version(Destination.objects.all())
+        if destinations_dirty or version != self._versions["destinations"]:
+            # Catalogue : quelques milliers de lignes, relu en entier ;
+            # les comptes des villes connues sont conservés
+            old_rows, old_counts = self._row_of(), self._counts
+            self._load_destinations()
+            new_cities = [int(c) for c in self._city_ids if int(c) not in old_rows]
+            keep = [old_rows.get(int(c), -1) for c in self._city_ids]
+            self._counts = np.vstack([old_counts, np.zeros((1, old_counts.shape[1]))])[keep]
+            if new_cities:
+                self._apply_counts(self._count_attractions(new_cities))
+            self._rebuild_medians()
+            self._versions["destinations"] = version
+            changed = True
+
+        version = background.table_version(Attraction.objects.all())
+        known_count, known_max = self._versions["attractions"]
+        if version != (known_count, known_max):
+            added = list(Attraction.objects.filter(id__gt=known_max).values_list("city_id", "category"))
+            if version[0] - known_count == len(added):
+                self._apply_counts((city_id, category, 1) for city_id, category in added if category)
+            else:
+                self._rebuild_counts()
+            self._versions["attractions"] = version
+            changed = True
+
+        if prices.book.version != self._prices_version:
+            self._rebuild_medians()
+            changed = True
+
+        with self._lock:
+            dirty, self._dirty_cities = self._dirty_cities, set()
+        if dirty:
+            self._apply_counts(self._count_attractions(dirty), reset_cities=dirty)
+            changed = True
+
+        if changed:
+            self._publish()
+            self.incremental_updates += 1
+
+    def mark_dirty(self, city_id=None, destinations=False):
+        """Ville à recalculer et/ou catalogue à relire au prochain rafraîchissement"""
+        with self._lock:
+            if city_id is not None:
+                self._dirty_cities.add(city_id)
+            self._destinations_dirty = self._destinations_dirty or destinations
+
+    def _publish(self):
+        row_of = self._row_of()
+        rows = self._destinations
+        popularity = np.array([float(p) if p is not None else 0.0 for _, _, p, _ in rows])
+        top = popularity.max() if len(popularity) else 0.0
+        self.features = Features(
+            city_ids=self._city_ids.copy(),
+            categories=list(self._categories),
+            counts=self._counts.copy(),
+            medians={currency: m.copy() for currency, m in self._medians.items()},
+            dest_ids=np.array([d for d, _, _, _ in rows], dtype=np.int64),
+            dest_cities=np.array([row_of[c] for _, c, _, _ in rows], dtype=np.int64),
+            dest_popularity=popularity / top if top > 0 else popularity,
+            dest_level_prices=np.array([PRICE_LEVEL_NIGHTLY.get(level, np.nan) for _, _, _, level in rows], dtype=np.float64),
+        )
+
+    # -- classement ---------------------------------------------------------
+
+    def scores(self, features, interests, currency, min_budget, max_budget):
+        """Score de chaque destination du catalogue (tableau aligné sur dest_ids)"""
+        n = len(features.dest_ids)
+
+        if interests and features.categories:
+            matches = features.counts @ features.interest_matrix(interests)  # (villes, intérêts)
+            coverage = 1.0 - np.exp(-matches / ATTRACTION_SATURATION)
+            interest_score = coverage.mean(axis=1)[features.dest_cities]
+        else:
+            interest_score = np.full(n, 0.5)
+
+        budget_score = np.full(n, 0.5)
+        if max_budget:
+            medians = features.medians.get((currency or "").upper())
+            price = medians[features.dest_cities] if medians is not None else np.full(n, np.nan)
+            price = np.where(np.isnan(price), features.dest_level_prices, price)
+            low = float(min_budget or 0)
+            high = float(max_budget)
+            fit = np.where(price > high, np.exp(-(price - high) / high), np.where(price < low, 0.8, 1.0))
+            budget_score = np.where(np.isnan(price), 0.5, fit)
+
+        return (
+            WEIGHTS["interests"] * interest_score
+            + WEIGHTS["budget"] * budget_score
+            + WEIGHTS["popularity"] * features.dest_popularity
+        )
+
+    def recommend(self, interests=(), currency=None, min_budget=None, max_budget=None, k=10):
+        """[(destination_id, score)] des k meilleures destinations"""
+        features = self.features
+        if features is None or not len(features.dest_ids):
+            return []
+        started = time.perf_counter()
+        scores = self.scores(features, list(interests), currency, min_budget, max_budget)
+        k = min(k, len(scores))
+        # Tri partiel : seuls les k meilleurs sont ordonnés
+        top = np.argpartition(-scores, k - 1)[:k]
+        top = top[np.argsort(-scores[top], kind="stable")]
+        metrics.observe("recommender.rank", time.perf_counter() - started)
+        return [(int(features.dest_ids[i]), round(float(scores[i]), 4)) for i in top]
+
+    def stats(self):
+        features = self.features
+        return {
+            "ready": features is not None,
+            "destinations": len(features.dest_ids) if features else 0,
+            "cities": len(features.city_ids) if features else 0,
+            "categories": len(features.categories) if features else 0,
+            "currencies": sorted(features.medians) if features else [],
+            "full_builds": self.full_builds,
+            "incremental_updates": self.incremental_updates,
+        }
+
+
+engine = Recommender()
+_build_lock = threading.Lock()
+
+
+def ensure_ready():
+    if not engine.ready:
+        with _build_lock:
+            if not engine.ready:
+                engine.rebuild()
+
+
+def start_refresher():
+    background.every("recommender-refresh", lambda: _setting("RECO_REFRESH_INTERVAL", 60), _refresh)
+
+
+def _refresh():
+    with _build_lock:
+        engine.refresh()
+
+
+def on_source_changed(sender, instance, **kwargs):
+    """Signal post_save / post_delete sur Attraction ou Destination"""
+    engine.mark_dirty(getattr(instance, "city_id", None), destinations=sender is Destination)
+
+
+def interest_list(value):
+    """
+    Intérêts enregistrés (colonne JSON) sous forme de liste : une chaîne JSON
+    (valeur doublement encodée) est décodée ; tout ce qui n'est pas une liste
+    est ignoré plutôt que parcouru caractère par caractère.
+    """
+    if isinstance(value, str):
+        try:
+            value = json.loads(value)
+        except ValueError:
+            return []
+    return value if isinstance(value, list) else []
+
+
+def recommend_for_user(user_id, k=10):
+    """
+    [(destination_id, score)] pour un utilisateur ; sans préférences
+    enregistrées, classement par popularité seule.
+    """
+    ensure_ready()
+    pref = UserPreference.objects.filter(user_id=user_id).first() if user_id is not None else None
+    if pref is None:
+        return engine.recommend(k=k)
+    interests = [fold(i).strip() for i in interest_list(pref.interests) if isinstance(i, str) and i.strip()]
+    return engine.recommend(
+        interests=interests,
+        currency=pref.currency,
+        min_budget=pref.min_budget,
+        max_budget=pref.max_budget,
+        k=k,
+    )
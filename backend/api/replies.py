@@ -0,0 +1,76 @@
+"""
+Réponses du chat générées sans LLM.
+
+Tout ce que dirait le résumé Llama (destination, budget, durée, personnes,
+nombre d'offres) est déjà connu : la réponse par défaut est un gabarit tiré
+parmi plusieurs formulations. Le choix dépend du message (seed) pour qu'une
+même demande reçoive toujours la même réponse.
+"""
+import hashlib
+
+WITH_DESTINATION = [
+    "Super choix ! Je te propose des pistes pour {destination}. "
+    "Budget ~{budget} DT/nuit, {sejour}. J'ai listé {offres}; dis-moi tes dates pour affiner.",
+
+    "{destination}, excellente idée ! Pour {sejour} avec ~{budget} DT/nuit, "
+    "voici {offres}. Donne-moi tes dates et je cible mieux.",
+
+    "Voilà ce que j'ai trouvé pour {destination} : {offres} autour de {budget} DT/nuit, "
+    "{sejour}. Tu as des dates en tête ?",
+
+    "Bonne nouvelle pour {destination} ! {Offres} pour {sejour}, "
+    "budget ~{budget} DT/nuit. Précise tes dates ou ton quartier préféré pour affiner.",
+
+    "Cap sur {destination} ! J'ai rassemblé {offres} ({sejour}, ~{budget} DT/nuit). "
+    "Dis-moi ce qui compte le plus pour toi : prix, emplacement ou confort ?",
+]
+
+NO_OFFERS = [
+    "Je n'ai pas encore d'offres pour {destination} avec ~{budget} DT/nuit. "
+    "Essaie d'ajuster le budget ou les dates, je relance la recherche.",
+
+    "Rien de disponible pour {destination} pour l'instant ({sejour}). "
+    "Un budget un peu plus large ou d'autres dates ?",
+]
+
+WITHOUT_DESTINATION = [
+    "J'ai listé des liens utiles pour commencer ta recherche. "
+    "Dis-moi une destination, des dates et un budget pour cibler les résultats.",
+
+    "Pour te proposer des offres précises, indique-moi où tu veux partir, "
+    "quand, et ton budget par nuit.",
+
+    "Tu penses à quelle destination ? Avec tes dates et ton budget, "
+    "je te trouve des options adaptées.",
+]
+
+
+def _pick(variants, seed):
+    digest = hashlib.md5(str(seed).encode("utf-8")).digest()
+    return variants[digest[0] % len(variants)]
+
+
+def _plural(n, singular, plural):
+    return f"{n} {singular if n == 1 else plural}"
+
+
+def build_reply(destination, budget, duree, personnes, nb_offres, seed=None):
+    """
+    Réponse friendly à partir des préférences normalisées.
+    seed: texte qui fixe la formulation (le message utilisateur en général)
+    """
+    if seed is None:
+        seed = f"{destination}|{budget}|{duree}|{personnes}"
+    if not destination:
+        return _pick(WITHOUT_DESTINATION, seed)
+
+    offres = _plural(nb_offres, "option", "options")
+    values = {
+        "destination": destination,
+        "budget": budget,
+        "sejour": f"{_plural(duree, 'nuit', 'nuits')} pour {_plural(personnes, 'personne', 'personnes')}",
+        "offres": offres,
+        "Offres": offres[0].upper() + offres[1:],
+    }
+    variants = WITH_DESTINATION if nb_offres else NO_OFFERS
+    return _pick(variants, seed).format(**values)
@@ -0,0 +1,109 @@
+"""
+Single-flight : les appels concurrents de même clé partagent une seule exécution.
+
+Le premier appelant exécute la fonction, les suivants attendent son résultat
+(ou son exception) au lieu de relancer le même travail.
+"""
+import asyncio
+import threading
+
+from . import metrics
+
+
+class _Call:
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """
+    Args:
+        name: préfixe des métriques (name.executions / name.coalesced)
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._lock = threading.Lock()
+        self._calls = {}
+
+    def do(self, key, fn):
+        """Exécute fn() une seule fois pour tous les appelants concurrents de key"""
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+
+        if not leader:
+            metrics.incr(f"{self.name}.coalesced")
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+
+        metrics.incr(f"{self.name}.executions")
+        try:
+            call.result = fn()
+            return call.result
+        except Exception as e:
+            call.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+
+    def in_flight(self, key):
+        with self._lock:
+            return key in self._calls
+
+    def stats(self):
+        return flight_stats(self.name)
+
+
+class AsyncSingleFlight:
+    """
+    Variante asyncio (vues ASGI) : les coroutines concurrentes de même clé
+    attendent la même exécution. Partage les métriques d'un SingleFlight de
+    même nom.
+
+    L'exécution est une tâche à part, attendue via asyncio.shield : l'annulation
+    d'un appelant (client déconnecté), meneur compris, n'annule que son attente
+    et pas celle des autres.
+    """
+
+    def __init__(self, name):
+        self.name = name
+        self._calls = {}
+
+    async def do(self, key, coro_fn):
+        loop = asyncio.get_running_loop()
+        call_key = (id(loop), key)
+        task = self._calls.get(call_key)
+        if task is not None:
+            metrics.incr(f"{self.name}.coalesced")
+        else:
+            metrics.incr(f"{self.name}.executions")
+            task = self._calls[call_key] = asyncio.ensure_future(coro_fn())
+            task.add_done_callback(lambda done: self._forget(call_key, done))
+        return await asyncio.shield(task)
+
+    def _forget(self, call_key, task):
+        if self._calls.get(call_key) is task:
+            del self._calls[call_key]
+        if not task.cancelled():
+            task.exception()  # marquée lue même si tous les appelants sont partis
+
+
+def flight_stats(name):
+    """Exécutions réelles vs appels mutualisés pour le préfixe name"""
+    executions = metrics.get(f"{name}.executions")
+    coalesced = metrics.get(f"{name}.coalesced")
+    total = executions + coalesced
+    return {
+        "executions": executions,
+        "coalesced": coalesced,
+        "coalesce_rate": round(coalesced / total, 4) if total else None,
+    }
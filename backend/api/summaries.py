@@ -0,0 +1,58 @@
+"""
+Résumés Llama générés en arrière-plan.
+
+En mode "async", le chat répond tout de suite avec le gabarit et lance le
+résumé Llama ici ; le client le récupère ensuite sur
+GET /api/chat/summary/<id>/ (pending -> ready / failed).
+"""
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import metrics
+
+_executor = ThreadPoolExecutor(
+    max_workers=getattr(settings, "LLM_SUMMARY_WORKERS", 2),
+    thread_name_prefix="summary",
+)
+
+
+def _key(summary_id):
+    return f"llm_summary:{summary_id}"
+
+
+def _ttl():
+    return getattr(settings, "LLM_SUMMARY_TTL", 300)
+
+
+def start(generate):
+    """
+    Lance generate() (-> texte ou None) en arrière-plan.
+    Retourne l'identifiant à interroger.
+    """
+    summary_id = uuid.uuid4().hex
+    cache.set(_key(summary_id), {"status": "pending"}, _ttl())
+
+    def run():
+        try:
+            text = generate()
+        except Exception as e:
+            print(f"❌ Erreur résumé Llama: {e}")
+            text = None
+        if text:
+            metrics.incr("llm_summary.ready")
+            cache.set(_key(summary_id), {"status": "ready", "ai_response": text}, _ttl())
+        else:
+            metrics.incr("llm_summary.failed")
+            cache.set(_key(summary_id), {"status": "failed"}, _ttl())
+
+    metrics.incr("llm_summary.started")
+    _executor.submit(run)
+    return summary_id
+
+
+def get(summary_id):
+    """État du résumé, None si inconnu ou expiré"""
+    return cache.get(_key(summary_id))
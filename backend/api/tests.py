@@ -1,3 +1,811 @@
-from django.test import TestCase
+import asyncio
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+from django.core.cache import caches
+from django.http import QueryDict
+from django.test import SimpleTestCase
+from django.utils.http import http_date
+from rest_framework.test import APIRequestFactory
+
+from . import (
+    background, catalog, geo, intent_cache, intent_rules, llama_backend, offer_cache, prices, providers, recommender,
+    replies, summaries, views,
+)
+from .apps import serving_process
+from .mysql_pool.pool import ConnectionPool, PoolTimeoutError
+from .singleflight import AsyncSingleFlight, SingleFlight
+
+
+class GazetteerRefreshTests(SimpleTestCase):
+    def tearDown(self):
+        intent_rules._gazetteer = intent_rules.DEFAULT_GAZETTEER
+        intent_rules._gazetteer_loaded = False
+
+    def test_refresh_adds_cities_and_request_path_only_reads(self):
+        with mock.patch.object(intent_rules.City.objects, "values_list", return_value=["Tabarka"]) as query:
+            intent_rules.refresh_gazetteer()
+            gazetteer = intent_rules.get_gazetteer()
+            intent_rules.get_gazetteer()
+        self.assertEqual(query.call_count, 1)
+        self.assertEqual(gazetteer.first("Un week-end à Tabarka", "destination"), "Tabarka")
+        self.assertEqual(intent_rules._refresh_interval(), intent_rules.settings.GAZETTEER_REFRESH_SECONDS)
+
+    def test_failed_refresh_keeps_current_gazetteer_and_retries_sooner(self):
+        with mock.patch.object(intent_rules.City.objects, "values_list", side_effect=RuntimeError("db down")):
+            intent_rules.refresh_gazetteer()
+        self.assertIs(intent_rules.get_gazetteer(), intent_rules.DEFAULT_GAZETTEER)
+        self.assertEqual(intent_rules._refresh_interval(), 60)
+
+
+class CircuitBreakerTests(SimpleTestCase):
+    def test_opens_after_threshold_then_probes_once(self):
+        breaker = providers.CircuitBreaker(failure_threshold=2, reset_timeout=0)
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "closed")
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+        # reset_timeout écoulé : un seul appel d'essai
+        self.assertTrue(breaker.allow())
+        self.assertEqual(breaker.state, "half_open")
+        self.assertFalse(breaker.allow())
+        breaker.record_success()
+        self.assertEqual(breaker.state, "closed")
+
+    def test_failed_probe_reopens(self):
+        breaker = providers.CircuitBreaker(failure_threshold=1, reset_timeout=60)
+        breaker.record_failure()
+        self.assertFalse(breaker.allow())
+        breaker.state, breaker.opened_at = "half_open", 0
+        self.assertTrue(breaker.allow())
+        breaker.record_failure()
+        self.assertEqual(breaker.state, "open")
+
+
+class _TestProvider(providers.OfferProvider):
+    max_concurrency = 1
+
+    def __init__(self, name, delay=0, error=None):
+        self.name = name
+        self.delay = delay
+        self.error = error
+        super().__init__()
+
+    def fetch(self, query):
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return [{"titre": self.name}]
+
+
+class CollectTests(SimpleTestCase):
+    def collect(self, *provider_list, deadline=1, workers=4):
+        registry = {p.name: p for p in provider_list}
+        executor = ThreadPoolExecutor(max_workers=workers)
+        self.addCleanup(executor.shutdown, wait=True)
+        with mock.patch.object(providers, "_registry", registry), \
+                mock.patch.object(providers, "_executor", executor), \
+                self.settings(OFFER_PROVIDERS=None):
+            return providers.collect({"destination": "Tunis"}, deadline=deadline)
+
+    def test_keeps_results_in_registry_order(self):
+        results = self.collect(_TestProvider("a", delay=0.05), _TestProvider("b"))
+        self.assertEqual([name for name, _ in results], ["a", "b"])
+
+    def test_late_and_failing_providers_are_dropped(self):
+        late = _TestProvider("late", delay=0.5)
+        failing = _TestProvider("failing", error=RuntimeError("boom"))
+        results = self.collect(_TestProvider("ok"), late, failing, deadline=0.1)
+        self.assertEqual(results, [("ok", [{"titre": "ok"}])])
+        self.assertEqual(late.breaker.failures, 1)
+        self.assertEqual(failing.breaker.failures, 1)
+
+    def test_busy_provider_is_skipped(self):
+        busy = _TestProvider("busy")
+        busy._slots.acquire()
+        self.assertEqual(self.collect(busy), [])
+        busy._slots.release()
+
+    def test_half_open_probe_survives_a_saturated_provider(self):
+        provider = _TestProvider("probe")
+        provider.breaker.record_failure()
+        provider.breaker.record_failure()
+        provider.breaker.record_failure()
+        provider.breaker.opened_at -= provider.breaker.reset_timeout
+        provider._slots.acquire()
+        self.assertEqual(self.collect(provider), [])
+        provider._slots.release()
+        # L'appel d'essai n'a pas été consommé par le passage saturé
+        self.assertEqual(self.collect(provider), [("probe", [{"titre": "probe"}])])
+        self.assertEqual(provider.breaker.state, "closed")
+
+    def test_open_breaker_does_not_hold_the_slot(self):
+        provider = _TestProvider("open")
+        provider.breaker.state, provider.breaker.opened_at = "open", time.monotonic()
+        self.assertEqual(self.collect(provider), [])
+        self.assertTrue(provider._slots.acquire(blocking=False))
+        provider._slots.release()
+
+    def test_cancelled_call_releases_its_slot(self):
+        # Un seul thread occupé par "slow" : "queued" n'a jamais démarré à l'échéance
+        slow, queued = _TestProvider("slow", delay=0.3), _TestProvider("queued")
+        self.collect(slow, queued, deadline=0.05, workers=1)
+        self.assertTrue(queued._slots.acquire(blocking=False))
+        queued._slots.release()
+
+
+class OfferCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches[offer_cache.CACHE_ALIAS].clear()
+
+    def test_fetch_uses_band_budget_shared_by_the_band(self):
+        budgets = []
+
+        def fetch(budget):
+            budgets.append(budget)
+            return [{"prix_par_nuit": budget}]
+
+        first = offer_cache.get_or_fetch("Sousse", 160, 2, fetch)
+        second = offer_cache.get_or_fetch("sousse ", 290, 2, fetch)
+        self.assertEqual(budgets, [300])
+        self.assertEqual(first, second)
+
+    def test_other_band_is_fetched_separately(self):
+        budgets = []
+        offer_cache.get_or_fetch("Sousse", 100, 2, lambda budget: budgets.append(budget) or [])
+        offer_cache.get_or_fetch("Sousse", 500, 2, lambda budget: budgets.append(budget) or [])
+        self.assertEqual(budgets, [150, 800])
+
+
+class SingleFlightTests(SimpleTestCase):
+    def test_concurrent_callers_share_one_execution(self):
+        flight = SingleFlight("test.flight.shared")
+        release = threading.Event()
+        calls = []
+
+        def work():
+            calls.append(1)
+            release.wait(5)
+            return "result"
+
+        results = []
+        threads = [threading.Thread(target=lambda: results.append(flight.do("k", work))) for _ in range(5)]
+        for thread in threads:
+            thread.start()
+        while not flight.in_flight("k"):
+            time.sleep(0.001)
+        time.sleep(0.05)
+        release.set()
+        for thread in threads:
+            thread.join(5)
+        self.assertEqual(len(calls), 1)
+        self.assertEqual(results, ["result"] * 5)
+        self.assertFalse(flight.in_flight("k"))
+        self.assertEqual(flight.stats()["coalesced"], 4)
+
+    def test_error_is_raised_and_not_cached(self):
+        flight = SingleFlight("test.flight.error")
+
+        def fail():
+            raise ValueError("boom")
+
+        with self.assertRaises(ValueError):
+            flight.do("k", fail)
+        self.assertEqual(flight.do("k", lambda: 42), 42)
+
+    def test_async_callers_share_one_execution(self):
+        flight = AsyncSingleFlight("test.flight.async")
+        calls = []
+
+        async def work():
+            calls.append(1)
+            await asyncio.sleep(0.01)
+            return "result"
+
+        async def main():
+            return await asyncio.gather(*(flight.do("k", work) for _ in range(3)))
+
+        self.assertEqual(asyncio.run(main()), ["result"] * 3)
+        self.assertEqual(len(calls), 1)
+
+    def test_cancelled_leader_does_not_fail_followers(self):
+        flight = AsyncSingleFlight("test.flight.cancel")
+
+        async def work():
+            await asyncio.sleep(0.05)
+            return "result"
+
+        async def main():
+            leader = asyncio.ensure_future(flight.do("k", work))
+            await asyncio.sleep(0)
+            follower = asyncio.ensure_future(flight.do("k", work))
+            await asyncio.sleep(0.01)
+            leader.cancel()
+            with self.assertRaises(asyncio.CancelledError):
+                await leader
+            return await follower
+
+        self.assertEqual(asyncio.run(main()), "result")
+
+    def test_async_error_reaches_every_caller(self):
+        flight = AsyncSingleFlight("test.flight.async_error")
+
+        async def work():
+            await asyncio.sleep(0.01)
+            raise ValueError("boom")
+
+        async def main():
+            return await asyncio.gather(flight.do("k", work), flight.do("k", work), return_exceptions=True)
+
+        self.assertTrue(all(isinstance(e, ValueError) for e in asyncio.run(main())))
+
+
+class ServingProcessTests(SimpleTestCase):
+    def serving(self, argv, mode="auto", run_main=""):
+        with self.settings(BACKGROUND_TASKS=mode), mock.patch("sys.argv", argv), \
+                mock.patch.dict("os.environ", {"RUN_MAIN": run_main}):
+            return serving_process()
+
+    def test_management_commands_do_not_start_tasks(self):
+        for command in ("migrate", "shell", "test", "collectstatic"):
+            self.assertFalse(self.serving(["manage.py", command]))
+
+    def test_runserver_starts_tasks_in_served_process_only(self):
+        self.assertFalse(self.serving(["manage.py", "runserver", "8001"]))
+        self.assertTrue(self.serving(["manage.py", "runserver", "8001"], run_main="true"))
+        self.assertTrue(self.serving(["manage.py", "runserver", "--noreload"]))
+
+    def test_wsgi_asgi_servers_start_tasks(self):
+        self.assertTrue(self.serving(["/usr/bin/gunicorn", "backend.wsgi"]))
+        self.assertTrue(self.serving(["/venv/lib/gunicorn/__main__.py", "backend.wsgi"]))
+
+    def test_explicit_setting_wins(self):
+        self.assertTrue(self.serving(["manage.py", "shell"], mode="1"))
+        self.assertFalse(self.serving(["/usr/bin/uvicorn", "backend.asgi:application"], mode="0"))
+
+
+class FakeConnection:
+    def __init__(self, alive=True):
+        self.alive = alive
+        self.closed = False
+
+    def ping(self):
+        if not self.alive:
+            raise RuntimeError("gone away")
+
+    def close(self):
+        self.closed = True
+
+
+class ConnectionPoolTests(SimpleTestCase):
+    def pool(self, **options):
+        self.opened = []
+
+        def connect():
+            self.opened.append(FakeConnection())
+            return self.opened[-1]
+        return ConnectionPool(connect, **options)
+
+    def test_returned_connection_is_reused(self):
+        pool = self.pool(max_size=2)
+        conn = pool.checkout()
+        pool.checkin(conn)
+        self.assertIs(pool.checkout(), conn)
+        self.assertEqual(len(self.opened), 1)
+        self.assertEqual(pool.stats()["reused"], 1)
+
+    def test_full_pool_times_out(self):
+        pool = self.pool(max_size=1, checkout_timeout=0.05)
+        pool.checkout()
+        with self.assertRaises(PoolTimeoutError):
+            pool.checkout()
+        self.assertEqual(pool.stats()["wait_timeouts"], 1)
+
+    def test_waiter_gets_connection_when_returned(self):
+        pool = self.pool(max_size=1, checkout_timeout=5)
+        conn = pool.checkout()
+        threading.Timer(0.05, pool.checkin, args=(conn,)).start()
+        self.assertIs(pool.checkout(), conn)
+
+    def test_broken_connection_frees_its_slot(self):
+        pool = self.pool(max_size=1, checkout_timeout=0.05)
+        conn = pool.checkout()
+        pool.checkin(conn, broken=True)
+        self.assertTrue(conn.closed)
+        self.assertIsNot(pool.checkout(), conn)
+
+    def test_dead_idle_connection_is_replaced_after_ping(self):
+        pool = self.pool(max_size=1, health_check_after=0)
+        conn = pool.checkout()
+        conn.alive = False
+        pool.checkin(conn)
+        self.assertIsNot(pool.checkout(), conn)
+        self.assertTrue(conn.closed)
+        self.assertEqual(pool.stats()["health_check_failures"], 1)
+
+    def test_expired_idle_connection_is_closed(self):
+        pool = self.pool(max_size=1, idle_timeout=0)
+        conn = pool.checkout()
+        pool.checkin(conn)
+        time.sleep(0.01)
+        self.assertIsNot(pool.checkout(), conn)
+        self.assertEqual(pool.stats()["expired"], 1)
+
+
+class ReleasingConnectionsTests(SimpleTestCase):
+    def test_connections_closed_after_call_even_on_error(self):
+        @background.releasing_connections
+        def work(fail):
+            if fail:
+                raise ValueError("boom")
+            return "ok"
+
+        with mock.patch.object(background.connections, "close_all") as close_all:
+            self.assertEqual(work(False), "ok")
+            with self.assertRaises(ValueError):
+                work(True)
+        self.assertEqual(close_all.call_count, 2)
+
+
+class CursorTests(SimpleTestCase):
+    def test_round_trip(self):
+        cursor = catalog.encode_cursor(Decimal("87.50"), 1234)
+        self.assertEqual(catalog.decode_cursor(cursor), (Decimal("87.50"), 1234))
+        self.assertNotIn("=", cursor)
+
+    def test_null_score_round_trip(self):
+        self.assertEqual(catalog.decode_cursor(catalog.encode_cursor(None, 7)), (None, 7))
+
+    def test_invalid_cursor(self):
+        for cursor in ("not-a-cursor", "W10", catalog.encode_cursor("abc", 1)):
+            with self.assertRaises(catalog.InvalidQuery):
+                catalog.decode_cursor(cursor)
+
+
+class CatalogVersionTests(SimpleTestCase):
+    T0 = datetime(2026, 1, 1, tzinfo=timezone.utc)
+
+    def version_reading(self, *states):
+        catalog_version = catalog.CatalogVersion()
+        read = mock.patch.object(catalog_version, "_read_state", side_effect=states)
+        return catalog_version, read
+
+    def test_state_cached_for_ttl_and_invalidated_by_signals(self):
+        state = (3, self.T0, self.T0)
+        catalog_version, read = self.version_reading(state, state)
+        with read as read_state, self.settings(CATALOG_VERSION_TTL=60):
+            first = catalog_version.current()
+            self.assertEqual(catalog_version.current(), first)
+            self.assertEqual(read_state.call_count, 1)
+            catalog_version.invalidate()
+            self.assertEqual(catalog_version.current(), first)
+            self.assertEqual(read_state.call_count, 2)
+        self.assertEqual(first, (state, self.T0.timestamp()))
+
+    def test_same_state_same_validators_in_every_process(self):
+        # Deux workers lisant la même base : mêmes ETag et Last-Modified
+        state = (3, self.T0, self.T0 - timedelta(days=1))
+        validators = []
+        for _ in range(2):
+            catalog_version, read = self.version_reading(state)
+            with read, mock.patch.object(catalog, "version", catalog_version):
+                validators.append(catalog.list_validators(QueryDict("limit=5")))
+        self.assertEqual(validators[0], validators[1])
+        self.assertEqual(validators[0][1], self.T0.timestamp())
+
+    def test_edit_or_city_rename_moves_last_modified(self):
+        later = self.T0 + timedelta(minutes=5)
+        catalog_version, read = self.version_reading((3, self.T0, self.T0), (3, later, self.T0), (3, later, later))
+        with read, self.settings(CATALOG_VERSION_TTL=0):
+            first, _ = catalog_version.current()
+            edited, edited_at = catalog_version.current()
+            renamed, renamed_at = catalog_version.current()
+        self.assertEqual(len({first, edited, renamed}), 3)
+        self.assertEqual((edited_at, renamed_at), (later.timestamp(), later.timestamp()))
+
+    def test_delete_changes_version_and_moves_last_modified_forward(self):
+        catalog_version, read = self.version_reading((3, self.T0, self.T0), (2, self.T0, self.T0))
+        with read, self.settings(CATALOG_VERSION_TTL=0):
+            first, _ = catalog_version.current()
+            second, changed_at = catalog_version.current()
+        self.assertNotEqual(first, second)
+        self.assertGreater(changed_at, self.T0.timestamp())
+
+
+class DestinationsListTests(SimpleTestCase):
+    def get(self, query="", **headers):
+        request = APIRequestFactory().get(f"/api/destinations/{query}", **headers)
+        return views.destinations_list(request)
+
+    def setUp(self):
+        self.state = (1, datetime(2026, 1, 1, tzinfo=timezone.utc), None)
+        self.version = catalog.CatalogVersion()
+        self.version._read_state = lambda: self.state
+        patches = [
+            mock.patch.object(catalog, "version", self.version),
+            mock.patch.object(catalog, "list_destinations", return_value=([], "next")),
+        ]
+        for patch in patches:
+            patch.start()
+            self.addCleanup(patch.stop)
+
+    def test_page_has_validators(self):
+        response = self.get()
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response["ETag"])
+        self.assertTrue(response["Last-Modified"])
+        self.assertEqual(response["X-Next-Cursor"], "next")
+
+    def test_if_none_match_skips_page_query(self):
+        etag = self.get()["ETag"]
+        catalog.list_destinations.reset_mock()
+        response = self.get(HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response["ETag"], etag)
+        catalog.list_destinations.assert_not_called()
+
+    def test_if_modified_since_skips_page_query(self):
+        catalog.list_destinations.reset_mock()
+        _, changed_at = self.version.current()
+        response = self.get(HTTP_IF_MODIFIED_SINCE=http_date(changed_at + 1))
+        self.assertEqual(response.status_code, 304)
+        catalog.list_destinations.assert_not_called()
+
+    def test_other_query_or_new_version_is_served(self):
+        etag = self.get()["ETag"]
+        self.assertEqual(self.get("?limit=5", HTTP_IF_NONE_MATCH=etag).status_code, 200)
+        self.state = (2, self.state[1], None)
+        self.version.invalidate()
+        self.assertEqual(self.get(HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+
+class GeoIndexTests(SimpleTestCase):
+    CITIES = [(1, "Tunis", 36.8065, 10.1815), (2, "Sousse", 35.8256, 10.6084), (3, "Paris", 48.8566, 2.3522)]
+
+    def setUp(self):
+        self.index = geo.GeoIndex()
+        rows = mock.MagicMock()
+        rows.values_list.return_value.iterator.return_value = self.CITIES
+        with mock.patch.object(self.index, "_queryset", return_value=rows), \
+                mock.patch.object(geo.background, "table_version", return_value=(3, 3)):
+            self.index.rebuild()
+
+    def test_within_and_nearest(self):
+        found = self.index.within(36.8065, 10.1815, 200)
+        self.assertEqual([city_id for city_id, _ in found], [1, 2])
+        self.assertEqual(self.index.nearest(48.85, 2.35, k=1)[0][0], 3)
+
+    def test_locate_grid_and_delta(self):
+        city_id, lat, lng = self.index.locate("tunis")
+        self.assertEqual(city_id, 1)
+        self.assertAlmostEqual(lat, 36.8065)
+        self.index.upsert(2, "Sousse", 35.0, 10.0)
+        self.assertEqual(self.index.locate("SOUSSE")[1:], (35.0, 10.0))
+        self.index.remove(3)
+        self.assertIsNone(self.index.locate("Paris"))
+        self.assertIsNone(self.index.locate("Inconnue"))
+
+
+class InterestMatchingTests(SimpleTestCase):
+    def matrix(self, categories, interests):
+        features = recommender.Features(None, categories, None, None, None, None, None, None)
+        return features.interest_matrix(interests).tolist()
+
+    def test_whole_words_only(self):
+        categories = ["place", "quartier", "parking", "lac", "musees d'art", "parc national"]
+        self.assertEqual(
+            self.matrix(categories, ["nature", "culture"]),
+            [[0, 0], [0, 0], [0, 0], [1, 0], [0, 1], [1, 0]],
+        )
+
+    def test_free_text_interest(self):
+        self.assertEqual(self.matrix(["golf", "golfe"], ["golf"]), [[1], [0]])
+
+    def test_automaton_built_once_per_snapshot(self):
+        features = recommender.Features(None, ["plage", "musee", "golf"], None, None, None, None, None, None)
+        with mock.patch.object(recommender, "Gazetteer", wraps=recommender.Gazetteer) as gazetteer:
+            first = features.interest_matrix(["mer", "culture", "golf"])
+            second = features.interest_matrix(["golf", "plage"])
+        self.assertEqual(gazetteer.call_count, 1)  # "golf" seulement, une fois
+        self.assertEqual(first.tolist(), [[1, 0, 0], [0, 1, 0], [0, 0, 1]])
+        self.assertEqual(second.tolist(), [[0, 1], [0, 0], [1, 0]])
+
+    def test_interest_list(self):
+        self.assertEqual(recommender.interest_list(["plage", "culture"]), ["plage", "culture"])
+        self.assertEqual(recommender.interest_list('["plage"]'), ["plage"])
+        self.assertEqual(recommender.interest_list("plage"), [])
+        self.assertEqual(recommender.interest_list({"plage": 1}), [])
+        self.assertEqual(recommender.interest_list(None), [])
+
+
+class OfferBookTests(SimpleTestCase):
+    def setUp(self):
+        today = date.today()
+        self.first, self.last = today, today + timedelta(days=10)
+        # (id, room_type_id, devise, prix, du, au) ; room types 1, 2 -> ville 10, 3 -> ville 20
+        self.rows = [
+            (i, 1 + i % 3, "tnd", Decimal(50 + 10 * i), self.first, self.last) for i in range(1, 31)
+        ]
+        self.book = self.build(self.rows)
+
+    def build(self, rows, room_types=None):
+        book = prices.OfferBook()
+        objects = mock.MagicMock()
+        objects.filter.return_value.values_list.return_value.iterator.return_value = rows
+        mapping = mock.patch.object(prices, "room_type_cities", return_value={1: 10, 2: 10, 3: 20})
+        if room_types is not None:
+            mapping = mock.patch.object(prices, "room_type_cities", side_effect=room_types)
+        with mapping, mock.patch.object(prices.RoomOffer, "objects", objects), \
+                mock.patch.object(prices.background, "table_version", return_value=(len(rows), len(rows))):
+            book.rebuild()
+        return book
+
+    def expected(self, rows, city_rooms):
+        values = np.array([float(r[3]) for r in rows if r[1] in city_rooms])
+        return prices.summarize(values)
+
+    def test_aggregates_match_brute_force(self):
+        self.assertEqual(self.book.city_prices(10, "TND"), self.expected(self.rows, {1, 2}))
+        self.assertEqual(self.book.city_prices(20, "tnd"), self.expected(self.rows, {3}))
+        stay = self.book.quote(20, "TND", self.first + timedelta(days=2), self.first + timedelta(days=4))
+        self.assertEqual(stay, self.expected(self.rows, {3}))
+
+    def test_incremental_updates_recompute_touched_groups(self):
+        # Offre 3 (ville 20) déplacée vers la ville 10 avec un autre prix, offre 1 supprimée
+        self.book.upsert_many([(3, 1, "TND", Decimal(999), self.first, self.last)])
+        self.book.remove(1)
+        rows = [r for r in self.rows if r[0] not in (1, 3)] + [(3, 1, "TND", Decimal(999), self.first, self.last)]
+        self.assertEqual(self.book.city_prices(10, "TND"), self.expected(rows, {1, 2}))
+        self.assertEqual(self.book.city_prices(20, "TND"), self.expected(rows, {3}))
+        self.assertEqual(self.book.stats()["delta_offers"], 1)
+
+    def test_row_of_finds_offers_by_id(self):
+        main = self.book._main
+        for offer_id in (1, 17, 30):
+            self.assertEqual(int(main.ids[main.row_of(offer_id)]), offer_id)
+        self.assertIsNone(main.row_of(31))
+
+    def test_missing_mapping_is_reported(self):
+        book = self.build(self.rows, room_types=prices.ImproperlyConfigured(prices.NOT_CONFIGURED))
+        self.assertFalse(book.stats()["configured"])
+        self.assertIsNone(book.city_prices(10, "TND"))
+        with self.settings(ROOM_TYPE_CITY_SQL=""):
+            self.assertEqual([w.id for w in prices.check_room_type_mapping(None)], ["api.W001"])
+        with self.settings(ROOM_TYPE_CITY_SQL="SELECT 1, 1"):
+            self.assertEqual(prices.check_room_type_mapping(None), [])
+
+    def test_prices_endpoint_is_unavailable_without_mapping(self):
+        book = self.build(self.rows, room_types=prices.ImproperlyConfigured(prices.NOT_CONFIGURED))
+        request = APIRequestFactory().get("/api/prices/?city_id=10")
+        with mock.patch.object(prices, "book", book):
+            response = views.city_prices(request)
+        self.assertEqual(response.status_code, 503)
+
+
+class IntentCacheTests(SimpleTestCase):
+    def setUp(self):
+        caches[intent_cache.CACHE_ALIAS].clear()
+
+    def test_normalization(self):
+        self.assertEqual(intent_cache.normalize_message("  Hôtel  pas CHER\tà Paris "), "hotel pas cher a paris")
+        self.assertEqual(intent_cache.cache_key("Hôtel à PARIS"), intent_cache.cache_key(" hotel  a paris"))
+        self.assertNotEqual(intent_cache.cache_key("hotel a paris"), intent_cache.cache_key("hotel a rome"))
+
+    def test_miss_then_hit(self):
+        hits, misses = intent_cache.metrics.get("intent_cache.hits"), intent_cache.metrics.get("intent_cache.misses")
+        self.assertIsNone(intent_cache.lookup("Un hôtel à Sousse"))
+        intent_cache.store("Un hôtel à Sousse", {"destination": "Sousse"})
+        self.assertEqual(intent_cache.lookup("un hotel a sousse"), {"destination": "Sousse"})
+        self.assertEqual(intent_cache.metrics.get("intent_cache.misses"), misses + 1)
+        self.assertEqual(intent_cache.metrics.get("intent_cache.hits"), hits + 1)
+
+    def test_async_variants_share_entries(self):
+        async def main():
+            await intent_cache.astore("Djerba", {"destination": "Djerba"})
+            return await intent_cache.alookup(" DJERBA ")
+
+        self.assertEqual(asyncio.run(main()), {"destination": "Djerba"})
+        self.assertEqual(intent_cache.lookup("djerba"), {"destination": "Djerba"})
+
+    def test_cached_intent_skips_rules_and_llama(self):
+        intent_cache.store("Tozeur", {"destination": "Tozeur"})
+        with mock.patch.object(views.intent_rules, "score_intent") as rules, \
+                mock.patch.object(views, "extract_intent_with_llama") as llm:
+            self.assertEqual(views.analyze_travel_intent_with_llama("tozeur"), {"destination": "Tozeur"})
+        rules.assert_not_called()
+        llm.assert_not_called()
+
+
+class IntentFastPathTests(SimpleTestCase):
+    CONFIDENT = "Un hotel a Sousse pour 200 dt, 3 nuits"
+
+    def setUp(self):
+        caches[intent_cache.CACHE_ALIAS].clear()
+        patch = mock.patch.object(views.intent_rules, "maybe_shadow")
+        self.shadow = patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_confidence_from_signals(self):
+        intent, score = intent_rules.score_intent(self.CONFIDENT)
+        self.assertEqual((intent["destination"], intent["budget"], intent["duree"]), ("Sousse", 200, 3))
+        self.assertGreaterEqual(score, intent_rules.threshold())
+        self.assertEqual(intent_rules.score_intent("bonjour")[1], 0)
+
+    def test_confident_rules_skip_llama(self):
+        with mock.patch.object(views, "extract_intent_with_llama") as llm:
+            intent = views.analyze_travel_intent_with_llama(self.CONFIDENT)
+        llm.assert_not_called()
+        self.assertEqual(intent["destination"], "Sousse")
+        self.shadow.assert_called_once()
+
+    def test_low_confidence_falls_back_to_llama_and_caches(self):
+        with mock.patch.object(views, "extract_intent_with_llama", return_value={"destination": "Tozeur"}) as llm:
+            self.assertEqual(views.analyze_travel_intent_with_llama("je veux partir"), {"destination": "Tozeur"})
+        llm.assert_called_once_with("je veux partir")
+        self.assertEqual(intent_cache.lookup("je veux partir"), {"destination": "Tozeur"})
+
+    def test_threshold_setting_controls_the_fast_path(self):
+        with self.settings(INTENT_RULES_THRESHOLD=1.01), \
+                mock.patch.object(views, "extract_intent_with_llama", return_value=None) as llm:
+            intent = views.analyze_travel_intent_with_llama(self.CONFIDENT)
+        llm.assert_called_once()
+        # Llama indisponible : intention des règles
+        self.assertEqual(intent["destination"], "Sousse")
+
+
+class LlamaProberTests(SimpleTestCase):
+    def probe(self, replica, *outcomes):
+        """Sonde la réplique une fois par réponse (code HTTP ou exception) simulée"""
+        session = mock.Mock()
+        session.get.side_effect = [
+            outcome if isinstance(outcome, Exception) else mock.Mock(status_code=outcome) for outcome in outcomes
+        ]
+        with mock.patch.object(llama_backend.http_client, "session", return_value=session):
+            for _ in outcomes:
+                replica.probe()
+
+    def test_down_after_threshold_then_back_up(self):
+        replica = llama_backend.LlamaBackend("http://llama-a:8000")
+        self.probe(replica, 200)
+        self.assertTrue(replica.healthy)
+        with self.settings(LLAMA_FAILURE_THRESHOLD=2):
+            self.probe(replica, 503)
+            self.assertTrue(replica.healthy)
+            self.probe(replica, llama_backend.requests.exceptions.Timeout())
+        self.assertFalse(replica.healthy)
+        self.assertEqual((replica.consecutive_failures, replica.last_error), (2, "timeout"))
+        self.assertEqual(replica.snapshot()["status"], "disconnected")
+
+        self.probe(replica, 200)
+        self.assertTrue(replica.healthy)
+        self.assertEqual(replica.consecutive_failures, 0)
+        self.assertEqual(replica.snapshot()["url"], "http://llama-a:8000/api/chat/")
+
+    def test_unchecked_replica_is_unknown(self):
+        replica = llama_backend.LlamaBackend("http://llama-a:8000")
+        self.assertEqual(replica.snapshot()["status"], "unknown")
+        self.probe(replica, ConnectionError())
+        self.assertEqual(replica.snapshot()["status"], "disconnected")
+        self.assertEqual(replica.last_error, "ConnectionError")
+
+    def test_report_failure_wakes_the_prober(self):
+        replica = llama_backend.LlamaBackend("http://llama-a:8000")
+        self.probe(replica, 200)
+        with mock.patch.object(llama_backend, "_wakeup") as wakeup, self.settings(LLAMA_FAILURE_THRESHOLD=1):
+            llama_backend.report_failure("HTTP 500", replica)
+        wakeup.set.assert_called_once()
+        self.assertFalse(replica.healthy)
+
+
+class LlamaRoutingTests(SimpleTestCase):
+    URLS = ["http://llama-a:8000", "http://llama-b:8000", "http://llama-c:8000"]
+
+    def setUp(self):
+        self.pool = llama_backend.LlamaPool(self.URLS)
+        for replica in self.pool.replicas:
+            replica.record_success(0.01)
+        patch = mock.patch.object(llama_backend, "pool", self.pool)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_affinity_stays_on_the_same_replica(self):
+        with self.settings(LLAMA_SESSION_AFFINITY=True, LLAMA_AFFINITY_MAX_SKEW=4):
+            with llama_backend.lease("user-42") as first:
+                # la réplique tenue par ce user est plus chargée, mais sous le seuil
+                with llama_backend.lease("user-42") as second:
+                    self.assertIs(second, first)
+            self.assertEqual(first.outstanding, 0)
+            chosen = {self.pool.pick("user-42") for _ in range(10)}
+        self.assertEqual(chosen, {first})
+
+    def test_affinity_gives_way_to_a_saturated_replica(self):
+        with self.settings(LLAMA_SESSION_AFFINITY=True, LLAMA_AFFINITY_MAX_SKEW=1):
+            preferred = self.pool.pick("user-42")
+            preferred.outstanding = 2
+            self.assertIsNot(self.pool.pick("user-42"), preferred)
+
+    def test_failed_replica_is_skipped(self):
+        with self.settings(LLAMA_SESSION_AFFINITY=True, LLAMA_FAILURE_THRESHOLD=1):
+            preferred = self.pool.pick("user-42")
+            llama_backend.report_failure("HTTP 500", preferred)
+            with llama_backend.lease("user-42") as replica:
+                self.assertIsNotNone(replica)
+                self.assertIsNot(replica, preferred)
+            self.assertNotIn(llama_backend.chat_url(), (None, preferred.chat_url))
+
+    def test_lease_yields_none_without_healthy_replica(self):
+        with self.settings(LLAMA_FAILURE_THRESHOLD=1):
+            for replica in self.pool.replicas:
+                replica.record_failure("timeout")
+        with llama_backend.lease("user-42") as replica:
+            self.assertIsNone(replica)
+        self.assertIsNone(llama_backend.chat_url())
+        self.assertEqual(llama_backend.snapshot()["status"], "disconnected")
+
+
+class TemplateReplyTests(SimpleTestCase):
+    def test_same_seed_same_wording(self):
+        args = ("Sousse", 200, 3, 2, 5)
+        first = replies.build_reply(*args, seed="Un hotel a Sousse")
+        self.assertEqual(replies.build_reply(*args, seed="Un hotel a Sousse"), first)
+        self.assertEqual(replies.build_reply(*args), replies.build_reply(*args, seed="Sousse|200|3|2"))
+
+    def test_seed_spreads_over_variants(self):
+        wordings = {replies.build_reply("Sousse", 200, 3, 2, 5, seed=f"message {i}") for i in range(50)}
+        self.assertEqual(len(wordings), len(replies.WITH_DESTINATION))
+
+    def test_variant_families(self):
+        reply = replies.build_reply("Sousse", 200, 1, 1, 1, seed="x")
+        self.assertIn("Sousse", reply)
+        self.assertRegex(reply, r"1 (option|Option)\b")
+        self.assertIn("1 nuit pour 1 personne", reply)
+        no_offers = {v.format(destination="Sousse", budget=200, sejour="3 nuits pour 2 personnes")
+                     for v in replies.NO_OFFERS}
+        self.assertIn(replies.build_reply("Sousse", 200, 3, 2, 0, seed="x"), no_offers)
+        self.assertIn(replies.build_reply(None, 200, 3, 2, 5, seed="x"), replies.WITHOUT_DESTINATION)
+
+
+class SummaryLifecycleTests(SimpleTestCase):
+    def setUp(self):
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        patch = mock.patch.object(summaries, "_executor", self.executor)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def poll(self, summary_id):
+        request = APIRequestFactory().get(f"/api/chat/summary/{summary_id}/")
+        return views.chat_summary(request, summary_id)
+
+    def test_pending_then_ready(self):
+        release = threading.Event()
+        summary_id = summaries.start(lambda: release.wait(5) and "Résumé Llama")
+        response = self.poll(summary_id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data, {"summary_id": summary_id, "status": "pending"})
+        release.set()
+        self.executor.shutdown(wait=True)
+        self.assertEqual(self.poll(summary_id).data["status"], "ready")
+        self.assertEqual(summaries.get(summary_id)["ai_response"], "Résumé Llama")
+
+    def test_error_or_empty_summary_fails(self):
+        def boom():
+            raise RuntimeError("Llama indisponible")
+
+        ids = [summaries.start(boom), summaries.start(lambda: None)]
+        self.executor.shutdown(wait=True)
+        self.assertEqual([summaries.get(i) for i in ids], [{"status": "failed"}] * 2)
+
+    def test_unknown_summary_is_404(self):
+        self.assertEqual(self.poll("inconnu").status_code, 404)
+
+    def test_states_expire_after_summary_ttl(self):
+        with self.settings(LLM_SUMMARY_TTL=1), mock.patch.object(summaries, "cache") as cache:
+            summaries.start(lambda: "x")
+            self.executor.shutdown(wait=True)
+        states = [(call.args[1]["status"], call.args[2]) for call in cache.set.call_args_list]
+        self.assertEqual(states, [("pending", 1), ("ready", 1)])
@@ -1,23 +1,26 @@
 from django.shortcuts import render
 from django.http import HttpResponse, JsonResponse
+import hashlib
 import json
 import requests
 from bs4 import BeautifulSoup
 import re
-from datetime import datetime
+import time
+from datetime import date, datetime
 from rest_framework.decorators import api_view
 from rest_framework.response import Response
 from rest_framework import serializers, status
+from django.conf import settings
 from django.db import connection
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
 from .models import Destination, UserPreference
+from . import catalog, geo, http_client, intent_cache, intent_rules, llama_backend, metrics, offer_cache, prices, providers, recommender, replies, summaries
+from .intent_rules import extract_intent_manual
+from .singleflight import SingleFlight
+from .mysql_pool.pool import stats as mysql_pool_stats
 from urllib.parse import quote_plus
 
-# -----------------------------
-# CONFIGURATION DE LLAMA
-# -----------------------------
-LLAMA_URL = "http://127.0.0.1:8000/api/chat/"  # ✅ CORRIGÉ : Flask sur 8000, pas 8001
-HEALTH_URL = "http://127.0.0.1:8000/health"
-
 # -----------------------------
 # MODE GRATUIT (Sans APIs payantes ni scraping agressif)
 # -----------------------------
@@ -25,118 +28,20 @@ HEALTH_URL = "http://127.0.0.1:8000/health"
 # des deep links publics (Booking/Expedia/Airbnb/TripAdvisor/Google Flights).
 FREE_MODE = True
 
-# Verrou pour éviter les détections multiples simultanées
-import threading
-_detection_lock = threading.Lock()
-_last_detection_time = 0
-_detection_cooldown = 5  # Secondes entre deux détections
-
-def detect_llama_url(force=False):
-    """
-    Détecte l'URL du serveur Llama avec verrou pour éviter les appels multiples.
-    
-    Args:
-        force: Si True, ignore le cooldown et force la détection
-    """
-    global _last_detection_time, LLAMA_DETECTED
-    
-    # Vérifier le cooldown pour éviter trop de tentatives (sauf si force=True)
-    import time
-    current_time = time.time()
-    if not force and current_time - _last_detection_time < _detection_cooldown:
-        # Trop tôt depuis la dernière détection, retourner la valeur actuelle
-        return LLAMA_DETECTED
-    
-    with _detection_lock:
-        # Vérifier à nouveau après avoir acquis le verrou
-        if not force and current_time - _last_detection_time < _detection_cooldown:
-            return LLAMA_DETECTED
-        
-        _last_detection_time = current_time
-        
-        possible_health_urls = [
-            "http://127.0.0.1:8000/health",  # Flask Llama
-            "http://localhost:8000/health",
-        ]
-        
-        for url in possible_health_urls:
-            try:
-                print(f"🔍 Test de connexion à: {url}")
-                # ✅ Timeout augmenté à 5 secondes pour le chargement du modèle
-                response = requests.get(url, timeout=5)
-                if response.status_code == 200:
-                    print(f"✅ Serveur Llama détecté à {url}")
-                    # Retourner l'URL du chat, pas celle du health
-                    base_url = url.replace('/health', '')
-                    return f"{base_url}/api/chat/"
-            except requests.exceptions.Timeout:
-                print(f"⏱️ Timeout connexion à {url} (serveur peut être en cours de chargement)")
-                continue
-            except Exception as e:
-                print(f"⚠️ Erreur connexion à {url}: {type(e).__name__}")
-                continue
-        
-        print("❌ Aucune URL Llama détectée - Mode simulation activé")
-        return None
-
-# Variable globale pour stocker l'URL détectée
-LLAMA_DETECTED = detect_llama_url()
-
 # -----------------------------
-# ✅ FONCTION HEALTH (AMÉLIORÉE - Détection dynamique)
+# ✅ FONCTION HEALTH (lecture de l'état de la sonde Llama)
 # -----------------------------
 @api_view(["GET"])
 def health(request):
     """
-    Endpoint de vérification de santé du serveur Django
+    Endpoint de vérification de santé du serveur Django.
+    L'état de Llama vient de la sonde en arrière-plan (aucun appel réseau ici).
     """
-    global LLAMA_DETECTED
-    llama_status = "disconnected"
-    llama_url = None
-    
-    # ✅ Réessayer de détecter Llama si pas encore détecté (détection dynamique)
-    # Mais seulement si le cooldown est respecté pour éviter les boucles
-    if not LLAMA_DETECTED:
-        print("🔄 Réessai de détection Llama...")
-        LLAMA_DETECTED = detect_llama_url()
-    
-    # Tester la connexion à Llama
-    if LLAMA_DETECTED:
-        try:
-            # ✅ Timeout augmenté pour permettre au serveur de répondre
-            health_check = requests.get(HEALTH_URL, timeout=5)
-            if health_check.status_code == 200:
-                llama_status = "connected"
-                llama_url = LLAMA_DETECTED
-            else:
-                llama_status = "error"
-                print(f"⚠️ Llama répond avec code {health_check.status_code}")
-        except requests.exceptions.Timeout:
-            llama_status = "timeout"
-            print(f"⏱️ Timeout lors de la vérification de Llama (peut être en cours de chargement)")
-        except Exception as e:
-            llama_status = "error"
-            print(f"⚠️ Erreur connexion Llama: {type(e).__name__}")
-    else:
-        # Réessayer une dernière fois (avec cooldown)
-        LLAMA_DETECTED = detect_llama_url()
-        if LLAMA_DETECTED:
-            try:
-                health_check = requests.get(HEALTH_URL, timeout=5)
-                if health_check.status_code == 200:
-                    llama_status = "connected"
-                    llama_url = LLAMA_DETECTED
-            except:
-                llama_status = "error"
-    
     return Response({
         "status": "healthy",
         "service": "Django Backend",
         "timestamp": datetime.now().isoformat(),
-        "llama": {
-            "status": llama_status,
-            "url": llama_url
-        },
+        "llama": llama_backend.snapshot(),
         "endpoints": {
             "chat": "/api/chat/",
             "intelligent_travel_chat": "/api/intelligent_travel_chat/",
@@ -148,47 +53,86 @@ def health(request):
 # -----------------------------
 # APPEL AU SERVEUR LLAMA
 # -----------------------------
-def call_llama_api(prompt, max_tokens=150):
+def call_llama_api(prompt, max_tokens=150, cache_prefix=None, temperature=0.7):
     """
-    Appel au serveur Llama Flask. Retourne la réponse texte.
+    Complétion brute pour les prompts internes (POST /v1/complete) : Llama
+    n'ajoute ni historique ni préambule. Retourne la réponse texte.
+    cache_prefix: début statique du prompt dont Llama peut réutiliser l'état (cache KV)
     """
-    global LLAMA_DETECTED
-    
-    # ✅ Réessayer de détecter Llama si pas encore détecté
-    if not LLAMA_DETECTED:
-        print("🔄 Réessai de détection Llama avant appel API...")
-        LLAMA_DETECTED = detect_llama_url()
-    
-    if not LLAMA_DETECTED:
-        return f"[Simulation] Réponse pour: {prompt[:50]}..."
+    simulation = f"[Simulation] Réponse pour: {prompt[:50]}..."
+    if not llama_backend.chat_url():
+        return simulation
 
-    try:
-        payload = {
-            "message": prompt,
-            "user_id": 1
-        }
-        print(f"📤 Envoi à Llama: {LLAMA_DETECTED}")
-        response = requests.post(LLAMA_DETECTED, json=payload, timeout=60)
-        
-        if response.status_code == 200:
-            data = response.json()
-            if "ai_response" in data:
-                return data["ai_response"]
-            elif "response" in data:
-                return data["response"]
-            return str(data)[:200]
-        else:
+    # Prompts identiques en vol simultanément : une seule requête à Llama
+    key = llama_request_key("complete", prompt, max_tokens, cache_prefix, temperature)
+    payload = build_llama_payload(prompt, max_tokens, cache_prefix, temperature)
+    data = llama_flight.do(key, lambda: post_to_llama("complete_url", payload))
+    return parse_llama_response(data) if data is not None else simulation
+
+def call_llama_chat(message, user_id=None):
+    """
+    Message d'un utilisateur (POST /api/chat/) : Llama garde l'historique de
+    sa conversation. user_id choisit aussi la réplique (affinité).
+    """
+    if not llama_backend.chat_url():
+        return f"[Simulation] Réponse pour: {message[:50]}..."
+    payload = {"message": message, "user_id": user_id if user_id is not None else 1}
+    data = post_to_llama("chat_url", payload, user_id)
+    return parse_llama_response(data) if data is not None else f"[Simulation] Réponse pour: {message[:50]}..."
+
+def post_to_llama(endpoint, payload, user_id=None):
+    """
+    POST sur une réplique Llama (endpoint : chat_url, complete_url, intent_url).
+    Retourne le JSON de la réponse, ou None en cas d'échec (fallback à l'appelant).
+    """
+    with llama_backend.lease(user_id) as replica:
+        if replica is None:
+            return None
+        url = getattr(replica, endpoint)
+        try:
+            print(f"📤 Envoi à Llama: {url}")
+            response = http_client.post(url, json=payload, timeout=60)
+            
+            if response.status_code == 200:
+                return response.json()
             # En production on ne casse pas l'expérience utilisateur : on fallback
-            print(f"❌ Erreur API Llama: {response.status_code} -> fallback simulation")
-            # Réessayer la détection en cas d'erreur (non bloquant)
-            LLAMA_DETECTED = detect_llama_url()
-            return f"[Simulation] Réponse pour: {prompt[:50]}..."
-    except Exception as e:
-        # Ne pas exposer l'erreur brute au frontend; fallback
-        print(f"❌ Erreur connexion Llama: {str(e)} -> fallback simulation")
-        # Réessayer la détection en cas d'exception (non bloquant)
-        LLAMA_DETECTED = detect_llama_url()
-        return f"[Simulation] Réponse pour: {prompt[:50]}..."
+            print(f"❌ Erreur API Llama: {response.status_code} -> fallback")
+            llama_backend.report_failure(f"HTTP {response.status_code}", replica)
+        except Exception as e:
+            # Ne pas exposer l'erreur brute au frontend; fallback
+            print(f"❌ Erreur connexion Llama: {str(e)} -> fallback")
+            llama_backend.report_failure(type(e).__name__, replica)
+    return None
+
+llama_flight = SingleFlight("llama.coalesce")
+
+def llama_request_key(*parts):
+    """Clé de mutualisation : type d'appel + prompt + paramètres de génération"""
+    raw = json.dumps(parts, ensure_ascii=False)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+def build_llama_payload(prompt, max_tokens=150, cache_prefix=None, temperature=0.7, stream=False):
+    """Corps d'une requête /v1/complete"""
+    payload = {
+        "prompt": prompt,
+        "max_tokens": max_tokens,
+        "temperature": temperature,
+    }
+    if cache_prefix:
+        payload["cache_prefix"] = cache_prefix
+    if stream:
+        payload["stream"] = True
+    return payload
+
+def parse_llama_response(data):
+    """Texte de la réponse JSON du serveur Llama"""
+    if "text" in data:
+        return data["text"]
+    elif "ai_response" in data:
+        return data["ai_response"]
+    elif "response" in data:
+        return data["response"]
+    return str(data)[:200]
 
 # -----------------------------
 # VUE CHAT SIMPLE
@@ -204,13 +148,13 @@ def chat_view(request):
         print(f"📨 Message reçu: {message}")
 
         # Appel Llama
-        llama_response = call_llama_api(message)
+        llama_response = call_llama_chat(message, user_id=data.get("user_id"))
         print(f"🤖 Réponse Llama: {llama_response}")
 
         return JsonResponse({
             "response": llama_response,
             "status": "success",
-            "llama_used": bool(LLAMA_DETECTED)
+            "llama_used": llama_backend.chat_url() is not None
         })
 
     except Exception as e:
@@ -221,235 +165,108 @@ def chat_view(request):
 # -----------------------------
 def analyze_travel_intent_with_llama(user_message):
     """
-    Utilise Llama pour analyser l'intention de voyage.
-    """
-    prompt = (
-        "Tu es un assistant d'analyse d'intention de voyage. "
-        "Ton rôle est d'extraire les préférences STRICTEMENT au format JSON. "
-        "Ne dis RIEN d'autre que l'objet JSON unique, sans texte autour.\n\n"
-        f"Message: \"{user_message}\"\n\n"
-        "Format JSON requis:\n"
-        "{\n"
-        "  \"destination\": \"ville principale\" | null,\n"
-        "  \"budget\": nombre | null,\n"
-        "  \"type_hebergement\": \"hôtel/appartement/maison\" | null,\n"
-        "  \"duree\": nombre | null,\n"
-        "  \"personnes\": nombre | null,\n"
-        "  \"interets\": [\"plage\", \"culture\", \"nature\", \"ville\"] | []\n"
-        "}\n\n"
-        "Réponse JSON:"
-    )
+    Analyse l'intention de voyage :
+    1) cache (message normalisé), 2) règles si assez confiantes,
+    3) Llama, 4) extraction manuelle en dernier recours.
+    """
+    cached = intent_cache.lookup(user_message)
+    if cached is not None:
+        print(f"🎯 Intention en cache: {cached}")
+        return cached
+
+    # Fast-path : les règles suffisent quand elles sont confiantes
+    rule_intent, confidence = intent_rules.score_intent(user_message)
+    if confidence >= intent_rules.threshold():
+        print(f"⚡ Intention par règles (confiance {confidence:.2f}): {rule_intent}")
+        metrics.incr("intent.path.rules")
+        intent_rules.maybe_shadow(user_message, rule_intent, extract_intent_with_llama)
+        return rule_intent
+
+    metrics.incr("intent.path.llm")
+    started = time.monotonic()
+    obj = extract_intent_with_llama(user_message)
+    metrics.observe("intent.llm", time.monotonic() - started)
+    if obj is not None:
+        intent_cache.store(user_message, obj)
+        return obj
+
+    return rule_intent
+
+def extract_intent_with_llama(user_message):
+    """
+    Demande l'intention à Llama (/api/intent/ : JSON seul, génération arrêtée
+    dès que l'objet est complet). Retourne le dict ou None si échec.
+    """
+    if not llama_backend.chat_url():
+        return None
+    key = llama_request_key("intent", user_message)
+    data = llama_flight.do(key, lambda: post_to_llama("intent_url", {"message": user_message}))
+    if data is None:
+        return None
+    print(f"🎯 Intention Llama: {data.get('intent')}")
+    return data.get("intent")
 
-    response = call_llama_api(prompt)
-    try:
-        # Éviter de parser l'exemple si la réponse contient le prompt (mode simulation)
-        if response.startswith("[Simulation]"):
-            raise ValueError("Simulation -> fallback")
-
-        # Rechercher tous les objets JSON et préférer le dernier valide
-        candidates = re.findall(r'\{[\s\S]*?\}', response)
-        for raw in reversed(candidates):
-            try:
-                obj = json.loads(raw)
-                if isinstance(obj, dict) and "destination" in obj:
-                    print(f"🎯 Intention Llama: {obj}")
-                    return obj
-            except Exception:
-                continue
-
-        # Si la réponse entière est un JSON valide
-        obj = json.loads(response)
-        if isinstance(obj, dict):
-            print(f"🎯 Intention Llama direct: {obj}")
-            return obj
-    except Exception as e:
-        print(f"❌ Erreur parsing JSON Llama: {e}")
+# -----------------------------
+# SCRAPING
+# -----------------------------
+def scrape_real_travel_offers(destination, budget, personnes=2, duree=1):
+    """
+    Offres pour la destination, servies depuis le cache d'offres quand possible
+    (voir api/offer_cache.py, collecte au budget de la tranche). En FREE_MODE
+    les deep links ne coûtent rien et reprennent le budget exact : pas de cache.
+    Les offres (et le cache) sont par nuit ; le total du séjour est ajouté ici.
+    """
+    if FREE_MODE:
+        annonces = collect_travel_offers(destination, budget, personnes=personnes)
+    else:
+        annonces = offer_cache.get_or_fetch(
+            destination, budget, personnes,
+            lambda band_budget: collect_travel_offers(destination, band_budget, personnes=personnes)
+        )
+    return with_stay_totals(annonces, duree)
 
-    return extract_intent_manual(user_message)
+def with_stay_totals(annonces, duree):
+    """prix_total_estime = prix_par_nuit × durée, sur des copies des offres"""
+    return [
+        dict(a, prix_total_estime=int(a["prix_par_nuit"]) * duree) if a.get("prix_par_nuit") is not None else a
+        for a in annonces
+    ]
 
-def extract_intent_manual(message):
+def estimate_nightly_price(destination, budget):
     """
-    Fallback manuel si Llama échoue.
+    Prix par nuit affiché sur les deep links : médiane des offres disponibles
+    dans la ville (api/prices.py), sinon le budget de l'utilisateur.
     """
-    # 💡 L'erreur précédente 'message_lower' non défini se produit si cette ligne
-    # n'est pas la première instruction. Elle est correctement placée ici.
-    message_lower = message.lower()
-    
-    intent = {
-        "destination": None, # Pas de contrainte locale: aucune destination par défaut
-        "budget": 100,          # Budget par défaut (en DT, pour le scraping)
-        "type_hebergement": "hôtel",
-        "duree": 3,
-        "personnes": 2,
-        "interets": []
-    }
-
-    # Détection destination (globale)
-    # 1) Regex basée sur prépositions courantes (à, vers, pour, to) en conservant la casse
+    located = geo.index.locate(destination) if destination else None
+    median = prices.nightly_price(located[0]) if located else None
+    if median is not None:
+        return max(1, int(round(median)))
     try:
-        prepo_regex = re.compile(r"(?:\bà\b|\bvers\b|\bpour\b|\bto\b)\s+([A-ZÀÂÄÉÈÊËÎÏÔÖÛÜŸ][\w'’\-éèàùâäêëîïôöûüç]+(?:\s+[A-ZÀÂÄÉÈÊËÎÏÔÖÛÜŸ][\w'’\-éèàùâäêëîïôöûüç]+){0,3})")
-        m = prepo_regex.search(message)
-        if m:
-            candidate = m.group(1).strip()
-            # éviter de capter des mots trop génériques
-            if len(candidate) >= 3:
-                intent["destination"] = candidate
+        return max(1, int(budget))
     except Exception:
-        pass
-
-    # 2) Liste de villes connues rapides (fallback léger) sur message_lower
-    if 'paris' in message_lower:
-        intent["destination"] = "Paris"
-    elif 'marrakech' in message_lower or 'maroc' in message_lower:
-        intent["destination"] = "Marrakech"
-    elif 'barcelone' in message_lower:
-        intent["destination"] = "Barcelone"
-    elif 'rome' in message_lower:
-        intent["destination"] = "Rome"
-    elif 'dubai' in message_lower:
-        intent["destination"] = "Dubaï"
-    # Tunisie (toujours supportée mais non imposée)
-    elif 'hammamet' in message_lower or 'hamamet' in message_lower:
-        intent["destination"] = "Hammamet"
-    elif 'sousse' in message_lower:
-        intent["destination"] = "Sousse"
-    elif 'djerba' in message_lower:
-        intent["destination"] = "Djerba"
-    # 🌍 Pays/villes fréquents en minuscules (détection globale simple)
-    elif 'canada' in message_lower:
-        intent["destination"] = "Canada"
-    elif 'new york' in message_lower:
-        intent["destination"] = "New York"
-    elif 'london' in message_lower or 'londres' in message_lower:
-        intent["destination"] = "Londres"
-    elif 'tokyo' in message_lower:
-        intent["destination"] = "Tokyo"
-    elif 'madrid' in message_lower:
-        intent["destination"] = "Madrid"
-    elif 'berlin' in message_lower:
-        intent["destination"] = "Berlin"
-    elif 'istanbul' in message_lower:
-        intent["destination"] = "Istanbul"
-    elif 'barcelona' in message_lower:
-        intent["destination"] = "Barcelone"
-    elif 'montreal' in message_lower or 'montréal' in message_lower:
-        intent["destination"] = "Montréal"
-    elif 'quebec' in message_lower or 'québec' in message_lower:
-        intent["destination"] = "Québec"
-    elif 'toronto' in message_lower:
-        intent["destination"] = "Toronto"
-    elif 'vancouver' in message_lower:
-        intent["destination"] = "Vancouver"
-
-    # 3) Fallback ultra simple: si rien détecté mais le message contient un mot capitalisé non initial
-    if not intent["destination"]:
-        try:
-            tokens = re.findall(r"\b[A-ZÀÂÄÉÈÊËÎÏÔÖÛÜŸ][a-zàâäéèêëîïôöûüç'’\-]+\b", message)
-            if tokens:
-                # Prendre le dernier token capitalisé (souvent la ville en fin de phrase)
-                intent["destination"] = tokens[-1]
-        except Exception:
-            pass
-
-    # Détection budget
-    budget_match = re.search(r'(\d+)\s*(dt|dinars|euros?|€)', message_lower)
-    if budget_match:
-        intent["budget"] = int(budget_match.group(1))
-        # Conversion Euro -> Dinars (approximation 1 EUR ≈ 3 TND)
-        if 'euro' in message_lower or '€' in message_lower:
-            intent["budget"] = intent["budget"] * 3
-
-    # Détection durée (nuits/jours)
-    try:
-        duree_match = re.search(r'(\d+)\s*(nuits?|jours?)', message_lower)
-        if duree_match:
-            intent["duree"] = int(duree_match.group(1))
-    except Exception:
-        pass
+        return None
 
-    # Détection personnes
-    try:
-        pers_match = re.search(r'pour\s+(\d+)\s*(personnes?|pers|pax?)', message_lower)
-        if pers_match:
-            intent["personnes"] = int(pers_match.group(1))
-    except Exception:
-        pass
-    
-    # Détection intérêts (utilisation de "not in" pour éviter les doublons)
-    if 'plage' in message_lower or 'mer' in message_lower:
-        if "plage" not in intent["interets"]:
-            intent["interets"].append("plage")
-            
-    if 'culture' in message_lower or 'musée' in message_lower:
-        if "culture" not in intent["interets"]:
-            intent["interets"].append("culture")
-            
-    if 'nature' in message_lower or 'montagne' in message_lower:
-        if "nature" not in intent["interets"]:
-            intent["interets"].append("nature")
-    
-    return intent
-# -----------------------------
-# SCRAPING
-# -----------------------------
-def scrape_real_travel_offers(destination, budget, personnes=2):
+def collect_travel_offers(destination, budget, personnes=2):
     annonces = []
     print(f"🌐 Début préparation des offres pour {destination} (FREE_MODE={FREE_MODE})...")
 
     # En mode gratuit: ne faire que des deep links (pas de scraping HTTP)
     if FREE_MODE:
-        # Estimation très simple: budget (par nuit) * durée
-        estimated = None
-        try:
-            estimated = max(1, int(budget))
-            # La durée sera ajoutée côté appelant; ici on garde estimation par nuit
-        except Exception:
-            estimated = None
-        # prix_total_estime = prix_par_nuit * duree
-        estimated_total = None
-        try:
-            estimated_total = int(estimated) * 1  # durée inconnue ici (géré plus haut)
-        except Exception:
-            estimated_total = None
-        deep_links = build_deep_links(destination, adultes=personnes, estimated_price=estimated, estimated_total=estimated_total)
+        # Prix par nuit réel (agrégats des offres) ou budget ; le total du
+        # séjour est calculé par scrape_real_travel_offers
+        estimated = estimate_nightly_price(destination, budget)
+        deep_links = build_deep_links(destination, adultes=personnes, estimated_price=estimated, estimated_total=estimated)
         annonces.extend(deep_links)
         if not annonces:
             annonces = generate_fallback_offers(destination, budget)
         return annonces[:10]
 
-    # Mode normal (si jamais vous désactivez FREE_MODE): tenter des scrapes légers + deep links
-    try:
-        ta_offers = scrape_tripadvisor(destination, budget)
-        annonces.extend(ta_offers)
-        print(f"✅ TripAdvisor: {len(ta_offers)} offres")
-    except Exception as e:
-        print(f"❌ Erreur TripAdvisor: {e}")
-
-    try:
-        booking_offers = scrape_booking_simulation(destination, budget)
-        annonces.extend(booking_offers)
-        print(f"✅ Booking.com: {len(booking_offers)} offres")
-    except Exception as e:
-        print(f"❌ Erreur Booking.com: {e}")
-
-    try:
-        expedia_offers = scrape_expedia_simulation(destination, budget)
-        annonces.extend(expedia_offers)
-        print(f"✅ Expedia: {len(expedia_offers)} offres")
-    except Exception as e:
-        print(f"❌ Erreur Expedia: {e}")
-
-    try:
-        deep_links = build_deep_links(
-            destination,
-            adultes=personnes,
-            estimated_price=budget,
-            estimated_total=(budget * 1)
-        )
-        annonces.extend(deep_links)
-        print(f"🔗 Deep links ajoutés: {len(deep_links)}")
-    except Exception as e:
-        print(f"⚠️ Erreur deep links: {e}")
+    # Mode normal (si jamais vous désactivez FREE_MODE): tous les fournisseurs du
+    # registre (views + scraper.py) en parallèle, voir api/offer_providers.py
+    query = {"destination": destination, "budget": budget, "personnes": personnes}
+    for name, offers in providers.collect(query):
+        annonces.extend(offers)
+        print(f"✅ {name}: {len(offers)} offres")
 
     if not annonces:
         annonces = generate_fallback_offers(destination, budget)
@@ -457,31 +274,39 @@ def scrape_real_travel_offers(destination, budget, personnes=2):
 
 def scrape_tripadvisor(destination, budget):
     try:
-        import random
-        headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
-        q = quote_plus(f"{destination} hotels")
-        search_url = f"https://www.tripadvisor.com/Search?q={q}"
-        response = requests.get(search_url, headers=headers, timeout=20)
-        soup = BeautifulSoup(response.text, 'html.parser')
-        offers = []
-        cards = soup.find_all('div', class_=re.compile(r'result|listing|card|property'))
-        
-        for card in cards[:8]:
-            name_elem = card.find(['h3', 'h2', 'span'])
-            name = name_elem.get_text(strip=True) if name_elem else f"Hôtel {destination}"
-            price = random.randint(int(budget*0.6), int(budget*1.2))
-            rating = round(random.uniform(3.5, 4.9), 1)
-            offers.append({
-                "nom": name,
-                "prix": price,
-                "note": rating,
-                "lien": search_url,
-                "source": "TripAdvisor"
-            })
-        return offers
+        return fetch_tripadvisor(destination, budget)
     except:
         return []
 
+def fetch_tripadvisor(destination, budget, timeout=20):
+    """
+    Scraping TripAdvisor ; lève une exception si la page n'est pas servie
+    (blocage, erreur réseau) pour que le disjoncteur du fournisseur la voie.
+    """
+    import random
+    headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36'}
+    q = quote_plus(f"{destination} hotels")
+    search_url = f"https://www.tripadvisor.com/Search?q={q}"
+    response = http_client.get(search_url, headers=headers, timeout=timeout)
+    response.raise_for_status()
+    soup = BeautifulSoup(response.text, 'html.parser')
+    offers = []
+    cards = soup.find_all('div', class_=re.compile(r'result|listing|card|property'))
+    
+    for card in cards[:8]:
+        name_elem = card.find(['h3', 'h2', 'span'])
+        name = name_elem.get_text(strip=True) if name_elem else f"Hôtel {destination}"
+        price = random.randint(int(budget*0.6), int(budget*1.2))
+        rating = round(random.uniform(3.5, 4.9), 1)
+        offers.append({
+            "nom": name,
+            "prix": price,
+            "note": rating,
+            "lien": search_url,
+            "source": "TripAdvisor"
+        })
+    return offers
+
 def scrape_booking_simulation(destination, budget):
     import random
     hotels = [
@@ -622,6 +447,94 @@ def generate_fallback_offers(destination, budget):
         }
     ]
 
+# -----------------------------
+# NORMALISATION DE L'INTENTION
+# -----------------------------
+# 🔧 Normalisation des nombres pour éviter True/False -> 1/0
+def parse_int(value, default=None, minimum=1):
+    try:
+        if isinstance(value, bool):
+            return default
+        if isinstance(value, (int, float)):
+            iv = int(value)
+        else:
+            s = str(value).strip()
+            if not s:
+                return default
+            # retirer unités éventuelles (dt, €, pers, nuits)
+            s = re.sub(r"[^0-9]", "", s)
+            if not s:
+                return default
+            iv = int(s)
+        if iv < minimum:
+            return minimum
+        return iv
+    except Exception:
+        return default
+
+def normalize_travel_intent(travel_intent):
+    """
+    Retourne (destination, budget, duree, personnes) normalisés depuis l'intention.
+    """
+    destination = travel_intent.get("destination") or ""
+    budget = parse_int(travel_intent.get("budget"), default=100, minimum=1)
+    duree = parse_int(travel_intent.get("duree"), default=1, minimum=1)
+    personnes = parse_int(travel_intent.get("personnes"), default=2, minimum=1)
+    return destination, budget, duree, personnes
+
+def build_summary_prompt(user_message, destination, budget, duree, personnes, nb_offres=None):
+    """
+    Prompt du résumé friendly envoyé à Llama.
+    nb_offres=None : résumé généré en parallèle de la collecte des offres.
+    """
+    offres = f"Nombre d'offres trouvées: {nb_offres}\n" if nb_offres is not None else ""
+    return f'''Tu es un assistant voyage expert. Fais un résumé concis.
+
+Demande: "{user_message}"
+Destination: {destination}
+Budget: {budget} DT
+Durée: {duree} nuit(s) | Personnes: {personnes}
+{offres}
+Fais un résumé friendly en 1-2 phrases maximum.'''
+
+def build_detected_preferences(travel_intent, destination, budget, duree, personnes):
+    return {
+        "budget": budget,
+        "destination": destination,
+        "duree": duree,
+        "personnes": personnes,
+        "interests": travel_intent.get("interets", [])
+    }
+
+def build_template_response(destination, budget, duree, personnes, nb_offres, seed=None):
+    """
+    Réponse sans LLM (par défaut, FREE_MODE ou Llama indisponible).
+    seed: fixe la formulation (message utilisateur)
+    """
+    return replies.build_reply(destination, budget, duree, personnes, nb_offres, seed=seed)
+
+def llm_summary_mode(requested=None):
+    """
+    Résumé Llama : "off" (gabarit seul), "sync" (attendu dans la réponse) ou
+    "async" (lancé en arrière-plan, voir api/summaries.py).
+    requested (champ llm_summary de la requête) : true/"sync", "async" ou false ;
+    à défaut settings.LLM_SUMMARY_MODE.
+    """
+    if requested is True:
+        return "sync"
+    if requested is False:
+        return "off"
+    if requested in ("off", "sync", "async"):
+        return requested
+    return getattr(settings, "LLM_SUMMARY_MODE", "off")
+
+def generate_llm_summary(prompt):
+    """Résumé Llama ou None (simulation / erreur)"""
+    text = call_llama_api(prompt)
+    if not isinstance(text, str) or text.startswith("[Simulation]") or not text.strip():
+        return None
+    return text.strip()
+
 # -----------------------------
 # ENDPOINT PRINCIPAL
 # -----------------------------
@@ -638,91 +551,35 @@ def intelligent_travel_chat(request):
         print(f"📨 Message: {user_message}")
         travel_intent = analyze_travel_intent_with_llama(user_message)
 
-        destination = travel_intent.get("destination") or ""
-
-        # 🔧 Normalisation des nombres pour éviter True/False -> 1/0
-        def parse_int(value, default=None, minimum=1):
-            try:
-                if isinstance(value, bool):
-                    return default
-                if isinstance(value, (int, float)):
-                    iv = int(value)
-                else:
-                    s = str(value).strip()
-                    if not s:
-                        return default
-                    # retirer unités éventuelles (dt, €, pers, nuits)
-                    s = re.sub(r"[^0-9]", "", s)
-                    if not s:
-                        return default
-                    iv = int(s)
-                if iv < minimum:
-                    return minimum
-                return iv
-            except Exception:
-                return default
-
-        budget = parse_int(travel_intent.get("budget"), default=100, minimum=1)
-        duree = parse_int(travel_intent.get("duree"), default=1, minimum=1)
-        personnes = parse_int(travel_intent.get("personnes"), default=2, minimum=1)
+        destination, budget, duree, personnes = normalize_travel_intent(travel_intent)
 
         print(f"🌐 Préparation d'offres pour {destination}...")
-        annonces = scrape_real_travel_offers(destination, budget, personnes=personnes)
+        annonces = scrape_real_travel_offers(destination, budget, personnes=personnes, duree=duree)
         print(f"✅ {len(annonces)} annonces trouvées")
 
         print("💬 Génération réponse utilisateur...")
-        if FREE_MODE or not LLAMA_DETECTED:
-            if destination:
-                ai_response = (
-                    f"Super choix ! Je te propose des pistes pour {destination}. "
-                    f"Budget ~{budget} DT/nuit, durée {duree} nuit(s) pour {personnes} pers. "
-                    f"J'ai listé {len(annonces)} options; dis-moi tes dates pour affiner."
-                )
+        ai_response = build_template_response(destination, budget, duree, personnes, len(annonces), seed=user_message)
+        summary_id = None
+        mode = llm_summary_mode(request.data.get('llm_summary'))
+        if mode != "off" and not FREE_MODE and llama_backend.chat_url():
+            prompt_reponse = build_summary_prompt(user_message, destination, budget, duree, personnes, len(annonces))
+            if mode == "sync":
+                ai_response = generate_llm_summary(prompt_reponse) or ai_response
             else:
-                ai_response = (
-                    f"J'ai listé des liens utiles pour commencer ta recherche. "
-                    f"Dis-moi une destination, des dates et un budget pour cibler les résultats."
-                )
-        else:
-            prompt_reponse = f'''Tu es un assistant voyage expert. Fais un résumé concis.
-
-Demande: "{user_message}"
-Destination: {destination}
-Budget: {budget} DT
-Durée: {duree} nuit(s) | Personnes: {personnes}
-Nombre d'offres trouvées: {len(annonces)}
-
-Fais un résumé friendly en 1-2 phrases maximum.'''
-            ai_response = call_llama_api(prompt_reponse)
-            if isinstance(ai_response, str) and ai_response.startswith("[Simulation]"):
-                if destination:
-                    ai_response = (
-                        f"Voici quelques pistes pour {destination}. "
-                        f"J'ai trouvé {len(annonces)} options environ. "
-                        f"Dis-moi tes dates et ton budget précis pour affiner."
-                    )
-                else:
-                    ai_response = (
-                        f"J'ai listé des liens utiles pour explorer des offres. "
-                        f"Partage une destination, des dates et un budget pour des suggestions ciblées."
-                    )
+                summary_id = summaries.start(lambda: generate_llm_summary(prompt_reponse))
 
         response_data = {
             "ai_response": ai_response,
+            "summary_id": summary_id,
             "annonces": annonces,
-            "detected_preferences": {
-                "budget": budget,
-                "destination": destination,
-                "duree": duree,
-                "personnes": personnes,
-                "interests": travel_intent.get("interets", [])
-            },
+            "detected_preferences": build_detected_preferences(travel_intent, destination, budget, duree, personnes),
             "travel_intent": travel_intent,
+            "nearby_alternatives": geo.nearby_alternatives(destination),
             "search_metadata": {
                 "destination": destination,
                 "budget": budget,
                 "results_count": len(annonces),
-                "llama_used": LLAMA_DETECTED is not None,
+                "llama_used": llama_backend.chat_url() is not None,
                 "timestamp": datetime.now().isoformat()
             }
         }
@@ -749,6 +606,20 @@ Fais un résumé friendly en 1-2 phrases maximum.'''
             }
         }, status=500)
 
+# -----------------------------
+# RÉSUMÉ LLAMA DIFFÉRÉ
+# -----------------------------
+@api_view(["GET"])
+def chat_summary(request, summary_id):
+    """
+    Résumé Llama lancé en arrière-plan par intelligent_travel_chat (llm_summary="async").
+    status : pending, ready (avec ai_response) ou failed.
+    """
+    state = summaries.get(summary_id)
+    if state is None:
+        return Response({"error": "Résumé inconnu ou expiré"}, status=404)
+    return Response({"summary_id": summary_id, **state})
+
 # -----------------------------
 # AUTRES VUES
 # -----------------------------
@@ -756,7 +627,7 @@ def home(request):
     return HttpResponse(f"""
     <h1>🚀 App-Travell - Métamoteur Voyage</h1>
     <p>Backend Django avec Llama API + Scraping réel</p>
-    <p><strong>URL Llama détectée:</strong> {LLAMA_DETECTED or 'Aucune (mode simulation)'}</p>
+    <p><strong>URL Llama détectée:</strong> {llama_backend.chat_url() or 'Aucune (mode simulation)'}</p>
     <ul>
         <li><a href="/api/health/">Health Check</a></li>
         <li>Endpoint Chat: POST /api/chat/</li>
@@ -766,20 +637,132 @@ def home(request):
 
 @api_view(["GET"])
 def recommendations(request):
-    return Response({
-        "message": "Endpoint recommandations opérationnel."
-    })
+    """
+    Destinations classées pour un utilisateur (intérêts, budget, popularité).
+    Paramètres : user_id (sans préférences : classement par popularité), limit (10, max 100).
+    """
+    try:
+        user_id = int(request.query_params["user_id"]) if request.query_params.get("user_id") else None
+        limit = max(1, min(int(request.query_params.get("limit") or 10), catalog.MAX_LIMIT))
+    except ValueError:
+        return Response({"error": "user_id et limit doivent être des entiers"}, status=400)
+
+    ranked = recommender.recommend_for_user(user_id, k=limit)
+    scores = dict(ranked)
+    items = [dict(item, score=scores[item["id"]]) for item in catalog.destinations_by_ids([i for i, _ in ranked])]
+    return Response(RecommendationSerializer(items, many=True).data)
 
 @api_view(["GET"])
 def destinations_list(request):
+    """
+    Catalogue des destinations, une requête SQL par page (voir catalog.py).
+
+    Paramètres : limit (20, max 100), cursor, price_level, min_price_level,
+    max_price_level, city_id, city.
+    Le corps reste une liste ; la page suivante est annoncée par les en-têtes
+    X-Next-Cursor et Link. ETag et Last-Modified viennent de la version du
+    catalogue, calculés avant la page : If-None-Match / If-Modified-Since -> 304
+    sans requête de page.
+    """
+    headers = {"Cache-Control": "max-age=0, must-revalidate"}
     try:
-        qs = Destination.objects.all()[:10]
-        data = [{"id": d.id, "title": d.title, "city": d.city.name if d.city else "N/A"} for d in qs]
-        return Response(data)
+        etag, changed_at = catalog.list_validators(request.query_params)
+        headers["ETag"] = quote_etag(etag)
+        headers["Last-Modified"] = http_date(changed_at)
+    except Exception as e:
+        # Version illisible : page servie sans validateurs
+        print(f"⚠️ Version du catalogue indisponible: {e}")
+    else:
+        not_modified = get_conditional_response(request, etag=headers["ETag"], last_modified=int(changed_at))
+        if not_modified is not None:
+            metrics.incr("destinations.not_modified")
+            for name, value in headers.items():
+                not_modified[name] = value
+            return not_modified
+
+    try:
+        items, next_cursor = catalog.list_destinations(request.query_params)
+    except catalog.InvalidQuery as e:
+        return Response({"error": str(e)}, status=400)
     except Exception as e:
         print(f"❌ Erreur destinations: {e}")
         return Response([])
 
+    if next_cursor:
+        headers["X-Next-Cursor"] = next_cursor
+        next_params = request.query_params.copy()
+        next_params["cursor"] = next_cursor
+        headers["Link"] = f'<{request.build_absolute_uri(request.path)}?{next_params.urlencode()}>; rel="next"'
+    return Response(DestinationSerializer(items, many=True).data, headers=headers)
+
+@api_view(["GET"])
+def destinations_nearby(request):
+    """
+    Destinations proches d'un point ou d'une ville (index géographique en mémoire).
+    Paramètres : lat + lng, ou city ; radius_km (100, max 2000) ; limit (20, max 100).
+    """
+    try:
+        origin, items = catalog.nearby_destinations(request.query_params)
+    except catalog.InvalidQuery as e:
+        return Response({"error": str(e)}, status=400)
+    return Response({
+        "origin": origin,
+        "destinations": NearbyDestinationSerializer(items, many=True).data,
+    })
+
+@api_view(["GET"])
+def city_prices(request):
+    """
+    Prix par nuit dans une ville : min / médiane / p90 des offres disponibles,
+    par mois (calendar) et, avec checkin/checkout (AAAA-MM-JJ), pour le séjour.
+    Paramètres : city_id ou city, currency (PRICE_DEFAULT_CURRENCY), checkin, checkout.
+    """
+    params = request.query_params
+    try:
+        city_id = int(params["city_id"]) if params.get("city_id") else None
+        checkin = date.fromisoformat(params["checkin"]) if params.get("checkin") else None
+        checkout = date.fromisoformat(params["checkout"]) if params.get("checkout") else None
+    except ValueError:
+        return Response({"error": "city_id entier et dates AAAA-MM-JJ attendus"}, status=400)
+    if city_id is None and params.get("city"):
+        geo.ensure_ready()
+        located = geo.index.locate(params["city"])
+        city_id = located[0] if located else None
+    if city_id is None:
+        return Response({"error": "Ville inconnue (city_id ou city requis)"}, status=400)
+    if checkin and checkout and checkout <= checkin:
+        return Response({"error": "checkout doit suivre checkin"}, status=400)
+
+    prices.ensure_ready()
+    if not prices.book.configured:
+        return Response({"error": prices.NOT_CONFIGURED}, status=503)
+    currency = (params.get("currency") or getattr(settings, "PRICE_DEFAULT_CURRENCY", "TND")).upper()
+    return Response({
+        "city_id": city_id,
+        "currency": currency,
+        "overall": prices.book.city_prices(city_id, currency),
+        "stay": prices.book.quote(city_id, currency, checkin, checkout) if checkin else None,
+        "calendar": prices.book.calendar(city_id, currency),
+    })
+
+@api_view(["GET"])
+def metrics_view(request):
+    """
+    Compteurs internes (caches, latences...) pour le suivi des performances
+    """
+    data = metrics.snapshot()
+    data["intent_cache"] = intent_cache.stats()
+    data["intent_paths"] = intent_rules.stats()
+    data["http_pools"] = http_client.stats()
+    data["providers"] = providers.stats()
+    data["offer_cache"] = offer_cache.stats()
+    data["llama_coalescing"] = llama_flight.stats()
+    data["db_pool"] = mysql_pool_stats()
+    data["geo_index"] = geo.index.stats()
+    data["recommender"] = recommender.engine.stats()
+    data["prices"] = prices.book.stats()
+    return Response(data)
+
 @api_view(["GET"])
 def collect_external_data(request):
     return Response({
@@ -800,4 +783,10 @@ class DestinationSerializer(serializers.Serializer):
     avg_price_level = serializers.IntegerField(allow_null=True)
     popularity_score = serializers.DecimalField(max_digits=5, decimal_places=2, allow_null=True)
     image_url = serializers.CharField(allow_null=True)
-    city = CityInlineSerializer()
\ No newline at end of file
+    city = CityInlineSerializer()
+
+class NearbyDestinationSerializer(DestinationSerializer):
+    distance_km = serializers.FloatField()
+
+class RecommendationSerializer(DestinationSerializer):
+    score = serializers.FloatField()
\ No newline at end of file
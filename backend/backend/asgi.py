@@ -5,6 +5,10 @@ It exposes the ASGI callable as a module-level variable named ``application``.
 
 For more information on this file, see
 https://docs.djangoproject.com/en/5.2/howto/deployment/asgi/
+
+Requis pour le chat asynchrone (/api/chat/async/) et le streaming SSE
+(/api/chat/stream/) :
+    uvicorn backend.asgi:application --port 8001
 """
 
 import os
@@ -31,6 +31,8 @@ CORS_ALLOWED_ORIGINS = [
     "http://localhost:5173",
     "http://127.0.0.1:5173",  # ✅ Ajout de 127.0.0.1 pour compatibilité
 ]
+# En-têtes lisibles par le front (pagination et cache de /api/destinations/)
+CORS_EXPOSE_HEADERS = ["ETag", "Last-Modified", "X-Next-Cursor", "Link"]
 
 ALLOWED_HOSTS = ["127.0.0.1", "localhost"]
 
@@ -102,6 +104,141 @@ DATABASES = {
     }
 }
 
+# Réutilisation des connexions MySQL (DB_POOL_MODE) :
+# - "pool" : pool partagé par les threads (api/mysql_pool), connexion rendue
+#   à la fin de chaque requête, ping à l'emprunt ; compatible WSGI et ASGI ;
+# - "persistent" : une connexion par thread gardée DB_CONN_MAX_AGE secondes
+#   (à éviter sous ASGI, où chaque requête peut changer de thread) ;
+# - "none" : une connexion par requête (comportement Django par défaut).
+DB_POOL_MODE = os.getenv('DB_POOL_MODE', 'pool')
+if DB_POOL_MODE == 'pool':
+    DATABASES['default']['ENGINE'] = 'api.mysql_pool'
+    DATABASES['default']['POOL'] = {
+        'MAX_SIZE': int(os.getenv('DB_POOL_MAX_SIZE', '10')),
+        'IDLE_TIMEOUT': float(os.getenv('DB_POOL_IDLE_TIMEOUT', '300')),
+        'CHECKOUT_TIMEOUT': float(os.getenv('DB_POOL_CHECKOUT_TIMEOUT', '10')),
+        'HEALTH_CHECK_AFTER': float(os.getenv('DB_POOL_HEALTH_CHECK_AFTER', '1')),
+    }
+elif DB_POOL_MODE == 'persistent':
+    DATABASES['default']['CONN_MAX_AGE'] = int(os.getenv('DB_CONN_MAX_AGE', '60'))
+    DATABASES['default']['CONN_HEALTH_CHECKS'] = True
+
+# Cache
+# https://docs.djangoproject.com/en/5.2/topics/cache/
+# "intent" : intentions extraites par Llama (voir api/intent_cache.py).
+# Backend interchangeable : locmem (défaut), filebased, db...
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'intent': {
+        'BACKEND': os.getenv('INTENT_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('INTENT_CACHE_LOCATION', 'intent-cache'),
+        'TIMEOUT': int(os.getenv('INTENT_CACHE_TTL', '3600')),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('INTENT_CACHE_MAX_ENTRIES', '5000'))},
+    },
+    # "offers" : offres par destination / tranche de budget (voir api/offer_cache.py).
+    # TIMEOUT = durée de vie totale ; au-delà de OFFER_CACHE_FRESH_TTL l'entrée
+    # est servie puis rafraîchie en arrière-plan.
+    'offers': {
+        'BACKEND': os.getenv('OFFER_CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv('OFFER_CACHE_LOCATION', 'offer-cache'),
+        'TIMEOUT': int(os.getenv('OFFER_CACHE_TTL', '3600')),
+        'OPTIONS': {'MAX_ENTRIES': int(os.getenv('OFFER_CACHE_MAX_ENTRIES', '2000'))},
+    },
+}
+OFFER_CACHE_FRESH_TTL = int(os.getenv('OFFER_CACHE_FRESH_TTL', '300'))
+
+# Extraction d'intention : confiance minimale des règles pour éviter l'appel
+# à Llama, et part des requêtes rejouées sur Llama pour mesurer le désaccord
+INTENT_RULES_THRESHOLD = float(os.getenv('INTENT_RULES_THRESHOLD', '0.8'))
+INTENT_SHADOW_RATE = float(os.getenv('INTENT_SHADOW_RATE', '0.05'))
+# Fréquence de reconstruction du gazetteer depuis la table cities
+GAZETTEER_REFRESH_SECONDS = int(os.getenv('GAZETTEER_REFRESH_SECONDS', '3600'))
+
+# Tâches de fond (sonde Llama, gazetteer, index géo / prix / recommandations) :
+# "1" ou "0" pour forcer ; "auto" (défaut) = seulement dans les processus qui
+# servent des requêtes (runserver, gunicorn, uvicorn, daphne...), jamais pour
+# migrate, shell, test, collectstatic et les autres commandes manage.py
+BACKGROUND_TASKS = os.getenv('BACKGROUND_TASKS', 'auto')
+
+# Serveur Llama (llama_server.py) et sonde de santé en arrière-plan (api/llama_backend.py) :
+# intervalle normal / tant que le serveur est injoignable, timeout d'une sonde,
+# échecs consécutifs avant de basculer en mode simulation
+LLAMA_URL = os.getenv('LLAMA_URL', 'http://127.0.0.1:8000')
+# Répliques (ex. "http://127.0.0.1:8000,http://127.0.0.1:8002") : routage vers la
+# moins chargée ; avec l'affinité, un user_id reste sur la même réplique tant
+# qu'elle n'a pas plus de LLAMA_AFFINITY_MAX_SKEW requêtes en cours que la moins chargée
+LLAMA_URLS = [url.strip().rstrip('/') for url in os.getenv('LLAMA_URLS', LLAMA_URL).split(',') if url.strip()]
+LLAMA_SESSION_AFFINITY = os.getenv('LLAMA_SESSION_AFFINITY', '1') == '1'
+LLAMA_AFFINITY_MAX_SKEW = int(os.getenv('LLAMA_AFFINITY_MAX_SKEW', '4'))
+LLAMA_PROBE_INTERVAL = float(os.getenv('LLAMA_PROBE_INTERVAL', '10'))
+LLAMA_PROBE_RETRY_INTERVAL = float(os.getenv('LLAMA_PROBE_RETRY_INTERVAL', '2'))
+LLAMA_PROBE_TIMEOUT = float(os.getenv('LLAMA_PROBE_TIMEOUT', '2'))
+LLAMA_FAILURE_THRESHOLD = int(os.getenv('LLAMA_FAILURE_THRESHOLD', '2'))
+
+# Réponse du chat : gabarit par défaut ("off"), résumé Llama attendu ("sync")
+# ou lancé en arrière-plan et récupéré sur /api/chat/summary/<id>/ ("async").
+# Le champ llm_summary d'une requête remplace ce réglage. En mode async, les
+# résumés passent par le cache "default" : le partager (Redis...) entre workers.
+LLM_SUMMARY_MODE = os.getenv('LLM_SUMMARY_MODE', 'off')
+LLM_SUMMARY_WORKERS = int(os.getenv('LLM_SUMMARY_WORKERS', '2'))
+LLM_SUMMARY_TTL = int(os.getenv('LLM_SUMMARY_TTL', '300'))
+
+# Client HTTP sortant (api/http_client.py) : pools keep-alive, timeouts
+# (connexion, lecture) et rejeu avec backoff des GET
+HTTP_CONNECT_TIMEOUT = float(os.getenv('HTTP_CONNECT_TIMEOUT', '3.05'))
+HTTP_READ_TIMEOUT = float(os.getenv('HTTP_READ_TIMEOUT', '30'))
+HTTP_POOL_MAXSIZE = int(os.getenv('HTTP_POOL_MAXSIZE', '20'))
+HTTP_RETRIES = int(os.getenv('HTTP_RETRIES', '2'))
+HTTP_BACKOFF = float(os.getenv('HTTP_BACKOFF', '0.3'))
+# Connexions simultanées max par hôte (au-delà, l'appel attend une connexion libre)
+HTTP_HOST_LIMITS = {
+    url: int(os.getenv('LLAMA_MAX_CONNECTIONS', '8')) for url in LLAMA_URLS
+}
+
+# Collecte des offres : threads partagés et échéance globale (secondes)
+PROVIDER_WORKERS = int(os.getenv('PROVIDER_WORKERS', '16'))
+PROVIDER_DEADLINE = float(os.getenv('PROVIDER_DEADLINE', '8'))
+# Fournisseurs actifs, dans l'ordre d'affichage (voir api/offer_providers.py)
+OFFER_PROVIDERS = os.getenv(
+    'OFFER_PROVIDERS',
+    'tripadvisor,booking,expedia,deep_links,scraper_booking,scraper_airbnb'
+).split(',')
+
+# Validateurs HTTP de /api/destinations/ (api/catalog.py) : nombre de lignes et
+# updated_at max de destinations / cities, relus au plus toutes les
+# CATALOG_VERSION_TTL secondes
+CATALOG_VERSION_TTL = float(os.getenv('CATALOG_VERSION_TTL', '5'))
+
+# Index géographique des villes (api/geo.py) : taille des cellules (degrés),
+# rafraîchissement incrémental / reconstruction complète (secondes), taille du
+# delta avant fusion, et alternatives proposées par le chat
+GEO_CELL_DEG = float(os.getenv('GEO_CELL_DEG', '1.0'))
+GEO_REFRESH_INTERVAL = float(os.getenv('GEO_REFRESH_INTERVAL', '60'))
+GEO_FULL_REBUILD_INTERVAL = float(os.getenv('GEO_FULL_REBUILD_INTERVAL', '3600'))
+GEO_DELTA_MAX = int(os.getenv('GEO_DELTA_MAX', '512'))
+GEO_NEAREST_START_KM = float(os.getenv('GEO_NEAREST_START_KM', '50'))
+GEO_ALTERNATIVES_KM = float(os.getenv('GEO_ALTERNATIVES_KM', '150'))
+GEO_ALTERNATIVES_LIMIT = int(os.getenv('GEO_ALTERNATIVES_LIMIT', '3'))
+
+# Recommandations (api/recommender.py) : rafraîchissement incrémental et
+# reconstruction complète (secondes)
+RECO_REFRESH_INTERVAL = float(os.getenv('RECO_REFRESH_INTERVAL', '60'))
+RECO_FULL_REBUILD_INTERVAL = float(os.getenv('RECO_FULL_REBUILD_INTERVAL', '3600'))
+
+# Agrégats de prix des offres (api/prices.py). ROOM_TYPE_CITY_SQL renvoie les
+# lignes (room_type_id, city_id) qui rattachent room_offers aux villes. Requise :
+# vide, avertissement api.W001 au démarrage, /api/prices/ en 503, et les deep
+# links / recommandations retombent sur le budget et avg_price_level.
+ROOM_TYPE_CITY_SQL = os.getenv('ROOM_TYPE_CITY_SQL', '')
+PRICE_DEFAULT_CURRENCY = os.getenv('PRICE_DEFAULT_CURRENCY', 'TND')
+PRICE_BUCKET_MONTHS = int(os.getenv('PRICE_BUCKET_MONTHS', '12'))
+PRICE_REFRESH_INTERVAL = float(os.getenv('PRICE_REFRESH_INTERVAL', '60'))
+PRICE_FULL_REBUILD_INTERVAL = float(os.getenv('PRICE_FULL_REBUILD_INTERVAL', '3600'))
+PRICE_DELTA_MAX = int(os.getenv('PRICE_DELTA_MAX', '5000'))
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -19,7 +19,7 @@ Including another URLconf
 # backend/urls.py
 from django.contrib import admin
 from django.urls import path
-from api import views
+from api import views, async_views
 
 urlpatterns = [
     path('', views.home),
@@ -33,9 +33,17 @@ urlpatterns = [
     # Chat - Les 2 URLs pointent vers la même fonction
     path('api/chat/', views.intelligent_travel_chat),
     path('api/intelligent_travel_chat/', views.intelligent_travel_chat),
+    path('api/chat/summary/<str:summary_id>/', views.chat_summary),  # Résumé Llama différé (llm_summary="async")
+    
+    # Chat asynchrone et streaming (SSE) - nécessitent un serveur ASGI (voir backend/asgi.py)
+    path('api/chat/async/', async_views.intelligent_travel_chat_async),
+    path('api/chat/stream/', async_views.intelligent_travel_chat_stream),
     
     # Autres
     path('api/destinations/', views.destinations_list),
+    path('api/destinations/nearby/', views.destinations_nearby),  # ?lat=&lng= ou ?city=, radius_km
     path('api/recommendations/', views.recommendations),
+    path('api/prices/', views.city_prices),  # ?city= ou ?city_id=, currency, checkin, checkout
     path('api/collect-external-data/', views.collect_external_data),
+    path('api/metrics/', views.metrics_view),
 ]
\ No newline at end of file
@@ -0,0 +1,220 @@
+# -*- coding: utf-8 -*-
+"""
+Historique des conversations du serveur Llama.
+
+Deux implémentations, même interface (history / append_exchange / reset / stats) :
+- MemoryConversationStore : LRU + TTL en mémoire, borné en nombre
+  d'utilisateurs et en octets (un seul processus) ;
+- SQLiteConversationStore : fichier SQLite partagé par tous les workers d'une
+  même machine (voir llama_cluster.py).
+
+Chaque message est stocké sous forme compacte (code de rôle, texte) et n'est
+développé en dict qu'à la lecture.
+"""
+import os
+import sqlite3
+import threading
+import time
+from collections import OrderedDict, deque
+
+ROLES = {"U": "Utilisateur", "A": "Assistant"}
+
+
+def _expand(messages):
+    return [{"role": ROLES[code], "content": content} for code, content in messages]
+
+
+def _message_size(content):
+    # Texte + surcoût approximatif du tuple et de la chaîne Python
+    return len(content) + 64
+
+
+class MemoryConversationStore:
+    """
+    Args:
+        max_messages: messages gardés par utilisateur
+        max_users: conversations max (LRU au-delà)
+        ttl: secondes d'inactivité avant expiration
+        max_bytes: taille totale max des messages (une conversation seule plus
+            grosse que max_bytes est raccourcie, en gardant au moins le
+            dernier échange)
+    """
+
+    def __init__(self, max_messages=10, max_users=10000, ttl=3600, max_bytes=64 * 1024 * 1024):
+        self.max_messages = max_messages
+        self.max_users = max_users
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self._conversations = OrderedDict()  # user_id -> [deque de (rôle, texte), dernière activité, octets]
+        self._bytes = 0
+        self._lock = threading.Lock()
+        self.evictions = 0
+        self.expirations = 0
+
+    def history(self, user_id):
+        """Messages de la conversation, du plus ancien au plus récent"""
+        key = str(user_id)
+        with self._lock:
+            entry = self._conversations.get(key)
+            if entry is None:
+                return []
+            if time.monotonic() - entry[1] > self.ttl:
+                self._remove(key)
+                self.expirations += 1
+                return []
+            self._conversations.move_to_end(key)
+            return _expand(entry[0])
+
+    def append_exchange(self, user_id, user_message, ai_response):
+        """Ajoute un échange (utilisateur puis assistant)"""
+        key = str(user_id)
+        with self._lock:
+            entry = self._conversations.get(key)
+            if entry is None:
+                entry = self._conversations[key] = [deque(), 0, 0]
+            messages = entry[0]
+            for code, content in (("U", user_message), ("A", ai_response)):
+                messages.append((code, content))
+                entry[2] += _message_size(content)
+                self._bytes += _message_size(content)
+            # Trop de messages, ou conversation seule au-delà de max_bytes :
+            # on retire ses plus anciens messages plutôt que de l'évincer
+            while len(messages) > self.max_messages or (entry[2] > self.max_bytes and len(messages) > 2):
+                _, content = messages.popleft()
+                entry[2] -= _message_size(content)
+                self._bytes -= _message_size(content)
+            entry[1] = time.monotonic()
+            self._conversations.move_to_end(key)
+            self._evict(keep=key)
+
+    def reset(self, user_id):
+        with self._lock:
+            self._remove(str(user_id))
+
+    def _remove(self, key):
+        entry = self._conversations.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry[2]
+
+    def _evict(self, keep=None):
+        # Conversations expirées en tête de LRU, puis les plus anciennes si trop gros ;
+        # jamais celle qui vient d'être écrite (keep, en fin de LRU)
+        now = time.monotonic()
+        while self._conversations:
+            key, entry = next(iter(self._conversations.items()))
+            if key == keep:
+                break
+            if now - entry[1] > self.ttl:
+                self.expirations += 1
+            elif len(self._conversations) > self.max_users or self._bytes > self.max_bytes:
+                self.evictions += 1
+            else:
+                break
+            self._remove(key)
+
+    def stats(self):
+        with self._lock:
+            return {
+                "backend": "memory",
+                "conversations": len(self._conversations),
+                "bytes": self._bytes,
+                "max_bytes": self.max_bytes,
+                "max_users": self.max_users,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
+
+
+class SQLiteConversationStore:
+    """
+    Args:
+        path: fichier SQLite (partagé entre processus)
+        max_messages: messages gardés par utilisateur
+        ttl: secondes d'inactivité avant expiration
+    """
+
+    PURGE_INTERVAL = 60
+
+    def __init__(self, path, max_messages=10, ttl=3600):
+        self.path = path
+        self.max_messages = max_messages
+        self.ttl = ttl
+        self._local = threading.local()
+        self._last_purge = 0
+        with self._connection() as db:
+            db.execute(
+                "CREATE TABLE IF NOT EXISTS messages ("
+                "id INTEGER PRIMARY KEY AUTOINCREMENT, user_id TEXT NOT NULL, "
+                "role TEXT NOT NULL, content TEXT NOT NULL, created_at REAL NOT NULL)"
+            )
+            db.execute("CREATE INDEX IF NOT EXISTS messages_user ON messages (user_id, id)")
+
+    def _connection(self):
+        db = getattr(self._local, "db", None)
+        if db is None:
+            db = sqlite3.connect(self.path, timeout=5)
+            # WAL : lectures concurrentes pendant qu'un autre worker écrit
+            db.execute("PRAGMA journal_mode=WAL")
+            db.execute("PRAGMA synchronous=NORMAL")
+            self._local.db = db
+        return db
+
+    def history(self, user_id):
+        db = self._connection()
+        rows = db.execute(
+            "SELECT role, content FROM messages WHERE user_id = ? AND created_at > ? "
+            "ORDER BY id DESC LIMIT ?",
+            (str(user_id), time.time() - self.ttl, self.max_messages),
+        ).fetchall()
+        return _expand(reversed(rows))
+
+    def append_exchange(self, user_id, user_message, ai_response):
+        key = str(user_id)
+        now = time.time()
+        with self._connection() as db:
+            db.executemany(
+                "INSERT INTO messages (user_id, role, content, created_at) VALUES (?, ?, ?, ?)",
+                [(key, "U", user_message, now), (key, "A", ai_response, now)],
+            )
+            db.execute(
+                "DELETE FROM messages WHERE user_id = ? AND id NOT IN "
+                "(SELECT id FROM messages WHERE user_id = ? ORDER BY id DESC LIMIT ?)",
+                (key, key, self.max_messages),
+            )
+            if now - self._last_purge > self.PURGE_INTERVAL:
+                self._last_purge = now
+                db.execute("DELETE FROM messages WHERE created_at < ?", (now - self.ttl,))
+
+    def reset(self, user_id):
+        with self._connection() as db:
+            db.execute("DELETE FROM messages WHERE user_id = ?", (str(user_id),))
+
+    def stats(self):
+        db = self._connection()
+        conversations, messages = db.execute(
+            "SELECT COUNT(DISTINCT user_id), COUNT(*) FROM messages WHERE created_at > ?",
+            (time.time() - self.ttl,),
+        ).fetchone()
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "conversations": conversations,
+            "messages": messages,
+            "bytes": os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+        }
+
+
+def store_from_env():
+    """
+    LLAMA_CONVERSATION_STORE=memory (défaut) ou sqlite (LLAMA_CONVERSATION_DB),
+    LLAMA_CONVERSATION_TTL, LLAMA_CONVERSATION_MAX_USERS, LLAMA_CONVERSATION_MAX_MB
+    """
+    ttl = int(os.getenv("LLAMA_CONVERSATION_TTL", "3600"))
+    if os.getenv("LLAMA_CONVERSATION_STORE", "memory") == "sqlite":
+        path = os.getenv("LLAMA_CONVERSATION_DB", "conversations.sqlite3")
+        return SQLiteConversationStore(path, ttl=ttl)
+    return MemoryConversationStore(
+        max_users=int(os.getenv("LLAMA_CONVERSATION_MAX_USERS", "10000")),
+        ttl=ttl,
+        max_bytes=int(os.getenv("LLAMA_CONVERSATION_MAX_MB", "64")) * 1024 * 1024,
+    )
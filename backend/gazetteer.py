@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+"""
+Gazetteer de mots-clés (villes, budget, intérêts) avec recherche multi-motifs.
+
+Tous les mots-clés sont compilés une fois dans un automate Aho-Corasick :
+un seul passage sur le message trouve toutes les occurrences, quel que soit
+le nombre de mots-clés. La recherche ignore la casse et les accents et ne
+retient que les mots entiers (un "s" final de pluriel est toléré).
+Partagé entre le serveur Llama (Flask) et l'API Django.
+"""
+import unicodedata
+from collections import deque
+
+
+def fold(text):
+    """Minuscules sans accents : "Hôtel à Québec" -> "hotel a quebec" """
+    text = unicodedata.normalize("NFKD", text.casefold())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+class Match:
+    def __init__(self, start, end, keyword, category, value):
+        self.start = start
+        self.end = end
+        self.keyword = keyword
+        self.category = category
+        self.value = value
+
+    def __repr__(self):
+        return f"Match({self.keyword!r}, {self.category}={self.value!r}, {self.start}:{self.end})"
+
+
+class Gazetteer:
+    """
+    Automate Aho-Corasick sur des mots-clés catégorisés.
+
+    Usage:
+        g = Gazetteer()
+        g.add("pas cher", "budget", "economique")
+        g.build()
+        g.first("un hotel pas cher", "budget")  # -> "economique"
+    """
+
+    def __init__(self):
+        self._entries = []
+        self._goto = [{}]
+        self._fail = [0]
+        self._out = [[]]
+        self._built = False
+
+    def add(self, keyword, category, value):
+        keyword = fold(keyword).strip()
+        if keyword:
+            self._entries.append((keyword, category, value))
+            self._built = False
+
+    def entries(self):
+        return list(self._entries)
+
+    def extended(self, entries):
+        """Nouveau gazetteer avec les mots-clés actuels + entries (keyword, category, value)"""
+        other = Gazetteer()
+        for keyword, category, value in self._entries:
+            other.add(keyword, category, value)
+        for keyword, category, value in entries:
+            other.add(keyword, category, value)
+        return other.build()
+
+    def build(self):
+        """Construit l'automate (trie + liens d'échec)"""
+        self._goto, self._fail, self._out = [{}], [0], [[]]
+        for index, (keyword, _, _) in enumerate(self._entries):
+            state = 0
+            for char in keyword:
+                nxt = self._goto[state].get(char)
+                if nxt is None:
+                    nxt = len(self._goto)
+                    self._goto[state][char] = nxt
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._out.append([])
+                state = nxt
+            self._out[state].append(index)
+
+        # Parcours en largeur pour les liens d'échec
+        todo = deque(self._goto[0].values())
+        while todo:
+            state = todo.popleft()
+            for char, nxt in self._goto[state].items():
+                todo.append(nxt)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[nxt] = self._goto[fallback].get(char, 0)
+                self._out[nxt].extend(self._out[self._fail[nxt]])
+        self._built = True
+        return self
+
+    def find(self, text):
+        """Toutes les occurrences (mots entiers), triées par position"""
+        if not self._built:
+            self.build()
+        text = fold(text)
+        matches = []
+        state = 0
+        for pos, char in enumerate(text):
+            while state and char not in self._goto[state]:
+                state = self._fail[state]
+            state = self._goto[state].get(char, 0)
+            for index in self._out[state]:
+                keyword, category, value = self._entries[index]
+                start = pos - len(keyword) + 1
+                end = self._word_end(text, pos + 1)
+                if end is not None and (start == 0 or not text[start - 1].isalnum()):
+                    matches.append(Match(start, end, keyword, category, value))
+        matches.sort(key=lambda m: (m.start, -(m.end - m.start)))
+        return matches
+
+    @staticmethod
+    def _word_end(text, end):
+        """Fin du mot si la correspondance s'arrête sur une frontière (pluriel en "s" toléré)"""
+        if end == len(text) or not text[end].isalnum():
+            return end
+        if text[end] == "s" and (end + 1 == len(text) or not text[end + 1].isalnum()):
+            return end + 1
+        return None
+
+    def first(self, text, category):
+        """Valeur de la première occurrence de la catégorie (ou None)"""
+        for match in self.find(text):
+            if match.category == category:
+                return match.value
+        return None
+
+    def values(self, text, category):
+        """Valeurs distinctes de la catégorie, dans l'ordre d'apparition"""
+        values = []
+        for match in self.find(text):
+            if match.category == category and match.value not in values:
+                values.append(match.value)
+        return values
+
+
+# -----------------------------
+# MOTS-CLÉS PAR DÉFAUT
+# -----------------------------
+DESTINATION_KEYWORDS = {
+    "paris": "Paris",
+    "marrakech": "Marrakech",
+    "maroc": "Marrakech",
+    "barcelone": "Barcelone",
+    "barcelona": "Barcelone",
+    "rome": "Rome",
+    "dubai": "Dubaï",
+    "hammamet": "Hammamet",
+    "hamamet": "Hammamet",
+    "sousse": "Sousse",
+    "djerba": "Djerba",
+    "tunis": "Tunis",
+    "canada": "Canada",
+    "new york": "New York",
+    "london": "Londres",
+    "londres": "Londres",
+    "tokyo": "Tokyo",
+    "madrid": "Madrid",
+    "berlin": "Berlin",
+    "istanbul": "Istanbul",
+    "montreal": "Montréal",
+    "quebec": "Québec",
+    "toronto": "Toronto",
+    "vancouver": "Vancouver",
+}
+
+BUDGET_KEYWORDS = {
+    "pas cher": "economique",
+    "economique": "economique",
+    "petit budget": "economique",
+    "luxe": "luxe",
+    "premium": "luxe",
+    "moyen": "moyen",
+    "standard": "moyen",
+}
+
+INTEREST_KEYWORDS = {
+    "plage": "plage",
+    "mer": "plage",
+    "culture": "culture",
+    "musee": "culture",
+    "histoire": "culture",
+    "nature": "nature",
+    "randonnee": "nature",
+    "montagne": "nature",
+    "aventure": "aventure",
+    "sport": "aventure",
+}
+
+
+def build_default_gazetteer():
+    gazetteer = Gazetteer()
+    for category, keywords in (
+        ("destination", DESTINATION_KEYWORDS),
+        ("budget", BUDGET_KEYWORDS),
+        ("interest", INTEREST_KEYWORDS),
+    ):
+        for keyword, value in keywords.items():
+            gazetteer.add(keyword, category, value)
+    return gazetteer.build()
+
+
+DEFAULT_GAZETTEER = build_default_gazetteer()
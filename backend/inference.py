@@ -0,0 +1,379 @@
+# -*- coding: utf-8 -*-
+"""
+Couche d'inférence du serveur Llama.
+
+Un worker dédié possède le modèle GPT4All : les routes Flask ne l'appellent
+jamais directement, elles déposent une requête dans une file bornée et
+attendent leur Future. Le worker regroupe les requêtes en attente par lots
+(taille max + temps d'attente max) et les exécute une par une sur le modèle.
+"""
+import os
+import queue
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future, TimeoutError as FutureTimeoutError
+
+
+class QueueFullError(Exception):
+    """File d'inférence pleine : le serveur est surchargé."""
+
+    def __init__(self, retry_after):
+        super().__init__("File d'inference pleine")
+        self.retry_after = retry_after
+
+
+class InferenceTimeoutError(Exception):
+    """La réponse n'a pas été produite dans le délai imparti."""
+
+    def __init__(self, retry_after):
+        super().__init__("Delai d'inference depasse")
+        self.retry_after = retry_after
+
+
+def config_from_env():
+    """Lit la configuration du worker depuis les variables d'environnement"""
+    return {
+        "max_batch_size": int(os.getenv("LLAMA_MAX_BATCH_SIZE", "4")),
+        "max_wait_ms": int(os.getenv("LLAMA_BATCH_WAIT_MS", "20")),
+        "queue_depth": int(os.getenv("LLAMA_QUEUE_DEPTH", "32")),
+        "request_timeout": float(os.getenv("LLAMA_REQUEST_TIMEOUT", "120")),
+    }
+
+
+class StopSequences:
+    """
+    Critère d'arrêt sur chaînes (ex. ["\nUtilisateur:"]), utilisable comme stop
+    d'un job. Comparé par valeur : deux requêtes identiques restent dédupliquées.
+    """
+
+    def __init__(self, sequences):
+        self.sequences = tuple(s for s in sequences if s)
+        self.horizon = max((len(s) for s in self.sequences), default=0)
+
+    def __call__(self):
+        tail = ""
+
+        def stopper(token):
+            nonlocal tail
+            tail = (tail + token)[-(self.horizon + len(token)):]
+            return any(s in tail for s in self.sequences)
+        return stopper
+
+    def trim(self, text):
+        """Coupe le texte à la première séquence d'arrêt"""
+        cut = min((text.find(s) for s in self.sequences if s in text), default=-1)
+        return text[:cut] if cut >= 0 else text
+
+    def safe_length(self, text):
+        """
+        Longueur du début de text qui ne peut plus appartenir à une séquence
+        d'arrêt (la fin peut encore être le début de l'une d'elles).
+        """
+        for size in range(min(self.horizon - 1, len(text)), 0, -1):
+            suffix = text[-size:]
+            if any(s.startswith(suffix) for s in self.sequences):
+                return len(text) - size
+        return len(text)
+
+    def __eq__(self, other):
+        return isinstance(other, StopSequences) and other.sequences == self.sequences
+
+    def __hash__(self):
+        return hash(self.sequences)
+
+
+class GenerationJob:
+    """Une requête de génération en attente dans la file"""
+
+    def __init__(self, prompt, max_tokens=150, temp=0.7, stream=False, session_id=None, cache_prefix=None,
+                 stop=None):
+        self.prompt = prompt
+        self.max_tokens = max_tokens
+        self.temp = temp
+        # Fabrique d'un critère d'arrêt : stop() -> callable(token) -> True pour arrêter
+        self.stop = stop
+        # Conversation d'origine et préfixe statique à réutiliser (voir kv_cache.py)
+        self.session_id = session_id
+        self.cache_prefix = cache_prefix
+        self.future = Future()
+        self.enqueued_at = time.monotonic()
+        # En mode streaming, les tokens sont poussés dans cette file au fil de l'eau
+        self.tokens = queue.Queue() if stream else None
+        self.abandoned = False
+        # {"prompt_tokens", "completion_tokens"} une fois la génération terminée
+        self.usage = None
+
+    def key(self):
+        """Deux jobs de même clé produisent la même génération"""
+        return (self.prompt, self.max_tokens, self.temp, self.stop, self.session_id, self.cache_prefix)
+
+
+_END_OF_STREAM = object()
+
+
+class TokenStream:
+    """Itérateur sur les tokens d'un job en streaming"""
+
+    def __init__(self, job, timeout):
+        self.job = job
+        self.timeout = timeout
+
+    def __iter__(self):
+        while True:
+            try:
+                item = self.job.tokens.get(timeout=self.timeout)
+            except queue.Empty:
+                self.close()
+                raise InferenceTimeoutError(self.timeout)
+            if item is _END_OF_STREAM:
+                return
+            if isinstance(item, Exception):
+                raise item
+            yield item
+
+    def close(self):
+        """L'appelant est parti : annuler le job ou arrêter la génération"""
+        self.job.abandoned = True
+        self.job.future.cancel()
+
+
+class InferenceWorker:
+    """
+    Worker unique propriétaire du modèle.
+
+    Args:
+        model: instance GPT4All (jamais partagée avec d'autres threads)
+        max_batch_size: nombre max de requêtes regroupées dans un lot
+        max_wait_ms: attente max pour compléter un lot après la 1ère requête
+        queue_depth: taille max de la file (au-delà : QueueFullError)
+        request_timeout: délai max d'attente d'un appelant (secondes)
+        state_cache: PromptStateCache optionnel (reprise depuis un préfixe en cache)
+    """
+
+    def __init__(self, model, max_batch_size=4, max_wait_ms=20, queue_depth=32, request_timeout=120,
+                 state_cache=None):
+        self.model = model
+        self.state_cache = state_cache
+        self.max_batch_size = max(1, max_batch_size)
+        self.max_wait = max(0, max_wait_ms) / 1000.0
+        self.request_timeout = request_timeout
+        self._queue = queue.Queue(maxsize=max(1, queue_depth))
+        self._thread = None
+        self._stats_lock = threading.Lock()
+        self._latencies = deque(maxlen=1000)
+        self._completed = 0
+        self._rejected = 0
+        self._timeouts = 0
+        self._batches = 0
+        self._deduplicated = 0
+        self._tokens = 0
+        self._prompt_tokens = 0
+        self._busy_seconds = 0.0
+
+    def start(self):
+        """Démarre le thread worker (idempotent)"""
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._run, name="llama-inference", daemon=True)
+            self._thread.start()
+        return self
+
+    # -----------------------------
+    # API appelant
+    # -----------------------------
+    def submit(self, prompt, max_tokens=150, temp=0.7, session_id=None, cache_prefix=None, stop=None):
+        """Dépose une requête dans la file et retourne son Future"""
+        job = GenerationJob(prompt, max_tokens=max_tokens, temp=temp,
+                            session_id=session_id, cache_prefix=cache_prefix, stop=stop)
+        self._enqueue(job)
+        return job.future
+
+    def stream(self, prompt, max_tokens=150, temp=0.7, session_id=None, cache_prefix=None, stop=None):
+        """Dépose une requête en streaming et retourne un TokenStream"""
+        job = GenerationJob(prompt, max_tokens=max_tokens, temp=temp, stream=True,
+                            session_id=session_id, cache_prefix=cache_prefix, stop=stop)
+        self._enqueue(job)
+        return TokenStream(job, self.request_timeout)
+
+    def _enqueue(self, job):
+        try:
+            self._queue.put_nowait(job)
+        except queue.Full:
+            with self._stats_lock:
+                self._rejected += 1
+            raise QueueFullError(self.retry_after())
+
+    def generate(self, prompt, max_tokens=150, temp=0.7, timeout=None, session_id=None, cache_prefix=None,
+                 with_usage=False, stop=None):
+        """
+        Génère une réponse en passant par la file (bloquant pour l'appelant).
+        Avec with_usage=True, retourne (texte, usage) où usage compte les tokens.
+        stop: fabrique de critère d'arrêt anticipé (voir GenerationJob)
+        """
+        job = GenerationJob(prompt, max_tokens=max_tokens, temp=temp,
+                            session_id=session_id, cache_prefix=cache_prefix, stop=stop)
+        self._enqueue(job)
+        future = job.future
+        try:
+            text = future.result(timeout=timeout or self.request_timeout)
+            return (text, job.usage) if with_usage else text
+        except FutureTimeoutError:
+            # Si le job n'a pas encore démarré, il ne sera jamais exécuté
+            future.cancel()
+            with self._stats_lock:
+                self._timeouts += 1
+            raise InferenceTimeoutError(self.retry_after())
+
+    def retry_after(self):
+        """Estimation (secondes) du temps nécessaire pour vider la file"""
+        with self._stats_lock:
+            avg = (self._busy_seconds / self._completed) if self._completed else 5.0
+        return max(1, int(round(avg * (self._queue.qsize() + 1))))
+
+    # -----------------------------
+    # Boucle du worker
+    # -----------------------------
+    def _collect_batch(self):
+        """Attend une requête puis complète le lot jusqu'à max_batch_size / max_wait"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                if remaining <= 0:
+                    batch.append(self._queue.get_nowait())
+                else:
+                    batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            try:
+                self._process_batch(batch)
+            except Exception as e:
+                print(f"❌ Erreur worker inference: {e}")
+
+    def _process_batch(self, batch):
+        # Les jobs annulés (appelant parti) sont ignorés
+        jobs = [job for job in batch if job.future.set_running_or_notify_cancel()]
+        if not jobs:
+            return
+
+        # Regrouper les requêtes identiques : une seule génération par clé
+        groups = {}
+        for job in jobs:
+            groups.setdefault(job.key(), []).append(job)
+
+        with self._stats_lock:
+            self._batches += 1
+            self._deduplicated += len(jobs) - len(groups)
+
+        for group in groups.values():
+            first = group[0]
+            started = time.monotonic()
+            try:
+                text, usage = self._generate(first, group)
+            except Exception as e:
+                for job in group:
+                    job.future.set_exception(e)
+                    if job.tokens is not None:
+                        job.tokens.put(e)
+                continue
+            finished = time.monotonic()
+
+            for job in group:
+                job.usage = usage
+                job.future.set_result(text)
+                if job.tokens is not None:
+                    job.tokens.put(_END_OF_STREAM)
+
+            with self._stats_lock:
+                self._busy_seconds += finished - started
+                self._tokens += usage["completion_tokens"]
+                self._prompt_tokens += usage["prompt_tokens"] or 0
+                self._completed += len(group)
+                for job in group:
+                    self._latencies.append(finished - job.enqueued_at)
+
+    def _generate(self, job, group):
+        """
+        Exécute une génération sur le modèle, compte les tokens produits et
+        les diffuse aux jobs en streaming du groupe.
+        Retourne (texte, usage) ; prompt_tokens vaut None s'il n'est pas mesurable.
+        """
+        n_tokens = 0
+        streams = [j for j in group if j.tokens is not None]
+        stopper = job.stop() if job.stop is not None else None
+        # Texte produit / déjà diffusé : avec des séquences d'arrêt, on retient
+        # la fin qui pourrait encore en être le début (jamais envoyée au client)
+        produced = ""
+        sent = 0
+
+        def publish(visible):
+            nonlocal sent
+            if len(visible) > sent:
+                for j in streams:
+                    j.tokens.put(visible[sent:])
+                sent = len(visible)
+
+        def on_token(token_id, response):
+            nonlocal n_tokens, produced
+            n_tokens += 1
+            stopped = stopper is not None and stopper(response)
+            if streams:
+                produced += response
+                if not isinstance(job.stop, StopSequences):
+                    publish(produced)
+                elif stopped:
+                    publish(job.stop.trim(produced))
+                else:
+                    publish(produced[:job.stop.safe_length(produced)])
+            if stopped:
+                return False
+            # Arrêter la génération si tous les appelants sont partis
+            return not all(j.abandoned for j in group)
+
+        usage = {"prompt_tokens": None, "completion_tokens": 0}
+        if self.state_cache is not None and self.state_cache.enabled:
+            text = self.state_cache.generate(
+                job.prompt, job.max_tokens, job.temp, on_token, cache_prefix=job.cache_prefix
+            )
+            usage.update(self.state_cache.last_usage)
+        else:
+            text = self.model.generate(job.prompt, max_tokens=job.max_tokens, temp=job.temp, callback=on_token)
+        # Fin sans séquence d'arrêt : diffuser le texte retenu
+        if streams and isinstance(job.stop, StopSequences):
+            publish(job.stop.trim(produced))
+        usage["completion_tokens"] = n_tokens
+        return text.strip(), usage
+
+    # -----------------------------
+    # Statistiques
+    # -----------------------------
+    def stats(self):
+        """Statistiques de la file pour /health"""
+        with self._stats_lock:
+            latencies = sorted(self._latencies)
+            busy = self._busy_seconds
+            stats = {
+                "queue_size": self._queue.qsize(),
+                "queue_depth": self._queue.maxsize,
+                "max_batch_size": self.max_batch_size,
+                "batches": self._batches,
+                "completed": self._completed,
+                "deduplicated": self._deduplicated,
+                "rejected": self._rejected,
+                "timeouts": self._timeouts,
+                "tokens_generated": self._tokens,
+                "prompt_tokens": self._prompt_tokens,
+                "tokens_per_second": round(self._tokens / busy, 2) if busy else None,
+            }
+        if latencies:
+            stats["latency_p50_ms"] = round(latencies[len(latencies) // 2] * 1000)
+            stats["latency_p99_ms"] = round(latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))] * 1000)
+        if self.state_cache is not None:
+            stats["kv_cache"] = self.state_cache.stats()
+        return stats
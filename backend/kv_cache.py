@@ -0,0 +1,230 @@
+# -*- coding: utf-8 -*-
+"""
+Réutilisation de l'état du modèle (cache KV) entre requêtes.
+
+Seuls les préfixes statiques (préambule système, schéma JSON d'intention...)
+sont conservés : évalués une seule fois, chaque requête qui commence par ce
+texte reprend depuis là. Pas d'état par conversation : le prompt de chat est
+reconstruit à chaque tour (résumé, préférences, fenêtre d'historique, voir
+prompt_builder.py) et ne prolonge jamais le précédent, un tel état ne
+servirait qu'à évincer les préfixes.
+
+Les états sont des copies binaires du contexte llama.cpp, gardées dans un LRU
+borné en octets. Seul le worker d'inférence appelle ce module (pas de verrou).
+"""
+import ctypes
+import os
+from collections import OrderedDict
+
+
+class ModelStateAdapter:
+    """
+    Accès bas niveau à l'état du modèle via la bibliothèque llmodel de gpt4all.
+    available=False si les bindings installés n'exposent pas ces fonctions.
+    """
+
+    def __init__(self, model):
+        self.llm = getattr(model, "model", None)
+        self.available = False
+        try:
+            from gpt4all import pyllmodel
+            self.lib = pyllmodel.llmodel
+            self.lib.llmodel_get_state_size.argtypes = [ctypes.c_void_p]
+            self.lib.llmodel_get_state_size.restype = ctypes.c_uint64
+            self.lib.llmodel_save_state_data.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_uint8)]
+            self.lib.llmodel_save_state_data.restype = ctypes.c_uint64
+            self.lib.llmodel_restore_state_data.argtypes = [ctypes.c_void_p, ctypes.POINTER(ctypes.c_uint8)]
+            self.lib.llmodel_restore_state_data.restype = ctypes.c_uint64
+            self.available = self.llm is not None and hasattr(self.llm, "prompt_model")
+        except Exception as e:
+            print(f"Cache KV indisponible: {e}")
+
+    def n_past(self):
+        context = getattr(self.llm, "context", None)
+        return context.n_past if context is not None else 0
+
+    def save(self, n_past):
+        """Copie l'état courant du modèle (valide jusqu'au token n_past)"""
+        size = self.lib.llmodel_get_state_size(self.llm.model)
+        buf = (ctypes.c_uint8 * size)()
+        self.lib.llmodel_save_state_data(self.llm.model, buf)
+        return StateSnapshot(bytes(buf), n_past)
+
+    def restore(self, snapshot):
+        """Restaure un état ; False si le contexte n'est pas encore initialisé"""
+        if getattr(self.llm, "context", None) is None:
+            return False
+        buf = (ctypes.c_uint8 * len(snapshot.blob)).from_buffer_copy(snapshot.blob)
+        self.lib.llmodel_restore_state_data(self.llm.model, buf)
+        self.llm.context.n_past = snapshot.n_past
+        return True
+
+    def prompt(self, text, callback, max_tokens, temp, reset):
+        """Évalue text à la suite de l'état courant (ou depuis zéro si reset)"""
+        self.llm.prompt_model(
+            text, "%1", callback,
+            n_predict=max_tokens, temp=temp, reset_context=reset
+        )
+
+
+class StateSnapshot:
+    def __init__(self, blob, n_past):
+        self.blob = blob
+        self.n_past = n_past
+        self.text = ""
+
+    @property
+    def size(self):
+        return len(self.blob)
+
+
+class PromptStateCache:
+    """
+    LRU d'états du modèle, borné par max_bytes.
+
+    Args:
+        model: instance GPT4All (celle du worker)
+        max_bytes: mémoire max occupée par les états
+        max_prefixes: nombre max de préfixes statiques enregistrés
+    """
+
+    def __init__(self, model, max_bytes=512 * 1024 * 1024, max_prefixes=16):
+        self.model = model
+        self.adapter = ModelStateAdapter(model)
+        self.max_bytes = max_bytes
+        self.max_prefixes = max_prefixes
+        self._prefixes = OrderedDict()
+        self._states = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.reused_chars = 0
+        # Tokens du dernier appel (mesurés sur n_past), lus par le worker
+        self.last_usage = None
+
+    @property
+    def enabled(self):
+        return self.adapter.available and self.max_bytes > 0
+
+    # -----------------------------
+    # Préfixes statiques
+    # -----------------------------
+    def register_prefix(self, text):
+        """Déclare un préfixe statique (son état sera calculé à la 1ère utilisation)"""
+        if not text:
+            return
+        self._prefixes[text] = True
+        self._prefixes.move_to_end(text)
+        while len(self._prefixes) > self.max_prefixes:
+            old, _ = self._prefixes.popitem(last=False)
+            self._drop(("prefix", old))
+
+    def _matching_prefix(self, prompt):
+        best = None
+        for text in self._prefixes:
+            if prompt.startswith(text) and len(text) < len(prompt) and (best is None or len(text) > len(best)):
+                best = text
+        return best
+
+    # -----------------------------
+    # LRU
+    # -----------------------------
+    def _get(self, key):
+        snapshot = self._states.get(key)
+        if snapshot is not None:
+            self._states.move_to_end(key)
+        return snapshot
+
+    def _put(self, key, snapshot):
+        if snapshot.size > self.max_bytes:
+            return
+        self._drop(key)
+        self._states[key] = snapshot
+        self._bytes += snapshot.size
+        while self._bytes > self.max_bytes:
+            _, old = self._states.popitem(last=False)
+            self._bytes -= old.size
+            self.evictions += 1
+
+    def _drop(self, key):
+        old = self._states.pop(key, None)
+        if old is not None:
+            self._bytes -= old.size
+
+    # -----------------------------
+    # Génération
+    # -----------------------------
+    def generate(self, prompt, max_tokens, temp, callback, cache_prefix=None):
+        """
+        Génère en reprenant depuis l'état du plus long préfixe statique du prompt.
+        Retourne le texte généré.
+        """
+        if cache_prefix and prompt.startswith(cache_prefix):
+            self.register_prefix(cache_prefix)
+
+        parts = []
+        n_generated = 0
+
+        def on_token(token_id, response):
+            nonlocal n_generated
+            n_generated += 1
+            parts.append(response)
+            return callback(token_id, response)
+
+        def ignore_tokens(token_id, response):
+            return False
+
+        start = None
+        fresh = False
+        prefix = self._matching_prefix(prompt)
+        if prefix is not None:
+            snapshot = self._get(("prefix", prefix))
+            if snapshot is None:
+                # 1ère utilisation : évaluer le préfixe seul et mémoriser l'état
+                self.adapter.prompt(prefix, ignore_tokens, 0, temp, reset=True)
+                snapshot = self.adapter.save(self.adapter.n_past())
+                snapshot.text = prefix
+                self._put(("prefix", prefix), snapshot)
+                fresh = True
+            start = snapshot
+
+        reused_tokens = 0
+        if start is not None and self.adapter.restore(start):
+            if fresh:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self.reused_chars += len(start.text)
+            reused_tokens = start.n_past
+            self.adapter.prompt(prompt[len(start.text):], on_token, max_tokens, temp, reset=False)
+        else:
+            self.misses += 1
+            self.adapter.prompt(prompt, on_token, max_tokens, temp, reset=True)
+
+        prompt_tokens = self.adapter.n_past() - n_generated
+        self.last_usage = {
+            "prompt_tokens": prompt_tokens,
+            "reused_prompt_tokens": reused_tokens,
+            "completion_tokens": n_generated,
+        }
+
+        return "".join(parts)
+
+    def stats(self):
+        return {
+            "enabled": self.enabled,
+            "entries": len(self._states),
+            "prefixes": len(self._prefixes),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "reused_chars": self.reused_chars,
+        }
+
+
+def max_bytes_from_env():
+    """Mémoire max du cache KV (LLAMA_KV_CACHE_MB, 0 pour désactiver)"""
+    return int(os.getenv("LLAMA_KV_CACHE_MB", "512")) * 1024 * 1024
@@ -0,0 +1,172 @@
+# -*- coding: utf-8 -*-
+"""
+Mode production du serveur Llama : N processus llama_server.py, chacun sur son
+port, avec son nombre de threads et ses cœurs CPU dédiés.
+
+    python llama_cluster.py --workers 4 --threads 8
+
+Un seul processus ne sature pas une grosse machine (un modèle = un contexte
+llama.cpp = une génération à la fois). Ici chaque worker charge le modèle dans
+son propre processus ; le fichier GGUF est mappé en mémoire (mmap) par
+llama.cpp, donc les poids sont partagés entre workers via le cache de pages.
+
+Le superviseur relance un worker qui s'arrête ou dont /health ne répond plus.
+La répartition des requêtes est faite côté Django (api/llama_backend.py) :
+LLAMA_URLS doit lister les URLs affichées au démarrage.
+"""
+import argparse
+import os
+import signal
+import subprocess
+import sys
+import time
+import urllib.request
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+
+
+def available_cpus():
+    if hasattr(os, "sched_getaffinity"):
+        return sorted(os.sched_getaffinity(0))
+    return list(range(os.cpu_count() or 1))
+
+
+def cpu_spec(cpus):
+    """[0, 1, 2, 3, 8] -> "0-3,8" """
+    parts = []
+    start = prev = cpus[0]
+    for cpu in cpus[1:] + [None]:
+        if cpu is not None and cpu == prev + 1:
+            prev = cpu
+            continue
+        parts.append(str(start) if start == prev else f"{start}-{prev}")
+        if cpu is not None:
+            start = prev = cpu
+    return ",".join(parts)
+
+
+class ModelWorker:
+    """Un processus llama_server.py supervisé"""
+
+    def __init__(self, index, port, threads, cpus):
+        self.index = index
+        self.port = port
+        self.threads = threads
+        self.cpus = cpus
+        self.process = None
+        self.started_at = 0
+        self.health_failures = 0
+        self.restarts = 0
+
+    @property
+    def url(self):
+        return f"http://127.0.0.1:{self.port}"
+
+    def start(self):
+        env = dict(os.environ)
+        env["LLAMA_PORT"] = str(self.port)
+        env["LLAMA_THREADS"] = str(self.threads)
+        if self.cpus:
+            env["LLAMA_CPUS"] = cpu_spec(self.cpus)
+        self.process = subprocess.Popen([sys.executable, os.path.join(HERE, "llama_server.py")], env=env, cwd=HERE)
+        self.started_at = time.monotonic()
+        self.health_failures = 0
+        print(f"🚀 Worker {self.index} (pid {self.process.pid}) sur {self.url}, "
+              f"{self.threads} threads, CPU {env.get('LLAMA_CPUS', 'tous')}")
+
+    def stop(self, timeout=10):
+        if self.process is None or self.process.poll() is not None:
+            return
+        self.process.terminate()
+        try:
+            self.process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            self.process.kill()
+            self.process.wait()
+
+    def healthy(self, timeout):
+        try:
+            with urllib.request.urlopen(f"{self.url}/health", timeout=timeout) as response:
+                return response.status == 200
+        except Exception:
+            return False
+
+
+def plan_workers(n_workers, threads, base_port, pin):
+    """Découpe les CPU disponibles en blocs contigus, un par worker"""
+    cpus = available_cpus()
+    if threads is None:
+        threads = max(1, len(cpus) // n_workers)
+    workers = []
+    for index in range(n_workers):
+        block = cpus[index * threads:(index + 1) * threads] if pin else []
+        if pin and not block:
+            print(f"⚠️ Pas assez de CPU pour épingler le worker {index}, non épinglé")
+        workers.append(ModelWorker(index, base_port + index, threads, block))
+    return workers
+
+
+def supervise(workers, interval, startup_grace, max_health_failures, health_timeout):
+    stopping = False
+
+    def handle_signal(signum, frame):
+        nonlocal stopping
+        stopping = True
+
+    signal.signal(signal.SIGINT, handle_signal)
+    signal.signal(signal.SIGTERM, handle_signal)
+
+    for worker in workers:
+        worker.start()
+    print(f"\nLLAMA_URLS={','.join(worker.url for worker in workers)}\n")
+
+    while not stopping:
+        time.sleep(interval)
+        for worker in workers:
+            if stopping:
+                break
+            code = worker.process.poll()
+            if code is not None:
+                print(f"💥 Worker {worker.index} arrêté (code {code}), redémarrage")
+            elif time.monotonic() - worker.started_at < startup_grace:
+                continue  # chargement du modèle en cours
+            elif worker.healthy(health_timeout):
+                worker.health_failures = 0
+                continue
+            else:
+                worker.health_failures += 1
+                print(f"⚠️ Worker {worker.index}: /health sans réponse ({worker.health_failures}/{max_health_failures})")
+                if worker.health_failures < max_health_failures:
+                    continue
+                print(f"🔁 Worker {worker.index} bloqué, redémarrage")
+                worker.stop()
+            worker.restarts += 1
+            worker.start()
+
+    print("\nArrêt des workers...")
+    for worker in workers:
+        worker.stop()
+    print("✅ Cluster Llama arrêté proprement")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Lance plusieurs serveurs Llama épinglés sur des cœurs CPU")
+    parser.add_argument("--workers", type=int, default=int(os.getenv("LLAMA_WORKERS", "2")))
+    parser.add_argument("--threads", type=int, default=int(os.getenv("LLAMA_THREADS", "0")) or None,
+                        help="threads par worker (défaut : CPU disponibles / workers)")
+    parser.add_argument("--base-port", type=int, default=int(os.getenv("LLAMA_BASE_PORT", "8100")),
+                        help="port du 1er worker (8000/8001 restent au serveur seul et à Django)")
+    parser.add_argument("--no-pin", action="store_true", help="ne pas épingler les workers sur des cœurs")
+    parser.add_argument("--interval", type=float, default=5, help="période de surveillance (s)")
+    parser.add_argument("--startup-grace", type=float, default=120, help="délai de chargement du modèle (s)")
+    parser.add_argument("--max-health-failures", type=int, default=3)
+    parser.add_argument("--health-timeout", type=float, default=5)
+    args = parser.parse_args()
+
+    pin = not args.no_pin and hasattr(os, "sched_setaffinity")
+    workers = plan_workers(args.workers, args.threads, args.base_port, pin)
+    supervise(workers, args.interval, args.startup_grace, args.max_health_failures, args.health_timeout)
+
+
+if __name__ == "__main__":
+    main()
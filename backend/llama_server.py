@@ -6,123 +6,115 @@ import io
 # Fix encodage Windows pour les emojis
 sys.stdout = io.TextIOWrapper(sys.stdout.buffer, encoding='utf-8')
 
-from flask import Flask, request, jsonify
+from flask import Flask, request, jsonify, Response, stream_with_context
 from flask_cors import CORS  # ✅ Décommente cette ligne
 from gpt4all import GPT4All
 import json
+import os
 import re
 
+from inference import InferenceWorker, QueueFullError, InferenceTimeoutError, StopSequences, config_from_env
+from kv_cache import PromptStateCache, max_bytes_from_env
+from conversation_store import store_from_env
+from prompt_builder import PromptBuilder, TokenCounter, budget_from_env
+from structured import (
+    INTENT_MAX_TOKENS, INTENT_PROMPT_PREFIX, JsonObjectStop, build_intent_prompt, intent_text, parse_intent,
+)
+from preferences import extract_preferences
+
 app = Flask(__name__)
 CORS(app)  # ✅ Active CORS pour autoriser les requêtes depuis React
 
+# Paramètres du processus (fixés par llama_cluster.py en mode multi-processus)
+PORT = int(os.getenv("LLAMA_PORT", "8000"))
+N_THREADS = int(os.getenv("LLAMA_THREADS", "0")) or None  # None : choix de gpt4all
+
+def parse_cpu_list(spec):
+    """ "0-3,8" -> {0, 1, 2, 3, 8} """
+    cpus = set()
+    for part in spec.split(","):
+        part = part.strip()
+        if "-" in part:
+            first, last = part.split("-")
+            cpus.update(range(int(first), int(last) + 1))
+        elif part:
+            cpus.add(int(part))
+    return cpus
+
+# Épinglage CPU avant le chargement : les threads de llama.cpp en héritent
+if os.getenv("LLAMA_CPUS") and hasattr(os, "sched_setaffinity"):
+    os.sched_setaffinity(0, parse_cpu_list(os.getenv("LLAMA_CPUS")))
+    print(f"Processus epingle sur les CPU {os.getenv('LLAMA_CPUS')}")
+
 # Chargement du modèle
 print("Chargement du modèle Llama...")
 try:
-    model = GPT4All("Llama-3.2-1B-Instruct-Q4_0.gguf")
+    model = GPT4All("Llama-3.2-1B-Instruct-Q4_0.gguf", n_threads=N_THREADS)
     print("Modèle Llama charge!")
 except Exception as e:
     print(f"Erreur chargement modèle: {e}")
     model = None
 
-# Historique des conversations (en mémoire)
-conversation_history = {}
-
-def extract_preferences(message):
-    """Extrait les préférences utilisateur du message"""
-    preferences = {
-        "budget": None,
-        "interests": [],
-        "destination": None
-    }
-    
-    message_lower = message.lower()
-    
-    # Extraction du budget
-    budget_keywords = {
-        "pas cher": "economique",
-        "economique": "economique",
-        "petit budget": "economique",
-        "luxe": "luxe",
-        "premium": "luxe",
-        "moyen": "moyen",
-        "standard": "moyen"
-    }
-    for keyword, budget_type in budget_keywords.items():
-        if keyword in message_lower:
-            preferences["budget"] = budget_type
-            break
-    
-    # Extraction des intérêts
-    interests_keywords = {
-        "plage": "plage",
-        "mer": "plage",
-        "culture": "culture",
-        "musee": "culture",
-        "histoire": "culture",
-        "nature": "nature",
-        "randonnee": "nature",
-        "montagne": "nature",
-        "aventure": "aventure",
-        "sport": "aventure"
-    }
-    for keyword, interest in interests_keywords.items():
-        if keyword in message_lower:
-            if interest not in preferences["interests"]:
-                preferences["interests"].append(interest)
-    
-    # Extraction de destination
-    destinations = ["paris", "rome", "london", "barcelone", "new york", "tokyo", "dubai", "marrakech", "istanbul", "tunis"]
-    for dest in destinations:
-        if dest in message_lower:
-            preferences["destination"] = dest.capitalize()
-            break
-    
-    return preferences
+# Préambule système fixe : son état est calculé une fois puis réutilisé (cache KV)
+SYSTEM_PREAMBLE = (
+    "Tu es un assistant de voyage amical et expert.\n"
+    "Regles:\n"
+    "- Reponds de maniere conversationnelle et naturelle\n"
+    "- Pose des questions pour mieux comprendre les besoins\n"
+    "- Sois enthousiaste et utile\n"
+    "- Garde tes reponses courtes (2-3 phrases max)\n\n"
+)
+
+# Worker d'inférence : seul propriétaire du modèle, alimenté par une file bornée
+worker = None
+if model is not None:
+    state_cache = PromptStateCache(model, max_bytes=max_bytes_from_env())
+    state_cache.register_prefix(SYSTEM_PREAMBLE)
+    state_cache.register_prefix(INTENT_PROMPT_PREFIX)
+    worker = InferenceWorker(model, state_cache=state_cache, **config_from_env()).start()
+
+# Historique des conversations (LRU + TTL en mémoire, ou SQLite partagé entre workers)
+conversation_store = store_from_env()
+
+# Prompt sous budget de tokens (historique ancien replié dans un résumé)
+prompt_builder = PromptBuilder(SYSTEM_PREAMBLE, TokenCounter(), **budget_from_env())
 
 def build_smart_prompt(user_message, user_id):
-    """Construit un prompt intelligent avec contexte"""
-    
-    # Récupérer l'historique
-    history = conversation_history.get(user_id, [])
-    
-    # Extraire les préférences
+    """Construit un prompt intelligent avec contexte (retourne prompt, préférences, infos tokens)"""
+    history = conversation_store.history(user_id)
     prefs = extract_preferences(user_message)
-    
-    # Construire le contexte
-    context = "Tu es un assistant de voyage amical et expert.\n"
-    context += "Regles:\n"
-    context += "- Reponds de maniere conversationnelle et naturelle\n"
-    context += "- Pose des questions pour mieux comprendre les besoins\n"
-    context += "- Sois enthousiaste et utile\n"
-    context += "- Garde tes reponses courtes (2-3 phrases max)\n\n"
-    
-    # Ajouter l'historique récent (3 derniers messages)
-    if history:
-        context += "Historique recent:\n"
-        for msg in history[-3:]:
-            context += f"- {msg['role']}: {msg['content']}\n"
-        context += "\n"
-    
-    # Ajouter les préférences détectées
-    if prefs["budget"] or prefs["interests"] or prefs["destination"]:
-        context += "Preferences detectees:\n"
-        if prefs["budget"]:
-            context += f"- Budget: {prefs['budget']}\n"
-        if prefs["interests"]:
-            context += f"- Interets: {', '.join(prefs['interests'])}\n"
-        if prefs["destination"]:
-            context += f"- Destination: {prefs['destination']}\n"
-        context += "\n"
-    
-    # Message actuel
-    context += f"Utilisateur: {user_message}\nAssistant:"
-    
-    return context, prefs
+    prompt, info = prompt_builder.build(user_id, user_message, history, prefs)
+    return prompt, prefs, info
+
+def token_usage(prompt, usage, info):
+    """Tokens du prompt et de la réponse ; recalibre l'estimation avec le compte mesuré"""
+    usage = dict(usage or {})
+    if usage.get("prompt_tokens"):
+        prompt_builder.counter.observe(prompt, usage["prompt_tokens"])
+    usage.update(info)
+    return usage
+
+def remember_exchange(user_id, user_message, ai_response):
+    """Ajoute un échange à l'historique de la conversation"""
+    conversation_store.append_exchange(user_id, user_message, ai_response)
+
+SSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+def sse_event(event, data):
+    """Formate un évènement Server-Sent Events"""
+    return f"event: {event}\ndata: {json.dumps(data, ensure_ascii=False)}\n\n"
+
+def overloaded_response(message, status, retry_after):
+    """Réponse 429/503 avec en-tête Retry-After"""
+    response = jsonify({"error": message, "retry_after": retry_after})
+    response.status_code = status
+    response.headers["Retry-After"] = str(retry_after)
+    return response
 
 @app.route('/api/chat/', methods=['POST'])
 def chat():
     """Route principale du chat avec extraction intelligente"""
-    if model is None:
+    if worker is None:
         return jsonify({"error": "Modele non charge"}), 500
     
     try:
@@ -133,50 +125,208 @@ def chat():
         print(f"Message recu (user {user_id}): {user_message}")
         
         # Construire le prompt intelligent
-        prompt, preferences = build_smart_prompt(user_message, user_id)
+        prompt, preferences, prompt_info = build_smart_prompt(user_message, user_id)
         
-        print("Prompt construit")
+        print(f"Prompt construit (~{prompt_info['prompt_tokens_estimate']} tokens)")
         
-        # Générer la réponse
-        ai_response = model.generate(prompt, max_tokens=150, temp=0.7)
-        ai_response = ai_response.strip()
+        # Générer la réponse (via la file du worker d'inférence)
+        ai_response, usage = worker.generate(
+            prompt, max_tokens=150, temp=0.7,
+            session_id=user_id, cache_prefix=data.get('cache_prefix'), with_usage=True
+        )
         
         print(f"Reponse IA: {ai_response}")
         
         # Mettre à jour l'historique
-        if user_id not in conversation_history:
-            conversation_history[user_id] = []
-        
-        conversation_history[user_id].append({
-            "role": "Utilisateur",
-            "content": user_message
-        })
-        conversation_history[user_id].append({
-            "role": "Assistant",
-            "content": ai_response
-        })
-        
-        # Limiter l'historique à 10 messages
-        if len(conversation_history[user_id]) > 10:
-            conversation_history[user_id] = conversation_history[user_id][-10:]
+        remember_exchange(user_id, user_message, ai_response)
         
         return jsonify({
             "ai_response": ai_response,
             "annonces": [],
-            "detected_preferences": preferences
+            "detected_preferences": preferences,
+            "usage": token_usage(prompt, usage, prompt_info)
         })
         
+    except QueueFullError as e:
+        print(f"File d'inference pleine, retry dans {e.retry_after}s")
+        return overloaded_response("Serveur surcharge, reessayez plus tard", 429, e.retry_after)
+    except InferenceTimeoutError as e:
+        print(f"Delai d'inference depasse, retry dans {e.retry_after}s")
+        return overloaded_response("Delai de generation depasse", 503, e.retry_after)
     except Exception as e:
         print(f"Erreur: {e}")
         return jsonify({"error": str(e)}), 500
 
+@app.route('/api/chat/stream/', methods=['POST'])
+def chat_stream():
+    """Variante streaming du chat : les tokens sont émis en Server-Sent Events"""
+    if worker is None:
+        return jsonify({"error": "Modele non charge"}), 500
+    
+    data = request.get_json()
+    user_message = data.get('message', '')
+    user_id = data.get('user_id', 1)
+    
+    print(f"Message stream recu (user {user_id}): {user_message}")
+    
+    # La mise en file se fait avant la réponse pour pouvoir renvoyer 429
+    try:
+        prompt, preferences, prompt_info = build_smart_prompt(user_message, user_id)
+        tokens = worker.stream(
+            prompt, max_tokens=150, temp=0.7,
+            session_id=user_id, cache_prefix=data.get('cache_prefix')
+        )
+    except QueueFullError as e:
+        return overloaded_response("Serveur surcharge, reessayez plus tard", 429, e.retry_after)
+    except Exception as e:
+        # Le client attend un flux SSE : l'erreur est un évènement, pas un 500 brut
+        print(f"Erreur stream: {e}")
+        return Response(sse_event("error", {"error": str(e)}), mimetype="text/event-stream", headers=SSE_HEADERS)
+    
+    def generate_events():
+        yield sse_event("meta", {"annonces": [], "detected_preferences": preferences})
+        parts = []
+        try:
+            for token in tokens:
+                parts.append(token)
+                yield sse_event("token", {"text": token})
+        except Exception as e:
+            print(f"Erreur stream: {e}")
+            yield sse_event("error", {"error": str(e)})
+            return
+        finally:
+            # Client déconnecté ou fin normale : libérer le worker
+            tokens.close()
+        
+        ai_response = "".join(parts).strip()
+        remember_exchange(user_id, user_message, ai_response)
+        yield sse_event("done", {
+            "ai_response": ai_response,
+            "usage": token_usage(prompt, tokens.job.usage, prompt_info)
+        })
+    
+    return Response(
+        stream_with_context(generate_events()),
+        mimetype="text/event-stream",
+        headers=SSE_HEADERS
+    )
+
+# Borne haute des paramètres de /v1/complete
+COMPLETE_MAX_TOKENS = int(os.getenv("LLAMA_COMPLETE_MAX_TOKENS", "512"))
+
+@app.route('/v1/complete', methods=['POST'])
+def complete():
+    """
+    Complétion brute pour les appels serveur à serveur (Django) : le prompt
+    est envoyé tel quel, sans historique, préambule ni préférences, et rien
+    n'est mémorisé. Corps : prompt, max_tokens, temperature, stop (liste),
+    cache_prefix, stream (SSE si vrai).
+    """
+    if worker is None:
+        return jsonify({"error": "Modele non charge"}), 500
+    
+    data = request.get_json() or {}
+    prompt = data.get('prompt') or ''
+    if not prompt:
+        return jsonify({"error": "Prompt vide"}), 400
+    try:
+        max_tokens = max(1, min(int(data.get('max_tokens', 150)), COMPLETE_MAX_TOKENS))
+        temp = float(data.get('temperature', 0.7))
+    except (TypeError, ValueError):
+        return jsonify({"error": "max_tokens / temperature invalides"}), 400
+    stop = StopSequences(data.get('stop') or []) if data.get('stop') else None
+    params = dict(max_tokens=max_tokens, temp=temp, cache_prefix=data.get('cache_prefix'), stop=stop)
+    
+    if data.get('stream'):
+        try:
+            tokens = worker.stream(prompt, **params)
+        except QueueFullError as e:
+            return overloaded_response("Serveur surcharge, reessayez plus tard", 429, e.retry_after)
+        
+        def generate_events():
+            parts = []
+            try:
+                for token in tokens:
+                    parts.append(token)
+                    yield sse_event("token", {"text": token})
+            except Exception as e:
+                yield sse_event("error", {"error": str(e)})
+                return
+            finally:
+                tokens.close()
+            text = "".join(parts)
+            yield sse_event("done", {
+                "text": (stop.trim(text) if stop else text).strip(),
+                "usage": tokens.job.usage
+            })
+        
+        return Response(
+            stream_with_context(generate_events()),
+            mimetype="text/event-stream",
+            headers=SSE_HEADERS
+        )
+    
+    try:
+        text, usage = worker.generate(prompt, with_usage=True, **params)
+    except QueueFullError as e:
+        return overloaded_response("Serveur surcharge, reessayez plus tard", 429, e.retry_after)
+    except InferenceTimeoutError as e:
+        return overloaded_response("Delai de generation depasse", 503, e.retry_after)
+    except Exception as e:
+        print(f"Erreur completion: {e}")
+        return jsonify({"error": str(e)}), 500
+    
+    if stop:
+        text = stop.trim(text).strip()
+    return jsonify({
+        "text": text,
+        "finish_reason": "length" if usage["completion_tokens"] >= max_tokens else "stop",
+        "usage": usage
+    })
+
+@app.route('/api/intent/', methods=['POST'])
+def intent():
+    """
+    Extraction d'intention en JSON : sans historique ni persona, arrêt dès
+    que l'objet JSON est complet, réponse ramenée au schéma.
+    """
+    if worker is None:
+        return jsonify({"error": "Modele non charge"}), 500
+    
+    data = request.get_json() or {}
+    user_message = data.get('message', '')
+    prompt = build_intent_prompt(user_message)
+    
+    try:
+        generated, usage = worker.generate(
+            prompt, max_tokens=INTENT_MAX_TOKENS, temp=0.1,
+            cache_prefix=INTENT_PROMPT_PREFIX, with_usage=True, stop=JsonObjectStop
+        )
+    except QueueFullError as e:
+        return overloaded_response("Serveur surcharge, reessayez plus tard", 429, e.retry_after)
+    except InferenceTimeoutError as e:
+        return overloaded_response("Delai de generation depasse", 503, e.retry_after)
+    except Exception as e:
+        print(f"Erreur intention: {e}")
+        return jsonify({"error": str(e)}), 500
+    
+    return jsonify({
+        "intent": parse_intent(generated),
+        "raw": intent_text(generated),
+        "usage": usage
+    })
+
 @app.route('/health', methods=['GET'])
 def health():
     """Vérification santé du serveur"""
     return jsonify({
         "status": "healthy",
+        "pid": os.getpid(),
+        "port": PORT,
         "model_loaded": model is not None,
-        "active_conversations": len(conversation_history)
+        "active_conversations": conversation_store.stats(),
+        "inference": worker.stats() if worker is not None else None,
+        "prompt_builder": prompt_builder.stats()
     })
 
 @app.route('/reset', methods=['POST'])
@@ -185,21 +335,28 @@ def reset_conversation():
     data = request.get_json()
     user_id = data.get('user_id', 1)
     
-    if user_id in conversation_history:
-        del conversation_history[user_id]
+    conversation_store.reset(user_id)
+    prompt_builder.forget(user_id)
     
     return jsonify({"status": "reset", "user_id": user_id})
 
 if __name__ == '__main__':
-    print("Serveur Llama demarre sur http://0.0.0.0:8000")
+    print(f"Serveur Llama demarre sur http://0.0.0.0:{PORT}")
     print("Endpoints disponibles:")
     print("   - POST /api/chat/ : Chat principal")
+    print("   - POST /api/chat/stream/ : Chat en streaming (SSE)")
+    print("   - POST /api/intent/ : Intention de voyage (JSON)")
+    print("   - POST /v1/complete : Completion brute (appels internes, sans historique)")
     print("   - GET /health : Verification sante")
     print("   - POST /reset : Reinitialiser conversation")
     print("\n⚠️  Appuyez sur Ctrl+C pour arreter le serveur\n")
     
     try:
-        app.run(port=8000, host='0.0.0.0', debug=True)
+        # Pas de reloader : il relancerait le processus et chargerait le modèle deux fois
+        app.run(
+            port=PORT, host='0.0.0.0', threaded=True,
+            debug=os.getenv("LLAMA_DEBUG", "0") == "1", use_reloader=False
+        )
     except KeyboardInterrupt:
         print("\n✅ Serveur Llama arrete proprement")
         # Nettoyage si nécessaire
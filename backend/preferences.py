@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+"""
+Extraction légère des préférences par mots-clés.
+Partagé entre le serveur Llama (Flask) et l'API Django, sans charger le modèle.
+"""
+from gazetteer import DEFAULT_GAZETTEER
+
+def extract_preferences(message, gazetteer=DEFAULT_GAZETTEER):
+    """Extrait les préférences utilisateur du message (un seul passage sur le texte)"""
+    matches = gazetteer.find(message)
+    
+    preferences = {
+        "budget": None,
+        "interests": [],
+        "destination": None
+    }
+    
+    for match in matches:
+        if match.category == "budget" and preferences["budget"] is None:
+            preferences["budget"] = match.value
+        elif match.category == "interest" and match.value not in preferences["interests"]:
+            preferences["interests"].append(match.value)
+        elif match.category == "destination" and preferences["destination"] is None:
+            preferences["destination"] = match.value
+    
+    return preferences
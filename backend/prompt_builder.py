@@ -0,0 +1,225 @@
+# -*- coding: utf-8 -*-
+"""
+Construction des prompts de chat sous un budget de tokens.
+
+Le temps d'évaluation du prompt est proportionnel à sa longueur : le prompt
+(préambule + résumé + historique récent + préférences + message) ne doit pas
+dépasser LLAMA_PROMPT_BUDGET tokens. Les tours les plus récents sont gardés
+tels quels ; ceux qui ne tiennent plus sont repliés dans un résumé glissant
+par utilisateur (mis en cache, étendu au fil de la conversation) au lieu
+d'être simplement oubliés.
+
+Les bindings gpt4all n'exposent pas le tokenizer : TokenCounter estime le
+nombre de tokens à partir d'un ratio caractères/token, recalibré sur les
+comptes réels mesurés par le worker (n_past du contexte llama.cpp).
+"""
+import math
+import os
+import re
+from collections import OrderedDict, deque
+
+from preferences import extract_preferences
+
+
+class TokenCounter:
+    EWMA_ALPHA = 0.1
+
+    def __init__(self, chars_per_token=3.2):
+        self.chars_per_token = chars_per_token
+        self.samples = 0
+
+    def count(self, text):
+        if not text:
+            return 0
+        return max(1, math.ceil(len(text) / self.chars_per_token))
+
+    def observe(self, text, n_tokens):
+        """Recalibre le ratio avec un compte réel (tokens du prompt évalué)"""
+        if not text or not n_tokens or n_tokens <= 0:
+            return
+        ratio = len(text) / n_tokens
+        if self.samples == 0:
+            self.chars_per_token = ratio
+        else:
+            self.chars_per_token += self.EWMA_ALPHA * (ratio - self.chars_per_token)
+        self.samples += 1
+
+    def stats(self):
+        return {"chars_per_token": round(self.chars_per_token, 3), "calibration_samples": self.samples}
+
+
+class RollingSummary:
+    """
+    Résumé extractif des tours repliés : destinations, budget et intérêts
+    évoqués + l'essentiel des dernières demandes de l'utilisateur.
+    """
+    MAX_REQUESTS = 4
+    REQUEST_CHARS = 80
+
+    def __init__(self):
+        self.destinations = []
+        self.budget = None
+        self.interests = []
+        self.requests = deque(maxlen=self.MAX_REQUESTS)
+        self.last_folded = None
+        self.folded = 0
+
+    def fold(self, messages):
+        for message in messages:
+            if message["role"] == "Utilisateur":
+                prefs = extract_preferences(message["content"])
+                if prefs["destination"] and prefs["destination"] not in self.destinations:
+                    self.destinations.append(prefs["destination"])
+                self.budget = prefs["budget"] or self.budget
+                for interest in prefs["interests"]:
+                    if interest not in self.interests:
+                        self.interests.append(interest)
+                self.requests.append(self._gist(message["content"]))
+            self.last_folded = (message["role"], message["content"])
+            self.folded += 1
+
+    def _gist(self, text):
+        sentence = re.split(r"(?<=[.!?])\s", text.strip(), maxsplit=1)[0]
+        if len(sentence) > self.REQUEST_CHARS:
+            sentence = sentence[:self.REQUEST_CHARS].rsplit(" ", 1)[0] + "..."
+        return sentence
+
+    def render(self, counter, max_tokens):
+        """Texte du résumé, en retirant les demandes les plus anciennes si trop long"""
+        facts = []
+        if self.destinations:
+            facts.append(f"- Destinations evoquees: {', '.join(self.destinations)}\n")
+        if self.budget:
+            facts.append(f"- Budget: {self.budget}\n")
+        if self.interests:
+            facts.append(f"- Interets: {', '.join(self.interests)}\n")
+        requests = list(self.requests)
+        while True:
+            parts = ["Resume de la conversation:\n"] + facts
+            parts += [f"- Demande precedente: {request}\n" for request in requests]
+            text = "".join(parts) + "\n"
+            if not requests or counter.count(text) <= max_tokens:
+                return text
+            requests.pop(0)
+
+
+class PromptBuilder:
+    """
+    Args:
+        preamble: préambule système (préfixe fixe, voir kv_cache.py)
+        counter: TokenCounter
+        budget: tokens max du prompt
+        summary_budget: tokens max réservés au résumé
+        max_summaries: résumés gardés en cache (LRU par utilisateur)
+    """
+
+    def __init__(self, preamble, counter, budget=512, summary_budget=96, max_summaries=10000):
+        self.preamble = preamble
+        self.counter = counter
+        self.budget = budget
+        self.summary_budget = summary_budget
+        self.max_summaries = max_summaries
+        self._summaries = OrderedDict()
+
+    def build(self, user_id, user_message, history, prefs):
+        """
+        Returns:
+            (prompt, info) ; info contient l'estimation de tokens et le
+            nombre de messages gardés / résumés
+        """
+        prefs_section = self._prefs_section(prefs)
+        message_section = f"Utilisateur: {user_message}\nAssistant:"
+        fixed = self.counter.count(self.preamble) + self.counter.count(prefs_section) + self.counter.count(message_section)
+        available = self.budget - fixed
+
+        lines = [f"- {msg['role']}: {msg['content']}\n" for msg in history]
+        sizes = [self.counter.count(line) for line in lines]
+        header = "Historique recent:\n"
+
+        summary_text = ""
+        keep = self._fitting_suffix(sizes, available - self.counter.count(header))
+        if keep < len(history):
+            # Tout ne tient pas : place réservée au résumé des tours plus anciens
+            keep = self._fitting_suffix(sizes, available - self.counter.count(header) - self.summary_budget)
+            summary = self._summary_for(user_id, history[:len(history) - keep])
+            summary_text = summary.render(self.counter, self.summary_budget)
+
+        parts = [self.preamble, summary_text]
+        if keep:
+            parts.append(header)
+            parts.extend(lines[len(lines) - keep:])
+            parts.append("\n")
+        parts.append(prefs_section)
+        parts.append(message_section)
+        prompt = "".join(parts)
+
+        return prompt, {
+            "prompt_tokens_estimate": self.counter.count(prompt),
+            "budget": self.budget,
+            "history_messages": keep,
+            "summarized_messages": len(history) - keep,
+        }
+
+    @staticmethod
+    def _fitting_suffix(sizes, available):
+        """Nombre de messages les plus récents qui tiennent dans available tokens"""
+        total = 0
+        keep = 0
+        for size in reversed(sizes):
+            if total + size > available:
+                break
+            total += size
+            keep += 1
+        return keep
+
+    def _summary_for(self, user_id, older):
+        """Résumé glissant de l'utilisateur, étendu aux messages pas encore repliés"""
+        key = str(user_id)
+        summary = self._summaries.get(key)
+        if summary is None:
+            summary = self._summaries[key] = RollingSummary()
+        self._summaries.move_to_end(key)
+        while len(self._summaries) > self.max_summaries:
+            self._summaries.popitem(last=False)
+
+        start = 0
+        if summary.last_folded is not None:
+            for index in range(len(older) - 1, -1, -1):
+                if (older[index]["role"], older[index]["content"]) == summary.last_folded:
+                    start = index + 1
+                    break
+        summary.fold(older[start:])
+        return summary
+
+    @staticmethod
+    def _prefs_section(prefs):
+        if not (prefs["budget"] or prefs["interests"] or prefs["destination"]):
+            return ""
+        parts = ["Preferences detectees:\n"]
+        if prefs["budget"]:
+            parts.append(f"- Budget: {prefs['budget']}\n")
+        if prefs["interests"]:
+            parts.append(f"- Interets: {', '.join(prefs['interests'])}\n")
+        if prefs["destination"]:
+            parts.append(f"- Destination: {prefs['destination']}\n")
+        parts.append("\n")
+        return "".join(parts)
+
+    def forget(self, user_id):
+        self._summaries.pop(str(user_id), None)
+
+    def stats(self):
+        return {
+            "budget": self.budget,
+            "summary_budget": self.summary_budget,
+            "summaries": len(self._summaries),
+            **self.counter.stats(),
+        }
+
+
+def budget_from_env():
+    """Budget du prompt (LLAMA_PROMPT_BUDGET) et part réservée au résumé (LLAMA_SUMMARY_BUDGET)"""
+    return {
+        "budget": int(os.getenv("LLAMA_PROMPT_BUDGET", "512")),
+        "summary_budget": int(os.getenv("LLAMA_SUMMARY_BUDGET", "96")),
+    }
@@ -5,6 +5,30 @@ import requests
 from bs4 import BeautifulSoup
 import random
 
+# Fourchettes de prix par nuit selon le budget
+PRICE_RANGES = {
+    "economique": (50, 150),
+    "moyen": (150, 300),
+    "luxe": (300, 800)
+}
+
+def budget_band(budget):
+    """
+    Tranche de budget (economique/moyen/luxe) pour un budget par nuit en DT,
+    ou le nom de tranche lui-même.
+    """
+    if budget in PRICE_RANGES:
+        return budget
+    try:
+        budget = float(budget)
+    except (TypeError, ValueError):
+        return "moyen"
+    if budget < PRICE_RANGES["moyen"][0]:
+        return "economique"
+    if budget < PRICE_RANGES["luxe"][0]:
+        return "moyen"
+    return "luxe"
+
 def scrape_offers(preferences):
     """
     Scrappe des offres selon les préférences
@@ -28,13 +52,7 @@ def scrape_offers(preferences):
     budget = preferences.get("budget", "moyen")
     
     # Prix selon budget
-    price_ranges = {
-        "economique": (50, 150),
-        "moyen": (150, 300),
-        "luxe": (300, 800)
-    }
-    
-    min_price, max_price = price_ranges.get(budget, (100, 250))
+    min_price, max_price = PRICE_RANGES.get(budget, (100, 250))
     
     # Générer 3-5 offres fictives
     for i in range(random.randint(3, 5)):
@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+"""
+Génération structurée (JSON) pour l'extraction d'intention de voyage.
+
+Sans historique ni persona : le prompt est le schéma + le message, et la
+réponse est pré-remplie avec "{" pour que le modèle écrive directement
+l'objet. La génération s'arrête dès que l'accolade ouvrante est refermée
+(JsonObjectStop), puis l'objet est ramené au schéma (clés connues, types
+convertis). gpt4all n'expose pas de décodage guidé par grammaire : le
+pré-remplissage + l'arrêt anticipé + la coercition en tiennent lieu.
+"""
+import json
+import os
+import re
+
+INTENT_PROMPT_PREFIX = (
+    "Tu es un assistant d'analyse d'intention de voyage. "
+    "Ton rôle est d'extraire les préférences STRICTEMENT au format JSON. "
+    "Ne dis RIEN d'autre que l'objet JSON unique, sans texte autour.\n\n"
+    "Format JSON requis:\n"
+    "{\n"
+    "  \"destination\": \"ville principale\" | null,\n"
+    "  \"budget\": nombre | null,\n"
+    "  \"type_hebergement\": \"hôtel/appartement/maison\" | null,\n"
+    "  \"duree\": nombre | null,\n"
+    "  \"personnes\": nombre | null,\n"
+    "  \"interets\": [\"plage\", \"culture\", \"nature\", \"ville\"] | []\n"
+    "}\n\n"
+)
+
+# Champ -> type attendu
+INTENT_SCHEMA = {
+    "destination": "string",
+    "budget": "number",
+    "type_hebergement": "string",
+    "duree": "number",
+    "personnes": "number",
+    "interets": "string_list",
+}
+
+# Un objet d'intention complet tient en ~60 tokens
+INTENT_MAX_TOKENS = int(os.getenv("LLAMA_INTENT_MAX_TOKENS", "96"))
+
+
+def build_intent_prompt(user_message):
+    # Le "{" final est le début de la réponse : le modèle complète l'objet
+    return INTENT_PROMPT_PREFIX + f"Message: \"{user_message}\"\n\nRéponse JSON:\n{{"
+
+
+class JsonObjectStop:
+    """
+    Suit l'équilibre des accolades (hors chaînes) sur les tokens générés.
+    Appelé avec chaque token, retourne True quand l'objet ouvert par le
+    "{" pré-rempli est refermé.
+    """
+
+    def __init__(self):
+        self.depth = 1
+        self.in_string = False
+        self.escaped = False
+
+    def __call__(self, token):
+        for char in token:
+            if self.in_string:
+                if self.escaped:
+                    self.escaped = False
+                elif char == "\\":
+                    self.escaped = True
+                elif char == '"':
+                    self.in_string = False
+            elif char == '"':
+                self.in_string = True
+            elif char in "{[":
+                self.depth += 1
+            elif char in "}]":
+                self.depth -= 1
+                if self.depth == 0:
+                    return True
+        return False
+
+
+def _balanced_object(text):
+    """Préfixe de text qui forme un objet JSON équilibré (None si incomplet)"""
+    stop = JsonObjectStop()
+    stop.depth = 0
+    for index, char in enumerate(text):
+        if index == 0:
+            if char != "{":
+                return None
+            stop.depth = 1
+            continue
+        if stop(char):
+            return text[:index + 1]
+    return None
+
+
+def _number(value):
+    if isinstance(value, bool):
+        return None
+    if isinstance(value, (int, float)):
+        return int(value)
+    if isinstance(value, str):
+        digits = re.search(r"\d+", value.replace(" ", ""))
+        return int(digits.group()) if digits else None
+    return None
+
+
+def coerce_intent(obj):
+    """Ramène un objet au schéma d'intention (clés inconnues ignorées)"""
+    intent = {}
+    for field, kind in INTENT_SCHEMA.items():
+        value = obj.get(field)
+        if kind == "number":
+            value = _number(value)
+        elif kind == "string":
+            value = value.strip() if isinstance(value, str) and value.strip() else None
+            if value is not None and value.lower() in ("null", "none", "ville principale"):
+                value = None
+        elif kind == "string_list":
+            if isinstance(value, str):
+                value = [value]
+            value = [v.strip().lower() for v in value if isinstance(v, str) and v.strip()] if isinstance(value, list) else []
+        intent[field] = value
+    return intent
+
+
+def intent_text(generated):
+    """Texte JSON effectivement analysé : "{" + génération jusqu'à l'accolade fermante (None si incomplet)"""
+    return _balanced_object("{" + generated.lstrip())
+
+
+def parse_intent(generated):
+    """
+    Objet d'intention à partir du texte généré après le "{" pré-rempli.
+    Retourne None si aucun objet JSON valide.
+    """
+    raw = intent_text(generated)
+    if raw is None:
+        return None
+    try:
+        obj = json.loads(raw)
+    except ValueError:
+        return None
+    return coerce_intent(obj) if isinstance(obj, dict) else None
@@ -0,0 +1,137 @@
+# -*- coding: utf-8 -*-
+"""Tests des historiques de conversation (conversation_store.py)"""
+import os
+import tempfile
+import unittest
+from unittest import mock
+
+from conversation_store import MemoryConversationStore, SQLiteConversationStore, _message_size
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+class MemoryConversationStoreTests(unittest.TestCase):
+    def setUp(self):
+        self.clock = FakeClock()
+        patch = mock.patch("conversation_store.time.monotonic", self.clock)
+        patch.start()
+        self.addCleanup(patch.stop)
+
+    def test_history_is_expanded_in_order(self):
+        store = MemoryConversationStore()
+        store.append_exchange(1, "bonjour", "salut")
+        store.append_exchange("1", "Sousse ?", "Oui")
+        self.assertEqual(store.history(1), [
+            {"role": "Utilisateur", "content": "bonjour"},
+            {"role": "Assistant", "content": "salut"},
+            {"role": "Utilisateur", "content": "Sousse ?"},
+            {"role": "Assistant", "content": "Oui"},
+        ])
+
+    def test_max_messages_drops_oldest(self):
+        store = MemoryConversationStore(max_messages=2)
+        store.append_exchange(1, "a", "b")
+        store.append_exchange(1, "c", "d")
+        self.assertEqual([m["content"] for m in store.history(1)], ["c", "d"])
+        self.assertEqual(store.stats()["bytes"], _message_size("c") + _message_size("d"))
+
+    def test_ttl_expiry(self):
+        store = MemoryConversationStore(ttl=60)
+        store.append_exchange(1, "a", "b")
+        self.clock.now += 61
+        self.assertEqual(store.history(1), [])
+        self.assertEqual(store.stats()["expirations"], 1)
+        self.assertEqual(store.stats()["bytes"], 0)
+
+    def test_expired_conversations_are_purged_on_write(self):
+        store = MemoryConversationStore(ttl=60)
+        store.append_exchange(1, "a", "b")
+        self.clock.now += 61
+        store.append_exchange(2, "c", "d")
+        stats = store.stats()
+        self.assertEqual((stats["conversations"], stats["expirations"], stats["evictions"]), (1, 1, 0))
+
+    def test_lru_evicts_least_recently_used(self):
+        store = MemoryConversationStore(max_users=2)
+        store.append_exchange(1, "a", "b")
+        store.append_exchange(2, "c", "d")
+        store.history(1)  # 1 redevient la plus récente
+        store.append_exchange(3, "e", "f")
+        self.assertEqual(store.history(2), [])
+        self.assertEqual(len(store.history(1)), 2)
+        self.assertEqual(len(store.history(3)), 2)
+        self.assertEqual(store.stats()["evictions"], 1)
+
+    def test_max_bytes_evicts_other_conversations(self):
+        exchange = _message_size("x" * 100) * 2
+        store = MemoryConversationStore(max_bytes=exchange * 2)
+        for user_id in (1, 2, 3):
+            store.append_exchange(user_id, "x" * 100, "x" * 100)
+        self.assertEqual(store.history(1), [])
+        self.assertEqual(store.stats()["bytes"], exchange * 2)
+
+    def test_oversized_conversation_is_trimmed_not_evicted(self):
+        exchange = _message_size("x" * 100) * 2
+        store = MemoryConversationStore(max_messages=10, max_bytes=exchange + 10)
+        store.append_exchange(1, "x" * 100, "x" * 100)
+        store.append_exchange(1, "y" * 100, "y" * 100)
+        self.assertEqual([m["content"] for m in store.history(1)], ["y" * 100, "y" * 100])
+        stats = store.stats()
+        self.assertEqual((stats["bytes"], stats["evictions"]), (exchange, 0))
+
+    def test_last_exchange_kept_even_above_max_bytes(self):
+        store = MemoryConversationStore(max_bytes=100)
+        store.append_exchange(1, "a", "b")
+        store.append_exchange(2, "x" * 200, "y")
+        self.assertEqual(store.history(1), [])
+        self.assertEqual([m["content"] for m in store.history(2)], ["x" * 200, "y"])
+
+    def test_reset(self):
+        store = MemoryConversationStore()
+        store.append_exchange(1, "a", "b")
+        store.reset(1)
+        self.assertEqual(store.history(1), [])
+        self.assertEqual(store.stats()["bytes"], 0)
+
+
+class SQLiteConversationStoreTests(unittest.TestCase):
+    def setUp(self):
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.path = os.path.join(directory.name, "conversations.sqlite3")
+
+    def test_round_trip_between_instances(self):
+        writer = SQLiteConversationStore(self.path, max_messages=4)
+        writer.append_exchange(1, "bonjour", "salut")
+        writer.append_exchange(1, "Djerba ?", "Oui")
+        writer.append_exchange(1, "Prix ?", "200 dt")
+        # Autre instance sur le même fichier (autre worker)
+        reader = SQLiteConversationStore(self.path, max_messages=4)
+        self.assertEqual(reader.history("1"), [
+            {"role": "Utilisateur", "content": "Djerba ?"},
+            {"role": "Assistant", "content": "Oui"},
+            {"role": "Utilisateur", "content": "Prix ?"},
+            {"role": "Assistant", "content": "200 dt"},
+        ])
+        stats = reader.stats()
+        self.assertEqual((stats["conversations"], stats["messages"]), (1, 4))
+        reader.reset(1)
+        self.assertEqual(writer.history(1), [])
+
+    def test_ttl_expiry(self):
+        store = SQLiteConversationStore(self.path, ttl=60)
+        with mock.patch("conversation_store.time.time", return_value=1000.0):
+            store.append_exchange(1, "a", "b")
+        with mock.patch("conversation_store.time.time", return_value=1061.0):
+            self.assertEqual(store.history(1), [])
+            self.assertEqual(store.stats()["conversations"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
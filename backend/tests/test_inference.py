@@ -0,0 +1,119 @@
+# -*- coding: utf-8 -*-
+"""Tests du worker d'inférence (inference.py) avec un faux modèle"""
+import threading
+import unittest
+
+from inference import GenerationJob, InferenceWorker, QueueFullError, StopSequences
+
+
+class FakeModel:
+    """Remplace GPT4All : renvoie le prompt en majuscules, token par token"""
+
+    def __init__(self, tokens=None):
+        self.tokens = tokens
+        self.calls = []
+        self.release = threading.Event()
+        self.release.set()
+
+    def generate(self, prompt, max_tokens=150, temp=0.7, callback=None):
+        self.release.wait(5)
+        self.calls.append(prompt)
+        tokens = self.tokens or [c for c in prompt.upper()]
+        text = ""
+        for token in tokens[:max_tokens]:
+            text += token
+            if callback is not None and callback(0, token) is False:
+                break
+        return text
+
+
+class InferenceWorkerTests(unittest.TestCase):
+    def test_queue_full_raises_with_retry_after(self):
+        worker = InferenceWorker(FakeModel(), queue_depth=2)  # thread non démarré
+        worker.submit("a")
+        worker.submit("b")
+        with self.assertRaises(QueueFullError) as ctx:
+            worker.submit("c")
+        self.assertGreaterEqual(ctx.exception.retry_after, 1)
+        self.assertEqual(worker.stats()["rejected"], 1)
+
+    def test_generate_returns_text_and_usage(self):
+        worker = InferenceWorker(FakeModel(), max_wait_ms=0).start()
+        text, usage = worker.generate("abc", with_usage=True, timeout=5)
+        self.assertEqual(text, "ABC")
+        self.assertEqual(usage["completion_tokens"], 3)
+
+    def test_batch_deduplicates_identical_prompts(self):
+        model = FakeModel()
+        worker = InferenceWorker(model, max_batch_size=4, max_wait_ms=0)
+        # Jobs déposés avant le démarrage : un seul lot
+        futures = [worker.submit("same"), worker.submit("same"), worker.submit("other")]
+        worker.start()
+        self.assertEqual([f.result(timeout=5) for f in futures], ["SAME", "SAME", "OTHER"])
+        self.assertEqual(sorted(model.calls), ["other", "same"])
+        stats = worker.stats()
+        self.assertEqual(stats["batches"], 1)
+        self.assertEqual(stats["deduplicated"], 1)
+        self.assertEqual(stats["completed"], 3)
+
+    def test_batch_size_is_bounded(self):
+        worker = InferenceWorker(FakeModel(), max_batch_size=2, max_wait_ms=0)
+        futures = [worker.submit(str(i)) for i in range(5)]
+        worker.start()
+        for f in futures:
+            f.result(timeout=5)
+        self.assertEqual(worker.stats()["batches"], 3)
+
+    def test_cancelled_job_is_skipped(self):
+        model = FakeModel()
+        worker = InferenceWorker(model, max_wait_ms=0)
+        cancelled = worker.submit("gone")
+        kept = worker.submit("kept")
+        self.assertTrue(cancelled.cancel())
+        worker.start()
+        self.assertEqual(kept.result(timeout=5), "KEPT")
+        self.assertEqual(model.calls, ["kept"])
+
+
+    def test_jobs_of_different_sessions_are_not_merged(self):
+        model = FakeModel()
+        worker = InferenceWorker(model, max_wait_ms=0)
+        futures = [worker.submit("same", session_id="u1"), worker.submit("same", session_id="u2"),
+                   worker.submit("same", session_id="u1", cache_prefix="sys")]
+        worker.start()
+        for f in futures:
+            f.result(timeout=5)
+        self.assertEqual(len(model.calls), 3)
+        self.assertEqual(worker.stats()["deduplicated"], 0)
+
+
+class StopSequenceStreamingTests(unittest.TestCase):
+    def stream(self, tokens, stop):
+        worker = InferenceWorker(FakeModel(tokens), max_wait_ms=0).start()
+        return list(worker.stream("p", stop=StopSequences(stop)))
+
+    def test_stop_sequence_is_not_streamed(self):
+        tokens = ["Bonjour", " !", "\nUtil", "isateur:", " suite"]
+        chunks = self.stream(tokens, ["\nUtilisateur:"])
+        self.assertEqual("".join(chunks), "Bonjour !")
+
+    def test_partial_match_is_released_at_the_end(self):
+        tokens = ["Bonjour", "\nUti"]
+        chunks = self.stream(tokens, ["\nUtilisateur:"])
+        self.assertEqual("".join(chunks), "Bonjour\nUti")
+
+    def test_safe_length_holds_back_possible_prefix(self):
+        stop = StopSequences(["###"])
+        self.assertEqual(stop.safe_length("abc#"), 3)
+        self.assertEqual(stop.safe_length("abc##"), 3)
+        self.assertEqual(stop.safe_length("abc"), 3)
+
+    def test_key_includes_session_and_prefix(self):
+        a = GenerationJob("p", session_id="u1", cache_prefix="sys")
+        b = GenerationJob("p", session_id="u2", cache_prefix="sys")
+        self.assertNotEqual(a.key(), b.key())
+        self.assertEqual(a.key(), GenerationJob("p", session_id="u1", cache_prefix="sys").key())
+
+
+if __name__ == "__main__":
+    unittest.main()
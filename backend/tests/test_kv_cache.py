@@ -0,0 +1,66 @@
+# -*- coding: utf-8 -*-
+"""Tests du cache d'états du modèle (kv_cache.py) avec un faux adaptateur"""
+import unittest
+
+from kv_cache import PromptStateCache, StateSnapshot
+
+
+class FakeAdapter:
+    """Simule llmodel : un token par caractère évalué, réponse "ok" """
+    available = True
+
+    def __init__(self):
+        self.past = 0
+        self.evaluated = []
+
+    def n_past(self):
+        return self.past
+
+    def save(self, n_past):
+        return StateSnapshot(b"x" * 10, n_past)
+
+    def restore(self, snapshot):
+        self.past = snapshot.n_past
+        return True
+
+    def prompt(self, text, callback, max_tokens, temp, reset):
+        if reset:
+            self.past = 0
+        self.evaluated.append(text)
+        self.past += len(text)
+        for token in ["o", "k"][:max_tokens]:
+            self.past += 1
+            if callback(0, token) is False:
+                break
+
+
+class PromptStateCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.cache = PromptStateCache(model=None, max_bytes=1000)
+        self.cache.adapter = FakeAdapter()
+        self.cache.register_prefix("SYS\n")
+
+    def generate(self, prompt):
+        return self.cache.generate(prompt, 10, 0.7, lambda token_id, response: True)
+
+    def test_static_prefix_is_evaluated_once(self):
+        self.assertEqual(self.generate("SYS\nBonjour"), "ok")
+        self.assertEqual(self.generate("SYS\nSalut"), "ok")
+        self.assertEqual(self.cache.adapter.evaluated, ["SYS\n", "Bonjour", "Salut"])
+        self.assertEqual((self.cache.misses, self.cache.hits), (1, 1))
+        self.assertEqual(self.cache.last_usage["reused_prompt_tokens"], 4)
+        self.assertEqual(self.cache.last_usage["prompt_tokens"], len("SYS\nSalut"))
+
+    def test_chat_turns_do_not_add_states(self):
+        for turn in ("SYS\nUtilisateur: a", "SYS\nUtilisateur: b", "SYS\nUtilisateur: c"):
+            self.generate(turn)
+        self.assertEqual(self.cache.stats()["entries"], 1)
+
+    def test_prompt_without_prefix_starts_from_scratch(self):
+        self.generate("Autre prompt")
+        self.assertEqual(self.cache.adapter.evaluated, ["Autre prompt"])
+        self.assertEqual(self.cache.stats()["entries"], 0)
+
+
+if __name__ == "__main__":
+    unittest.main()
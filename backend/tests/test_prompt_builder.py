@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+"""Tests du budget de tokens des prompts de chat (prompt_builder.py)"""
+import unittest
+
+from prompt_builder import PromptBuilder, TokenCounter
+
+PREAMBLE = "Tu es un assistant de voyage.\n\n"
+NO_PREFS = {"budget": None, "interests": [], "destination": None}
+
+
+def history(turns):
+    messages = []
+    for i in range(turns):
+        messages.append({"role": "Utilisateur", "content": f"Je voudrais aller a Sousse, question numero {i}."})
+        messages.append({"role": "Assistant", "content": f"Bien sur, voici une reponse detaillee numero {i}."})
+    return messages
+
+
+class PromptBuilderTests(unittest.TestCase):
+    def builder(self, budget=200, summary_budget=40):
+        return PromptBuilder(PREAMBLE, TokenCounter(chars_per_token=4), budget=budget, summary_budget=summary_budget)
+
+    def test_short_history_is_kept_verbatim(self):
+        prompt, info = self.builder(budget=1000).build("u1", "Et a Tozeur ?", history(2), NO_PREFS)
+        self.assertTrue(prompt.startswith(PREAMBLE))
+        self.assertTrue(prompt.endswith("Utilisateur: Et a Tozeur ?\nAssistant:"))
+        self.assertEqual((info["history_messages"], info["summarized_messages"]), (4, 0))
+        self.assertNotIn("Resume de la conversation", prompt)
+
+    def test_long_history_is_summarized_within_budget(self):
+        builder = self.builder()
+        prompt, info = builder.build("u1", "Et a Tozeur ?", history(20), NO_PREFS)
+        self.assertLessEqual(info["prompt_tokens_estimate"], builder.budget)
+        self.assertGreater(info["summarized_messages"], 0)
+        self.assertEqual(info["history_messages"] + info["summarized_messages"], 40)
+        self.assertIn("Resume de la conversation", prompt)
+        self.assertIn("question numero 19", prompt)  # tour le plus récent gardé tel quel
+
+    def test_summary_is_extended_not_rebuilt(self):
+        builder = self.builder()
+        builder.build("u1", "a", history(20), NO_PREFS)
+        folded = builder._summaries["u1"].folded
+        builder.build("u1", "b", history(21), NO_PREFS)
+        self.assertEqual(builder._summaries["u1"].folded, folded + 2)
+
+    def test_counter_recalibrates_on_measured_tokens(self):
+        counter = TokenCounter(chars_per_token=3.2)
+        counter.observe("x" * 100, 20)
+        self.assertEqual(counter.chars_per_token, 5)
+        self.assertEqual(counter.count("x" * 50), 10)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,101 @@
+# -*- coding: utf-8 -*-
+"""Tests de la génération structurée (structured.py) : arrêt JSON et coercition"""
+import unittest
+
+from structured import JsonObjectStop, build_intent_prompt, coerce_intent, intent_text, parse_intent
+
+
+def stops_after(tokens):
+    """Index du token qui referme l'objet (None si jamais)"""
+    stop = JsonObjectStop()
+    for index, token in enumerate(tokens):
+        if stop(token):
+            return index
+    return None
+
+
+class JsonObjectStopTests(unittest.TestCase):
+    def test_prompt_ends_with_the_prefilled_brace(self):
+        self.assertTrue(build_intent_prompt("Sousse").endswith("Réponse JSON:\n{"))
+
+    def test_stops_on_closing_brace(self):
+        self.assertEqual(stops_after(['"budget"', ': 200', '}', ' merci']), 2)
+
+    def test_nested_objects_and_lists(self):
+        tokens = ['"a": {"b": {', '"c": [1, {"d": 2}]', '}', '}', ', "e": 1', '}', '\n']
+        self.assertEqual(stops_after(tokens), 5)
+
+    def test_braces_inside_strings_are_ignored(self):
+        tokens = ['"destination": "Sou}sse {', '", "note": "]]}}"', '}']
+        self.assertEqual(stops_after(tokens), 2)
+
+    def test_escaped_quote_keeps_the_string_open(self):
+        tokens = ['"destination": "il dit \\"}', '\\\\"', '}']
+        self.assertEqual(stops_after(tokens), 2)
+
+    def test_incomplete_object_never_stops(self):
+        self.assertIsNone(stops_after(['"destination": "Sousse"', ', "budget": {']))
+
+
+class ParseIntentTests(unittest.TestCase):
+    def test_parses_object_and_ignores_trailing_text(self):
+        generated = ' "destination": "Sousse", "budget": 200, "interets": ["Plage"]} Voilà !'
+        self.assertEqual(intent_text(generated), '{"destination": "Sousse", "budget": 200, "interets": ["Plage"]}')
+        intent = parse_intent(generated)
+        self.assertEqual(intent["destination"], "Sousse")
+        self.assertEqual(intent["budget"], 200)
+        self.assertEqual(intent["interets"], ["plage"])
+        self.assertIsNone(intent["duree"])
+
+    def test_braces_inside_strings(self):
+        intent = parse_intent('"destination": "Hammamet {centre}", "type_hebergement": "hôtel"}')
+        self.assertEqual(intent["destination"], "Hammamet {centre}")
+        self.assertEqual(intent["type_hebergement"], "hôtel")
+
+    def test_malformed_json_is_rejected(self):
+        for generated in (
+            '"destination": "Sousse", ',            # objet non refermé
+            '"destination": "Sousse",}',            # virgule finale
+            "'destination': 'Sousse'}",             # guillemets simples
+            '"destination": Sousse}',               # chaîne sans guillemets
+        ):
+            with self.subTest(generated=generated):
+                self.assertIsNone(parse_intent(generated))
+        self.assertIsNone(intent_text('"destination": "Sousse", '))
+
+    def test_non_object_is_rejected(self):
+        self.assertIsNone(parse_intent(""))
+        # "]" referme aussi l'objet pour l'arrêt, mais le JSON est invalide
+        self.assertIsNone(parse_intent("]"))
+
+
+class CoerceIntentTests(unittest.TestCase):
+    def test_values_are_coerced_to_the_schema(self):
+        intent = coerce_intent({
+            "destination": "  null ",
+            "budget": "1 500 dt",
+            "type_hebergement": "",
+            "duree": 3.7,
+            "personnes": True,
+            "interets": "Culture",
+            "inconnu": "ignoré",
+        })
+        self.assertEqual(intent, {
+            "destination": None,
+            "budget": 1500,
+            "type_hebergement": None,
+            "duree": 3,
+            "personnes": None,
+            "interets": ["culture"],
+        })
+
+    def test_wrong_types_fall_back_to_empty(self):
+        intent = coerce_intent({"destination": 42, "budget": [200], "interets": ["plage", 3, " ", None]})
+        self.assertIsNone(intent["destination"])
+        self.assertIsNone(intent["budget"])
+        self.assertEqual(intent["interets"], ["plage"])
+        self.assertEqual(coerce_intent({})["interets"], [])
+
+
+if __name__ == "__main__":
+    unittest.main()